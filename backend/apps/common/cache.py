@@ -0,0 +1,340 @@
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import BaseCache, DEFAULT_TIMEOUT
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.cache.backends.redis import RedisCache
+from .instrumentation import record_cache_access
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+class LocalLRU:
+    """Cache LRU in-process con scadenza, per le chiavi più richieste"""
+
+    def __init__(self, max_entries: int = 1000, timeout: float = 5):
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return _MISSING
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return _MISSING
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, timeout: Optional[float] = None):
+        # La copia locale non sopravvive mai alla chiave remota
+        ttl = self.timeout if timeout is None else min(self.timeout, timeout)
+        if ttl <= 0:
+            self.discard(key)
+            return
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def discard(self, key: str):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class TieredRedisCache(BaseCache):
+    """
+    Backend cache a due livelli: LRU locale davanti a Redis.
+
+    Redis usa il pool di connessioni di redis-py (OPTIONS come per RedisCache,
+    es. max_connections). Le opzioni specifiche di questo backend sono:
+    - LOCAL_MAX_ENTRIES: chiavi tenute nella LRU in-process (default 1000)
+    - LOCAL_TIMEOUT: durata massima della copia locale in secondi (default 5),
+      mai oltre la durata residua della chiave su Redis
+    - LOCAL_EXCLUDE_PREFIXES: prefissi delle chiavi lette sempre da Redis
+      (default: versioni dei modelli e disponibilità)
+    - FALLBACK_RETRY_SECONDS: se Redis non risponde si usa una cache locmem
+      e si riprova Redis dopo questo intervallo (default 30)
+
+    Gli incrementi (incr/decr) vanno sempre su Redis e non passano dalla LRU.
+    Le letture (get/get_many) contano hit e miss nel profilo della richiesta
+    corrente (InstrumentationMiddleware).
+    """
+
+    TIER_OPTIONS = ('LOCAL_MAX_ENTRIES', 'LOCAL_TIMEOUT', 'LOCAL_EXCLUDE_PREFIXES', 'FALLBACK_RETRY_SECONDS')
+
+    # Chiavi lette per invalidare altre chiavi: una copia locale nasconderebbe
+    # per LOCAL_TIMEOUT secondi le delete e gli incr fatti da altri processi
+    LOCAL_EXCLUDE_PREFIXES = ('model-version:', 'inventory:availability:')
+
+    def __init__(self, server, params):
+        super().__init__(params)
+        options = dict(params.get('OPTIONS', {}))
+        tier_options = {name: options.pop(name) for name in self.TIER_OPTIONS if name in options}
+
+        self._remote = RedisCache(server, {**params, 'OPTIONS': options})
+        self._fallback = LocMemCache(f'tiered-fallback-{id(self)}', params)
+        self._local = LocalLRU(
+            max_entries=int(tier_options.get('LOCAL_MAX_ENTRIES', 1000)),
+            timeout=float(tier_options.get('LOCAL_TIMEOUT', 5)),
+        )
+        self._exclude = tuple(tier_options.get('LOCAL_EXCLUDE_PREFIXES', self.LOCAL_EXCLUDE_PREFIXES))
+        self._retry_after = float(tier_options.get('FALLBACK_RETRY_SECONDS', 30))
+        self._down_until = 0.0
+
+    @property
+    def is_degraded(self) -> bool:
+        """True se Redis è considerato irraggiungibile e si usa il fallback"""
+        return time.monotonic() < self._down_until
+
+    def _mark_down(self, error: Exception):
+        logger.warning(f"Redis non disponibile ({error}), uso cache locale per {self._retry_after}s")
+        self._down_until = time.monotonic() + self._retry_after
+        self._local.clear()
+
+    def _call(self, method: str, *args, **kwargs):
+        """Esegue l'operazione su Redis, o sul fallback locmem se Redis è giù"""
+        from redis.exceptions import ConnectionError, TimeoutError
+
+        if not self.is_degraded:
+            try:
+                return getattr(self._remote, method)(*args, **kwargs)
+            except (ConnectionError, TimeoutError) as e:
+                self._mark_down(e)
+        return getattr(self._fallback, method)(*args, **kwargs)
+
+    def _fetch(self, keys: List[str], version=None) -> Dict[str, Tuple[Any, Optional[float]]]:
+        """
+        Valori e durata residua in secondi (None: senza scadenza) da Redis, in
+        un solo round trip (MGET e PTTL in pipeline). Dal fallback la durata è
+        0: nessuna copia locale di una cache già locale.
+        """
+        from redis.exceptions import ConnectionError, TimeoutError
+
+        if not self.is_degraded:
+            remote_keys = [self._remote.make_and_validate_key(key, version=version) for key in keys]
+            try:
+                pipeline = self._remote._cache.get_client().pipeline(transaction=False)
+                pipeline.mget(remote_keys)
+                for remote_key in remote_keys:
+                    pipeline.pttl(remote_key)
+                values, *ttls = pipeline.execute()
+            except (ConnectionError, TimeoutError) as e:
+                self._mark_down(e)
+            else:
+                loads = self._remote._cache._serializer.loads
+                return {
+                    key: (loads(value), ttl / 1000 if ttl >= 0 else None)
+                    for key, value, ttl in zip(keys, values, ttls)
+                    if value is not None
+                }
+        return {key: (value, 0) for key, value in self._fallback.get_many(keys, version=version).items()}
+
+    def _local_key(self, key, version=None) -> Optional[str]:
+        """Chiave della copia locale, None per le chiavi escluse dalla LRU"""
+        if key.startswith(self._exclude):
+            return None
+        return self.make_and_validate_key(key, version=version)
+
+    def _local_get(self, key, version=None) -> Any:
+        local_key = self._local_key(key, version)
+        return _MISSING if local_key is None else self._local.get(local_key)
+
+    def _local_set(self, key, value, timeout, version=None):
+        local_key = self._local_key(key, version)
+        if local_key is not None:
+            self._local.set(local_key, value, timeout)
+
+    def _local_discard(self, key, version=None):
+        local_key = self._local_key(key, version)
+        if local_key is not None:
+            self._local.discard(local_key)
+
+    def _local_timeout(self, timeout) -> Optional[float]:
+        return self.default_timeout if timeout is DEFAULT_TIMEOUT else timeout
+
+    def get(self, key, default=None, version=None):
+        found = self.get_many([key], version=version)
+        return found.get(key, default)
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        found = {}
+        missing = []
+        for key in keys:
+            value = self._local_get(key, version)
+            if value is _MISSING:
+                missing.append(key)
+            else:
+                found[key] = value
+
+        if missing:
+            for key, (value, ttl) in self._fetch(missing, version).items():
+                # La copia locale non supera la durata residua su Redis
+                self._local_set(key, value, ttl, version)
+                found[key] = value
+        record_cache_access(hits=len(found), misses=len(keys) - len(found))
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self._call('set', key, value, timeout, version=version)
+        self._local_set(key, value, self._local_timeout(timeout), version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self._call('set_many', data, timeout, version=version)
+        for key, value in data.items():
+            self._local_set(key, value, self._local_timeout(timeout), version)
+        return failed
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = self._call('add', key, value, timeout, version=version)
+        if added:
+            self._local_set(key, value, self._local_timeout(timeout), version)
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self._call('touch', key, timeout, version=version)
+
+    def delete(self, key, version=None):
+        self._local_discard(key, version)
+        return self._call('delete', key, version=version)
+
+    def delete_many(self, keys, version=None):
+        for key in keys:
+            self._local_discard(key, version)
+        return self._call('delete_many', keys, version=version)
+
+    def has_key(self, key, version=None):
+        if self._local_get(key, version) is not _MISSING:
+            return True
+        return self._call('has_key', key, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        self._local_discard(key, version)
+        return self._call('incr', key, delta, version=version)
+
+    def clear(self):
+        self._local.clear()
+        return self._call('clear')
+
+    def close(self, **kwargs):
+        self._remote.close(**kwargs)
+
+    @property
+    def redis_client(self):
+        """Client redis-py sottostante (per operazioni atomiche dedicate)"""
+        return self._remote._cache.get_client(write=True)
+
+
+class AppCache:
+    """
+    Cache con namespace e versione per app.
+
+    La versione viene da settings.CACHE_APP_VERSIONS[app_label]: incrementarla
+    invalida tutte le chiavi dell'app senza toccare quelle delle altre.
+    """
+
+    def __init__(self, app_label: str, alias: str = 'default'):
+        self.app_label = app_label
+        self.alias = alias
+
+    @property
+    def cache(self) -> BaseCache:
+        return caches[self.alias]
+
+    @property
+    def version(self) -> int:
+        return getattr(settings, 'CACHE_APP_VERSIONS', {}).get(self.app_label, 1)
+
+    def key(self, key: str) -> str:
+        return f'{self.app_label}:{key}'
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self.cache.get(self.key(key), default, version=self.version)
+
+    def get_many(self, keys) -> Dict[str, Any]:
+        prefixed = {self.key(key): key for key in keys}
+        found = self.cache.get_many(list(prefixed), version=self.version)
+        return {prefixed[key]: value for key, value in found.items()}
+
+    def set(self, key: str, value: Any, timeout=DEFAULT_TIMEOUT):
+        self.cache.set(self.key(key), value, timeout, version=self.version)
+
+    def set_many(self, data: Dict[str, Any], timeout=DEFAULT_TIMEOUT):
+        self.cache.set_many({self.key(key): value for key, value in data.items()}, timeout, version=self.version)
+
+    def add(self, key: str, value: Any, timeout=DEFAULT_TIMEOUT) -> bool:
+        return self.cache.add(self.key(key), value, timeout, version=self.version)
+
+    def delete(self, key: str):
+        self.cache.delete(self.key(key), version=self.version)
+
+    def delete_many(self, keys):
+        self.cache.delete_many([self.key(key) for key in keys], version=self.version)
+
+    def incr(self, key: str, delta: int = 1) -> int:
+        return self.cache.incr(self.key(key), delta, version=self.version)
+
+    def get_or_set(self, key: str, default, timeout=DEFAULT_TIMEOUT) -> Any:
+        return self.cache.get_or_set(self.key(key), default, timeout, version=self.version)
+
+
+_app_caches: Dict[str, AppCache] = {}
+
+
+def app_cache(app_label: str) -> AppCache:
+    """Ritorna la cache versionata dell'app indicata"""
+    if app_label not in _app_caches:
+        _app_caches[app_label] = AppCache(app_label)
+    return _app_caches[app_label]
+
+
+def _model_version_key(label: str) -> str:
+    return f'model-version:{label}'
+
+
+def model_versions(*labels: str) -> Dict[str, int]:
+    """
+    Versioni correnti dei modelli indicati (label tipo 'products.product').
+
+    Una versione mancante (mai creata o espulsa dalla cache) viene inizializzata
+    al timestamp in millisecondi: non può coincidere con una già usata in chiavi
+    ancora valide.
+    """
+    cache = caches['default']
+    keys = {_model_version_key(label): label for label in labels}
+    found = cache.get_many(list(keys))
+
+    versions = {}
+    for key, label in keys.items():
+        if key not in found:
+            cache.add(key, int(time.time() * 1000), None)
+            found[key] = cache.get(key)
+        versions[label] = found[key]
+    return versions
+
+
+def bump_model_versions(*labels: str):
+    """Invalida in O(1) tutte le risposte in cache che dipendono dai modelli indicati"""
+    cache = caches['default']
+    for label in labels:
+        key = _model_version_key(label)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, int(time.time() * 1000), None)
@@ -0,0 +1,146 @@
+import time
+import bisect
+import threading
+from collections import deque
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Any
+from django.conf import settings
+
+DEFAULT_INSTRUMENTATION = {
+    'enabled': True,
+    'server_timing': True,
+    'histogram_size': 1000,
+    'slow_request_ms': 500,
+}
+
+# Limiti superiori dei bucket dell'istogramma (ms); l'ultimo bucket è "oltre"
+HISTOGRAM_BUCKETS_MS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000]
+
+
+def instrumentation_settings() -> Dict[str, Any]:
+    return {**DEFAULT_INSTRUMENTATION, **getattr(settings, 'INSTRUMENTATION', {})}
+
+
+class RequestProfile:
+    """Metriche raccolte durante una singola richiesta"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.db_queries = 0
+        self.db_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    @property
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self.started) * 1000
+
+    @property
+    def db_ms(self) -> float:
+        return self.db_time * 1000
+
+    def __call__(self, execute, sql, params, many, context):
+        """Execute wrapper per connection.execute_wrapper: conta e cronometra le query"""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.db_queries += 1
+
+
+_current_profile: ContextVar[Optional[RequestProfile]] = ContextVar('request_profile', default=None)
+
+
+def current_profile() -> Optional[RequestProfile]:
+    return _current_profile.get()
+
+
+def activate_profile(profile: RequestProfile):
+    return _current_profile.set(profile)
+
+
+def deactivate_profile(token):
+    _current_profile.reset(token)
+
+
+def record_cache_access(hits: int = 0, misses: int = 0):
+    """Chiamata dai backend cache: no-op fuori da una richiesta strumentata"""
+    profile = _current_profile.get()
+    if profile is not None:
+        profile.cache_hits += hits
+        profile.cache_misses += misses
+
+
+class ViewHistogram:
+    """Ultime N durate di una vista, con bucket e percentili calcolati on demand"""
+
+    def __init__(self, size: int):
+        self.samples = deque(maxlen=size)
+        self.db_queries = deque(maxlen=size)
+        self.total_requests = 0
+        self.errors = 0
+
+    def add(self, duration_ms: float, db_queries: int, status_code: int):
+        self.samples.append(duration_ms)
+        self.db_queries.append(db_queries)
+        self.total_requests += 1
+        if status_code >= 500:
+            self.errors += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        samples = sorted(self.samples)
+        if not samples:
+            return {'requests': self.total_requests, 'errors': self.errors}
+
+        def percentile(p: float) -> float:
+            index = min(len(samples) - 1, int(round(p * (len(samples) - 1))))
+            return round(samples[index], 2)
+
+        buckets = [0] * (len(HISTOGRAM_BUCKETS_MS) + 1)
+        for value in samples:
+            buckets[bisect.bisect_left(HISTOGRAM_BUCKETS_MS, value)] += 1
+        labels = [f'<={bound}ms' for bound in HISTOGRAM_BUCKETS_MS] + [f'>{HISTOGRAM_BUCKETS_MS[-1]}ms']
+
+        return {
+            'requests': self.total_requests,
+            'errors': self.errors,
+            'window': len(samples),
+            'avg_ms': round(sum(samples) / len(samples), 2),
+            'p50_ms': percentile(0.50),
+            'p95_ms': percentile(0.95),
+            'p99_ms': percentile(0.99),
+            'max_ms': round(samples[-1], 2),
+            'avg_db_queries': round(sum(self.db_queries) / len(self.db_queries), 2),
+            'max_db_queries': max(self.db_queries),
+            'histogram': dict(zip(labels, buckets)),
+        }
+
+
+class ViewStatsRegistry:
+    """Istogrammi per nome vista, in memoria del singolo processo"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views: Dict[str, ViewHistogram] = {}
+
+    def record(self, view_name: str, duration_ms: float, db_queries: int, status_code: int):
+        with self._lock:
+            histogram = self._views.get(view_name)
+            if histogram is None:
+                histogram = self._views[view_name] = ViewHistogram(
+                    instrumentation_settings()['histogram_size']
+                )
+            histogram.add(duration_ms, db_queries, status_code)
+
+    def snapshot(self, view_name: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            names: List[str] = [view_name] if view_name else sorted(self._views)
+            return {name: self._views[name].snapshot() for name in names if name in self._views}
+
+    def reset(self):
+        with self._lock:
+            self._views.clear()
+
+
+view_stats = ViewStatsRegistry()
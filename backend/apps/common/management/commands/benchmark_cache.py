@@ -0,0 +1,85 @@
+import time
+import statistics
+from django.core.management.base import BaseCommand, CommandError
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.cache.backends.db import DatabaseCache
+from django.core.cache.backends.redis import RedisCache
+from apps.common.cache import TieredRedisCache
+
+class Command(BaseCommand):
+    help = 'Benchmark overhead cache per richiesta: locmem, database, Redis, Redis + LRU locale'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--requests',
+            type=int,
+            default=5000,
+            help='Numero di richieste simulate per backend (default 5000)',
+        )
+        parser.add_argument(
+            '--redis-url',
+            help='Redis reale da usare; se assente si usa fakeredis in-process',
+        )
+        parser.add_argument(
+            '--include-db',
+            action='store_true',
+            help='Include DatabaseCache (richiede "manage.py createcachetable")',
+        )
+
+    def handle(self, *args, **options):
+        backends = {'locmem': LocMemCache('benchmark', {})}
+
+        if options['include_db']:
+            backends['database'] = DatabaseCache('cache_table', {})
+
+        redis_url, redis_options = self.redis_location(options['redis_url'])
+        backends['redis'] = RedisCache(redis_url, {'OPTIONS': redis_options})
+        backends['redis + lru locale'] = TieredRedisCache(redis_url, {'OPTIONS': redis_options})
+
+        for name, cache in backends.items():
+            cache.clear()
+            timings = self.run(cache, options['requests'])
+            timings.sort()
+            p99 = timings[int(len(timings) * 0.99) - 1]
+            self.stdout.write(self.style.SUCCESS(
+                f'{name:>20}: media {statistics.mean(timings):.3f} ms, '
+                f'p50 {statistics.median(timings):.3f} ms, p99 {p99:.3f} ms per richiesta'
+            ))
+
+    def redis_location(self, redis_url):
+        """URL e opzioni pool: Redis reale o server fakeredis in-process"""
+        if redis_url:
+            return redis_url, {}
+
+        try:
+            import fakeredis
+        except ImportError:
+            raise CommandError('fakeredis non installato: usare --redis-url o "pip install fakeredis"')
+
+        connection_class = getattr(fakeredis, 'FakeRedisConnection', None) or fakeredis.FakeConnection
+        self.stdout.write('Uso fakeredis in-process (latenza di rete esclusa)')
+        return 'redis://localhost:6379/0', {
+            'connection_class': connection_class,
+            'server': fakeredis.FakeServer(),
+        }
+
+    def run(self, cache, requests):
+        """Simula il pattern di una richiesta API: rate limit, letture calde, una scrittura"""
+        hot_keys = [f'hot:{i}' for i in range(20)]
+        for key in hot_keys:
+            cache.set(key, {'payload': key * 10}, 300)
+
+        timings = []
+        for i in range(requests):
+            started = time.perf_counter()
+
+            counter_key = f'rate:{i % 50}'
+            if not cache.add(counter_key, 1, 60):
+                cache.incr(counter_key)
+            cache.get(hot_keys[i % len(hot_keys)])
+            cache.get(hot_keys[(i * 7) % len(hot_keys)])
+            cache.get(f'cold:{i}')
+            cache.set(f'session:{i % 200}', i, 300)
+
+            timings.append((time.perf_counter() - started) * 1000)
+        return timings
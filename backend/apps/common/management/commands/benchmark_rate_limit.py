@@ -0,0 +1,99 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.cache.backends.redis import RedisCache
+from django.http import HttpResponse
+from django.contrib.auth.models import AnonymousUser
+from django.test import RequestFactory
+from apps.common.middleware import RateLimitMiddleware
+from apps.common.ratelimit import SlidingWindowRateLimiter, RateLimitPolicy
+
+class Command(BaseCommand):
+    help = 'Micro-benchmark overhead di RateLimitMiddleware (verifica p99 < soglia)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--requests',
+            type=int,
+            default=20000,
+            help='Numero di richieste simulate per backend (default 20000)',
+        )
+        parser.add_argument(
+            '--clients',
+            type=int,
+            default=500,
+            help='Numero di IP client distinti (default 500)',
+        )
+        parser.add_argument(
+            '--redis-url',
+            help='Redis reale da usare; se assente si usa fakeredis in-process',
+        )
+        parser.add_argument(
+            '--max-p99-ms',
+            type=float,
+            default=1.0,
+            help='Soglia p99 per richiesta in millisecondi (default 1.0)',
+        )
+
+    def handle(self, *args, **options):
+        backends = {'locmem': LocMemCache('benchmark-rate-limit', {})}
+
+        redis_cache = self.redis_cache(options['redis_url'])
+        if redis_cache is not None:
+            backends['redis'] = redis_cache
+
+        failures = []
+        for name, cache in backends.items():
+            cache.clear()
+            timings = self.run(cache, options['requests'], options['clients'])
+            timings.sort()
+            p50 = timings[len(timings) // 2]
+            p99 = timings[int(len(timings) * 0.99) - 1]
+
+            line = f'{name:>8}: p50 {p50:.3f} ms, p99 {p99:.3f} ms, max {timings[-1]:.3f} ms'
+            if p99 > options['max_p99_ms']:
+                failures.append(name)
+                self.stdout.write(self.style.ERROR(line))
+            else:
+                self.stdout.write(self.style.SUCCESS(line))
+
+        if failures:
+            raise CommandError(f"p99 oltre {options['max_p99_ms']} ms per: {', '.join(failures)}")
+
+    def redis_cache(self, redis_url):
+        if redis_url:
+            return RedisCache(redis_url, {})
+
+        try:
+            import fakeredis
+        except ImportError:
+            self.stdout.write(self.style.WARNING('fakeredis non installato: benchmark Redis saltato'))
+            return None
+
+        connection_class = getattr(fakeredis, 'FakeRedisConnection', None) or fakeredis.FakeConnection
+        return RedisCache('redis://localhost:6379/0', {'OPTIONS': {
+            'connection_class': connection_class,
+            'server': fakeredis.FakeServer(),
+        }})
+
+    def run(self, cache, requests, clients):
+        middleware = RateLimitMiddleware(lambda request: HttpResponse())
+        middleware.policy = RateLimitPolicy({'default': {'limit': 10 ** 9, 'window': 60}})
+        middleware.limiter = SlidingWindowRateLimiter(cache=cache)
+
+        factory = RequestFactory()
+        prepared = []
+        for i in range(min(requests, clients)):
+            request = factory.get('/api/v1/products/', REMOTE_ADDR=f'10.0.{i // 250}.{i % 250}')
+            request.user = AnonymousUser()
+            prepared.append(request)
+
+        response = HttpResponse()
+        timings = []
+        for i in range(requests):
+            request = prepared[i % len(prepared)]
+            started = time.perf_counter()
+            middleware.process_request(request)
+            middleware.process_response(request, response)
+            timings.append((time.perf_counter() - started) * 1000)
+        return timings
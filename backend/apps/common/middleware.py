@@ -1,8 +1,15 @@
 import logging
+from django.db import connection
+from django.core.exceptions import MiddlewareNotUsed
 from django.http import JsonResponse
-from django.core.cache import cache
 from django.utils.deprecation import MiddlewareMixin
 from django.conf import settings
+from .ratelimit import RateLimitPolicy, SlidingWindowRateLimiter
+from .querybudget import QueryRecorder, DEFAULT_REPEAT_THRESHOLD
+from .instrumentation import (
+    RequestProfile, activate_profile, deactivate_profile,
+    instrumentation_settings, view_stats,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -18,8 +25,102 @@ class APILoggingMiddleware(MiddlewareMixin):
             logger.info(f"API Response: {response.status_code} for {request.method} {request.path}")
         return response
 
+class InstrumentationMiddleware:
+    """
+    Misura ogni richiesta: tempo totale, numero e durata delle query,
+    hit/miss della cache e dimensione della risposta.
+
+    Le metriche vanno nei log (campi strutturati in `extra`), nell'header
+    Server-Timing e nell'istogramma per vista esposto da
+    apps.common.views.performance_stats. Configurazione in settings.INSTRUMENTATION.
+    """
+    
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.config = instrumentation_settings()
+    
+    def __call__(self, request):
+        if not self.config['enabled']:
+            return self.get_response(request)
+        
+        profile = RequestProfile()
+        token = activate_profile(profile)
+        try:
+            with connection.execute_wrapper(profile):
+                response = self.get_response(request)
+        finally:
+            deactivate_profile(token)
+        
+        total_ms = profile.elapsed_ms
+        view_name = self.get_view_name(request)
+        response_size = None if response.streaming else len(response.content)
+        
+        view_stats.record(view_name, total_ms, profile.db_queries, response.status_code)
+        
+        if self.config['server_timing']:
+            response['Server-Timing'] = ', '.join([
+                f'total;dur={total_ms:.1f}',
+                f'db;dur={profile.db_ms:.1f};desc="{profile.db_queries} queries"',
+                f'app;dur={max(0.0, total_ms - profile.db_ms):.1f}',
+                f'cache;desc="hit={profile.cache_hits} miss={profile.cache_misses}"',
+            ])
+        
+        level = logging.WARNING if total_ms >= self.config['slow_request_ms'] else logging.INFO
+        logger.log(level, f"{request.method} {request.path} {response.status_code} {total_ms:.1f}ms", extra={
+            'view': view_name,
+            'method': request.method,
+            'path': request.path,
+            'status_code': response.status_code,
+            'duration_ms': round(total_ms, 2),
+            'db_queries': profile.db_queries,
+            'db_time_ms': round(profile.db_ms, 2),
+            'cache_hits': profile.cache_hits,
+            'cache_misses': profile.cache_misses,
+            'response_bytes': response_size,
+        })
+        
+        return response
+    
+    def get_view_name(self, request):
+        """Nome della route risolta (es. 'stores-list'), o il percorso del callable"""
+        match = getattr(request, 'resolver_match', None)
+        if match is None:
+            return '<unresolved>'
+        return match.view_name or match._func_path
+
+class QueryPatternMiddleware:
+    """
+    Solo in DEBUG: segnala le forme SQL ripetute nella stessa richiesta
+    (probabili N+1) con un warning nei log e l'header X-Query-Repeats.
+    Soglia in settings.QUERY_REPEAT_THRESHOLD.
+    """
+    
+    def __init__(self, get_response):
+        if not settings.DEBUG:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.threshold = getattr(settings, 'QUERY_REPEAT_THRESHOLD', DEFAULT_REPEAT_THRESHOLD)
+    
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            response = self.get_response(request)
+        
+        repeated = recorder.repeated(self.threshold)
+        if repeated:
+            for shape, count in repeated:
+                logger.warning(f"Possibile N+1 su {request.method} {request.path}: x{count} {shape[:300]}")
+            response['X-Query-Repeats'] = ', '.join(str(count) for _, count in repeated)
+        
+        return response
+
 class RateLimitMiddleware(MiddlewareMixin):
-    """Middleware per rate limiting delle API"""
+    """Middleware per rate limiting delle API (finestra scorrevole, incrementi atomici)"""
+    
+    def __init__(self, get_response=None):
+        super().__init__(get_response)
+        self.policy = RateLimitPolicy()
+        self.limiter = SlidingWindowRateLimiter()
     
     def process_request(self, request):
         if not request.path.startswith('/api/'):
@@ -27,30 +128,55 @@ class RateLimitMiddleware(MiddlewareMixin):
         
         # Estrai IP client
         client_ip = self.get_client_ip(request)
+        if self.policy.is_whitelisted(client_ip):
+            return None
         
-        # Chiave cache per rate limiting
-        cache_key = f"rate_limit_{client_ip}"
+        # Regola per route/utente (settings.RATE_LIMITS)
+        user_id = self.get_user_id(request)
+        rule = self.policy.rule_for(request.path, user_id)
+        if rule.get('per_user', True) and user_id is not None:
+            identity = f"{rule['scope']}:user:{user_id}"
+        else:
+            identity = f"{rule['scope']}:ip:{client_ip}"
         
-        # Controlla rate limit (100 requests per minuto)
-        current_count = cache.get(cache_key, 0)
+        result = self.limiter.hit(identity, rule['limit'], rule['window'])
+        request.rate_limit = result
         
-        if current_count >= 100:
-            logger.warning(f"Rate limit exceeded for IP: {client_ip}")
-            return JsonResponse(
+        if not result.allowed:
+            logger.warning(f"Rate limit exceeded for {identity}")
+            response = JsonResponse(
                 {"error": "Rate limit exceeded"}, 
                 status=429
             )
+            response['Retry-After'] = str(result.retry_after)
+            return response
         
-        # Incrementa counter
-        cache.set(cache_key, current_count + 1, 60)  # 60 secondi
+        return None
+    
+    def process_response(self, request, response):
+        result = getattr(request, 'rate_limit', None)
+        if result is not None:
+            response['X-RateLimit-Limit'] = str(result.limit)
+            response['X-RateLimit-Remaining'] = str(max(0, result.limit - result.count))
+        return response
+    
+    def get_user_id(self, request):
+        """Utente autenticato via sessione o JWT (senza query al database)"""
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            return user.pk
         
+        header = request.META.get('HTTP_AUTHORIZATION', '')
+        if header.startswith('Bearer '):
+            try:
+                from rest_framework_simplejwt.tokens import AccessToken
+                return AccessToken(header[7:]).get('user_id')
+            except Exception:
+                return None
         return None
     
     def get_client_ip(self, request):
-        """Estrae l'IP del client"""
-        x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
-        if x_forwarded_for:
-            ip = x_forwarded_for.split(',')[0]
-        else:
-            ip = request.META.get('REMOTE_ADDR')
-        return ip
\ No newline at end of file
+        """Estrae l'IP del client (X-Forwarded-For solo dai proxy fidati)"""
+        return self.policy.client_ip(
+            request.META.get('REMOTE_ADDR', ''), request.META.get('HTTP_X_FORWARDED_FOR', '')
+        )
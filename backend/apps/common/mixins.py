@@ -0,0 +1,156 @@
+from calendar import timegm
+from datetime import datetime
+from typing import Callable, Dict, Iterable, Optional, Tuple
+from django.core.cache import caches
+from django.core.exceptions import ValidationError
+from django.db.models import Count, Max, QuerySet
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework.response import Response
+from .cache import model_versions
+from .utils import payload_hash
+
+
+def normalized_query_params(request) -> Dict[str, list]:
+    """Parametri GET ordinati, senza valori vuoti: stessa pagina, stessa chiave"""
+    return {
+        key: sorted(value for value in request.query_params.getlist(key) if value != '')
+        for key in sorted(request.query_params)
+        if any(value != '' for value in request.query_params.getlist(key))
+    }
+
+
+class VersionedCacheMixin:
+    """
+    Cache delle risposte GET di un ViewSet in sola lettura.
+
+    La chiave include azione, kwargs dell'URL, parametri normalizzati, host e
+    schema (la risposta contiene URL assoluti: immagini, pagine successive) e
+    la versione di ogni modello in `cache_models`: un salvataggio su uno di quei
+    modelli incrementa la versione (apps.common.cache.bump_model_versions) e le
+    pagine vecchie non vengono più lette, senza scansione di chiavi.
+    Le versioni non passano dalla LRU locale di TieredRedisCache: gli altri
+    processi vedono l'invalidazione dalla richiesta successiva.
+    """
+    cache_models: Iterable[str] = ()
+    cache_actions: Iterable[str] = ('list', 'retrieve')
+    cache_timeout = 300
+    cache_alias = 'default'
+
+    def get_cache_models(self) -> Iterable[str]:
+        return self.cache_models
+
+    def get_cache_timeout(self) -> int:
+        return self.cache_timeout
+
+    def get_response_cache_key(self, request) -> str:
+        versions = model_versions(*self.get_cache_models())
+        return 'response:{}:{}:{}'.format(
+            self.basename,
+            self.action,
+            payload_hash({
+                'kwargs': self.kwargs,
+                'params': normalized_query_params(request),
+                'origin': f'{request.scheme}://{request.get_host()}',
+                'versions': versions,
+            }),
+        )
+
+    def cached_response(self, request, build_response):
+        """Ritorna la risposta in cache o la costruisce con `build_response()`"""
+        if request.method != 'GET' or self.action not in self.cache_actions:
+            return build_response()
+
+        cache = caches[self.cache_alias]
+        key = self.get_response_cache_key(request)
+        cached = cache.get(key)
+        if cached is not None:
+            return Response(cached)
+
+        response = build_response()
+        if response.status_code == 200:
+            cache.set(key, response.data, self.get_cache_timeout())
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(request, lambda: super(VersionedCacheMixin, self).list(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(request, lambda: super(VersionedCacheMixin, self).retrieve(request, *args, **kwargs))
+
+
+def queryset_validators(queryset: QuerySet, **extra) -> Tuple[str, Optional[datetime]]:
+    """
+    ETag da max(updated_at) e count del queryset filtrato (una query). Nessun
+    Last-Modified: max(updated_at) non cambia quando una riga viene eliminata,
+    e un client con il solo If-Modified-Since riceverebbe un 304 sbagliato.
+    """
+    stats = queryset.order_by().aggregate(last_modified=Max('updated_at'), count=Count('pk'))
+    return payload_hash({**stats, **extra}), None
+
+
+def conditional_response(request, etag: str, last_modified: Optional[datetime],
+                         build_response: Callable[[], Response]):
+    """
+    Risponde 304 se If-None-Match/If-Modified-Since corrispondono, senza
+    chiamare `build_response()` (e quindi senza serializzare nulla).
+    """
+    etag = f'W/"{etag}"'
+    timestamp = timegm(last_modified.utctimetuple()) if last_modified else None
+
+    not_modified = get_conditional_response(request, etag=etag, last_modified=timestamp)
+    if not_modified is not None:
+        return not_modified
+
+    response = build_response()
+    if response.status_code == 200:
+        response['ETag'] = etag
+        if timestamp is not None:
+            response['Last-Modified'] = http_date(timestamp)
+    return response
+
+
+class ConditionalGetMixin:
+    """
+    GET condizionali (ETag debole) per ViewSet in sola lettura.
+
+    Se il ViewSet usa VersionedCacheMixin l'ETag viene dalle versioni dei
+    modelli, senza query; altrimenti da max(updated_at) e count del queryset
+    filtrato. Va messo prima di VersionedCacheMixin, così il 304
+    non legge nemmeno la cache.
+    """
+    conditional_actions: Iterable[str] = ('list', 'retrieve')
+
+    def get_validators(self, request) -> Tuple[str, Optional[datetime]]:
+        identity = {
+            'view': self.basename,
+            'action': self.action,
+            'kwargs': self.kwargs,
+            'params': normalized_query_params(request),
+        }
+
+        cache_models = self.get_cache_models() if hasattr(self, 'get_cache_models') else ()
+        if cache_models:
+            return payload_hash({**identity, 'versions': model_versions(*cache_models)}), None
+
+        queryset = self.filter_queryset(self.get_queryset())
+        if self.action == 'retrieve':
+            lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+            queryset = queryset.filter(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        return queryset_validators(queryset, **identity)
+
+    def conditional_get(self, request, build_response):
+        if request.method not in ('GET', 'HEAD') or self.action not in self.conditional_actions:
+            return build_response()
+        try:
+            etag, last_modified = self.get_validators(request)
+        except (TypeError, ValueError, ValidationError):
+            # Lookup non valido: la vista risponderà 404 come get_object()
+            return build_response()
+        return conditional_response(request, etag, last_modified, build_response)
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_get(request, lambda: super(ConditionalGetMixin, self).list(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_get(request, lambda: super(ConditionalGetMixin, self).retrieve(request, *args, **kwargs))
@@ -0,0 +1,200 @@
+import json
+import base64
+import logging
+from typing import Optional, Tuple
+from django.db import connection
+from django.db.models import QuerySet
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+logger = logging.getLogger(__name__)
+
+
+def _table_estimate(table: str) -> Tuple[Optional[str], Optional[int]]:
+    """
+    (relkind, righe stimate) di una tabella da pg_class.reltuples. Il padre
+    di una tabella partizionata (relkind 'p') non ha righe proprie
+    (reltuples -1 o 0): si sommano le stime delle partizioni analizzate.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT c.relkind, c.reltuples::bigint, '
+            '(SELECT SUM(child.reltuples)::bigint FROM pg_inherits i '
+            'JOIN pg_class child ON child.oid = i.inhrelid '
+            'WHERE i.inhparent = c.oid AND child.reltuples >= 0) '
+            'FROM pg_class c WHERE c.oid = %s::regclass',
+            [table],
+        )
+        row = cursor.fetchone()
+    if row is None:
+        return None, None
+    relkind, reltuples, partitions = row
+    if relkind == 'p':
+        return relkind, partitions
+    return relkind, reltuples if reltuples >= 0 else None
+
+
+def approximate_count(queryset: QuerySet) -> Optional[int]:
+    """
+    Conteggio stimato senza COUNT(*): su PostgreSQL pg_class.reltuples per la
+    tabella intera (somma delle partizioni per una tabella partizionata), la
+    stima del planner (EXPLAIN) per un queryset filtrato o per partizioni
+    non ancora analizzate. None se la stima non è disponibile (database
+    diverso o tabella mai analizzata).
+    """
+    if connection.vendor != 'postgresql':
+        return None
+
+    queryset = queryset.order_by()
+    try:
+        if not queryset.query.where:
+            relkind, estimate = _table_estimate(queryset.model._meta.db_table)
+            if estimate is not None or relkind != 'p':
+                return estimate
+        plan = json.loads(queryset.explain(format='json'))
+        estimate = plan[0]['Plan']['Plan Rows']
+    except Exception as e:
+        logger.warning(f"Stima conteggio non disponibile: {e}")
+        return None
+
+    return int(estimate) if estimate >= 0 else None
+
+
+class KeysetPagination(BasePagination):
+    """
+    Paginazione keyset su (created_at, id): niente OFFSET né COUNT(*) esatto.
+
+    Il cursore opaco contiene created_at e id dell'ultima riga; la pagina
+    successiva è un range scan sull'indice composito (created_at, id).
+    - count_mode: 'approximate' (pg_class.reltuples / stima del planner),
+      'exact' o None (nessun conteggio)
+    - opt_in: se True la modalità keyset si attiva solo con ?pagination=cursor
+      o con un cursore; altrimenti si usa fallback_class (pagine numerate)
+
+    Anche un ordinamento diverso da `ordering` (es. ?ordering= o rank di
+    ricerca) usa fallback_class: il cursore sarebbe incoerente.
+    """
+    page_size = api_settings.PAGE_SIZE or 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    mode_query_param = 'pagination'
+    ordering = ('-created_at', '-id')
+    count_mode = 'approximate'
+    opt_in = False
+    fallback_class = PageNumberPagination
+    invalid_cursor_message = 'Cursore non valido'
+
+    def __init__(self):
+        self.fallback = None
+
+    def use_keyset(self, queryset: QuerySet, request) -> bool:
+        order_by = list(queryset.query.order_by)
+        if order_by and order_by[0] != self.ordering[0]:
+            return False
+        if not self.opt_in:
+            return True
+        return (
+            self.cursor_query_param in request.query_params
+            or request.query_params.get(self.mode_query_param) == 'cursor'
+        )
+
+    def get_page_size(self, request) -> int:
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            data = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')))
+            created_at = parse_datetime(data['c'])
+            if created_at is None:
+                raise ValueError
+            return created_at, int(data['i']), bool(data.get('r'))
+        except (TypeError, ValueError, KeyError, json.JSONDecodeError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, instance, reverse: bool = False) -> str:
+        data = {'c': instance.created_at.isoformat(), 'i': instance.pk}
+        if reverse:
+            data['r'] = 1
+        encoded = base64.urlsafe_b64encode(json.dumps(data, separators=(',', ':')).encode('ascii'))
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, encoded.decode('ascii'))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        if not self.use_keyset(queryset, request):
+            self.fallback = self.fallback_class()
+            return self.fallback.paginate_queryset(queryset, request, view)
+
+        self.count = None
+        self.count_is_approximate = False
+        if self.count_mode == 'exact':
+            self.count = queryset.count()
+        elif self.count_mode == 'approximate':
+            # Senza stima (es. SQLite in sviluppo) si ripiega sul conteggio esatto
+            self.count = approximate_count(queryset)
+            self.count_is_approximate = self.count is not None
+            if self.count is None:
+                self.count = queryset.count()
+
+        page_size = self.get_page_size(request)
+        cursor = self.decode_cursor(request)
+        descending = self.ordering[0].startswith('-')
+        reverse = bool(cursor and cursor[2])
+
+        # Andando indietro si legge nell'ordine opposto e si rigira la pagina
+        scan_descending = descending != reverse
+        ordering = ('-created_at', '-id') if scan_descending else ('created_at', 'id')
+        queryset = queryset.order_by(*ordering)
+
+        if cursor:
+            created_at, pk, _ = cursor
+            if scan_descending:
+                queryset = queryset.filter(created_at__lte=created_at).exclude(created_at=created_at, pk__gte=pk)
+            else:
+                queryset = queryset.filter(created_at__gte=created_at).exclude(created_at=created_at, pk__lte=pk)
+
+        rows = list(queryset[:page_size + 1])
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        if reverse:
+            rows.reverse()
+
+        self.next_link = self.previous_link = None
+        if rows:
+            if reverse:
+                # Si arriva da una pagina successiva: quella esiste sempre
+                self.next_link = self.encode_cursor(rows[-1])
+                if has_more:
+                    self.previous_link = self.encode_cursor(rows[0], reverse=True)
+            else:
+                if has_more:
+                    self.next_link = self.encode_cursor(rows[-1])
+                if cursor:
+                    self.previous_link = self.encode_cursor(rows[0], reverse=True)
+        elif cursor:
+            # Pagina vuota: si torna all'inizio
+            self.previous_link = remove_query_param(request.build_absolute_uri(), self.cursor_query_param)
+        return rows
+
+    def get_paginated_response(self, data):
+        if self.fallback is not None:
+            return self.fallback.get_paginated_response(data)
+
+        payload = {'next': self.next_link, 'previous': self.previous_link}
+        if self.count_mode:
+            payload['count'] = self.count
+            payload['count_is_approximate'] = self.count_is_approximate
+        payload['results'] = data
+        return Response(payload)
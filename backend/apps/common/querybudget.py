@@ -0,0 +1,125 @@
+import re
+import logging
+import threading
+from collections import Counter
+from contextlib import ContextDecorator
+from typing import Dict, List, Optional, Tuple
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+# Una forma SQL che si ripete almeno tante volte in un blocco è un probabile N+1
+DEFAULT_REPEAT_THRESHOLD = 3
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST_RE = re.compile(r'\bIN\s*\((?:\s*(?:%s|\?)\s*,?)+\)', re.IGNORECASE)
+_WHITESPACE_RE = re.compile(r'\s+')
+
+
+def normalize_sql(sql: str) -> str:
+    """Forma della query: letterali e liste IN sostituiti, spazi compattati"""
+    shape = _STRING_RE.sub('?', sql)
+    shape = _NUMBER_RE.sub('?', shape)
+    shape = shape.replace('%s', '?')
+    shape = _IN_LIST_RE.sub('IN (...)', shape)
+    return _WHITESPACE_RE.sub(' ', shape).strip()
+
+
+class QueryRecorder:
+    """Execute wrapper che conta le query per forma SQL"""
+
+    def __init__(self):
+        self.shapes: Counter = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        self.shapes[normalize_sql(sql)] += 1
+        return execute(sql, params, many, context)
+
+    @property
+    def count(self) -> int:
+        return sum(self.shapes.values())
+
+    def repeated(self, threshold: int = DEFAULT_REPEAT_THRESHOLD) -> List[Tuple[str, int]]:
+        """Forme eseguite almeno `threshold` volte, dalla più frequente"""
+        return [(shape, n) for shape, n in self.shapes.most_common() if n >= threshold]
+
+
+class QueryReport:
+    """Raccoglie i blocchi misurati durante l'esecuzione dei test"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.entries: Dict[str, Dict] = {}
+
+    def add(self, label: str, recorder: QueryRecorder, threshold: int = DEFAULT_REPEAT_THRESHOLD):
+        repeated = recorder.repeated(threshold)
+        with self._lock:
+            entry = self.entries.setdefault(label, {'queries': 0, 'worst_repeat': 0, 'shape': None})
+            entry['queries'] = max(entry['queries'], recorder.count)
+            if repeated and repeated[0][1] > entry['worst_repeat']:
+                entry['worst_repeat'], entry['shape'] = repeated[0][1], repeated[0][0]
+
+    def worst(self, limit: int = 10) -> List[Tuple[str, Dict]]:
+        with self._lock:
+            entries = list(self.entries.items())
+        entries.sort(key=lambda item: (item[1]['worst_repeat'], item[1]['queries']), reverse=True)
+        return entries[:limit]
+
+    def format(self, limit: int = 10) -> str:
+        lines = ['Query report (peggiori per query ripetute):']
+        for label, entry in self.worst(limit):
+            lines.append(f"  {entry['queries']:>4} query, forma ripetuta x{entry['worst_repeat']:<4} {label}")
+            if entry['shape']:
+                lines.append(f"         {entry['shape'][:160]}")
+        return '\n'.join(lines)
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+
+
+query_report = QueryReport()
+
+
+class query_budget(ContextDecorator):
+    """
+    Context manager/decoratore che fallisce se il blocco esegue più di
+    `max_queries` query. Il messaggio d'errore elenca le forme SQL ripetute.
+
+        with query_budget(5):
+            self.client.get('/api/v1/orders/')
+
+        @query_budget(5, label='lista ordini')
+        def test_list_orders(self): ...
+    """
+
+    def __init__(self, max_queries: int, label: Optional[str] = None,
+                 threshold: int = DEFAULT_REPEAT_THRESHOLD, using=None):
+        self.max_queries = max_queries
+        self.label = label
+        self.threshold = threshold
+        self.connection = using or connection
+
+    def __enter__(self):
+        self.recorder = QueryRecorder()
+        self._wrapper = self.connection.execute_wrapper(self.recorder)
+        self._wrapper.__enter__()
+        return self.recorder
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._wrapper.__exit__(exc_type, exc_value, traceback)
+        label = self.label or f'budget {self.max_queries}'
+        query_report.add(label, self.recorder, self.threshold)
+        if exc_type is not None:
+            return False
+
+        if self.recorder.count > self.max_queries:
+            details = '\n'.join(
+                f'  x{n}: {shape[:200]}' for shape, n in self.recorder.repeated(self.threshold)
+            )
+            raise AssertionError(
+                f'{label}: {self.recorder.count} query eseguite, budget {self.max_queries}'
+                + (f'\nForme ripetute:\n{details}' if details else '')
+            )
+        return False
@@ -0,0 +1,180 @@
+import time
+import logging
+import ipaddress
+from collections import namedtuple
+from typing import Dict, List, Optional
+from django.conf import settings
+from django.core.cache import caches
+
+logger = logging.getLogger(__name__)
+
+RateLimitResult = namedtuple('RateLimitResult', ['allowed', 'count', 'limit', 'retry_after'])
+
+DEFAULT_RATE_LIMITS = {
+    'default': {'limit': 100, 'window': 60},
+    'authenticated': {'limit': 300, 'window': 60},
+    'routes': [],
+    'whitelist': [],
+    'trusted_proxies': [],
+}
+
+# INCR atomico della finestra corrente + lettura della precedente, in un solo round trip
+_SLIDING_WINDOW_LUA = """
+local current = redis.call('INCR', KEYS[1])
+if current == 1 then
+    redis.call('EXPIRE', KEYS[1], ARGV[1])
+end
+local previous = tonumber(redis.call('GET', KEYS[2]) or '0')
+return {current, previous}
+"""
+
+
+class SlidingWindowRateLimiter:
+    """
+    Rate limiter a finestra scorrevole (sliding window counter).
+
+    Ogni finestra fissa ha un contatore incrementato atomicamente; il
+    conteggio stimato pesa il contatore della finestra precedente per la
+    frazione ancora coperta dalla finestra scorrevole. Con Redis l'intera
+    operazione è uno script Lua (un round trip); con altri backend si usano
+    add/incr, anch'essi atomici.
+    """
+
+    def __init__(self, cache=None, cache_alias: str = 'default', key_prefix: str = 'ratelimit'):
+        self._cache = cache
+        self.cache_alias = cache_alias
+        self.key_prefix = key_prefix
+        self._script = None
+        self._script_client = None
+        self._lua_enabled = True
+
+    @property
+    def cache(self):
+        return self._cache if self._cache is not None else caches[self.cache_alias]
+
+    def _redis_client(self):
+        cache = self.cache
+        if not self._lua_enabled or getattr(cache, 'is_degraded', False):
+            return None
+        if hasattr(cache, 'redis_client'):
+            return cache.redis_client
+        if hasattr(cache, '_cache') and hasattr(cache._cache, 'get_client'):
+            return cache._cache.get_client(write=True)
+        return None
+
+    def _counts_redis(self, client, current_key: str, previous_key: str, window: int):
+        if self._script is None or self._script_client is not client:
+            self._script = client.register_script(_SLIDING_WINDOW_LUA)
+            self._script_client = client
+        current, previous = self._script(keys=[current_key, previous_key], args=[window * 2])
+        return int(current), int(previous)
+
+    def _counts_cache(self, current_key: str, previous_key: str, window: int):
+        cache = self.cache
+        if cache.add(current_key, 1, window * 2):
+            current = 1
+        else:
+            try:
+                current = cache.incr(current_key)
+            except ValueError:
+                # Chiave scaduta tra add e incr
+                cache.set(current_key, 1, window * 2)
+                current = 1
+        return current, cache.get(previous_key, 0)
+
+    def hit(self, identity: str, limit: int, window: int) -> RateLimitResult:
+        """Registra una richiesta e ritorna se è entro il limite"""
+        now = time.time()
+        window_index = int(now // window)
+        base = f'{self.key_prefix}:{identity}:{window}'
+        current_key = f'{base}:{window_index}'
+        previous_key = f'{base}:{window_index - 1}'
+
+        client = self._redis_client()
+        counts = None
+        if client is not None:
+            from redis.exceptions import ResponseError
+            try:
+                counts = self._counts_redis(client, current_key, previous_key, window)
+            except ResponseError as e:
+                # Server senza supporto Lua: si passa definitivamente ad add/incr
+                logger.warning(f"Script rate limit non eseguibile ({e}), uso add/incr")
+                self._lua_enabled = False
+            except Exception as e:
+                logger.warning(f"Rate limit Redis non disponibile ({e}), uso backend cache")
+        if counts is None:
+            counts = self._counts_cache(current_key, previous_key, window)
+
+        current, previous = counts
+        elapsed = now - window_index * window
+        estimated = previous * (1 - elapsed / window) + current
+
+        if estimated <= limit:
+            return RateLimitResult(True, int(estimated), limit, 0)
+
+        retry_after = max(1, int(window - elapsed))
+        return RateLimitResult(False, int(estimated), limit, retry_after)
+
+
+class RateLimitPolicy:
+    """
+    Regole di rate limiting compilate da settings.RATE_LIMITS.
+
+    Formato:
+        RATE_LIMITS = {
+            'default': {'limit': 100, 'window': 60},          # per IP
+            'authenticated': {'limit': 300, 'window': 60},    # per utente
+            'routes': [
+                {'prefix': '/api/v1/auth/login/', 'limit': 10, 'window': 60},
+            ],
+            'whitelist': ['10.0.0.0/8'],
+            'trusted_proxies': ['172.18.0.0/16'],               # reverse proxy
+        }
+    Una regola di route può avere 'per_user': False per contare sempre per IP.
+    X-Forwarded-For è letto solo se la richiesta arriva da un proxy fidato.
+    """
+
+    def __init__(self, config: Optional[Dict] = None):
+        config = {**DEFAULT_RATE_LIMITS, **(config or getattr(settings, 'RATE_LIMITS', {}))}
+        self.default = config['default']
+        self.authenticated = config.get('authenticated') or config['default']
+        # Prefisso più lungo prima: vince la regola più specifica
+        self.routes: List[Dict] = sorted(config['routes'], key=lambda r: len(r['prefix']), reverse=True)
+        self.whitelist = [ipaddress.ip_network(net, strict=False) for net in config['whitelist']]
+        self.trusted_proxies = [ipaddress.ip_network(net, strict=False) for net in config['trusted_proxies']]
+
+    @staticmethod
+    def _in_networks(ip: str, networks: List) -> bool:
+        if not networks or not ip:
+            return False
+        try:
+            address = ipaddress.ip_address(ip)
+        except ValueError:
+            return False
+        return any(address in network for network in networks)
+
+    def is_whitelisted(self, ip: str) -> bool:
+        return self._in_networks(ip, self.whitelist)
+
+    def client_ip(self, remote_addr: str, forwarded_for: str = '') -> str:
+        """
+        IP del client. X-Forwarded-For è impostabile dal client e i proxy
+        (nginx con $proxy_add_x_forwarded_for) vi aggiungono in coda: vale
+        solo se REMOTE_ADDR è un proxy fidato, e si prende il primo hop da
+        destra che non è un proxy fidato.
+        """
+        if not forwarded_for or not self._in_networks(remote_addr, self.trusted_proxies):
+            return remote_addr
+        for hop in reversed([hop.strip() for hop in forwarded_for.split(',') if hop.strip()]):
+            if not self._in_networks(hop, self.trusted_proxies):
+                return hop
+        return remote_addr
+
+    def rule_for(self, path: str, user_id: Optional[int]) -> Dict:
+        """Ritorna la regola da applicare e lo scope per la chiave"""
+        for rule in self.routes:
+            if path.startswith(rule['prefix']):
+                return {**rule, 'scope': rule['prefix']}
+        if user_id is not None:
+            return {**self.authenticated, 'scope': 'authenticated'}
+        return {**self.default, 'scope': 'default'}
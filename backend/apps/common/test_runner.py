@@ -0,0 +1,13 @@
+from django.test.runner import DiscoverRunner
+from .querybudget import query_report
+
+
+class QueryReportTestRunner(DiscoverRunner):
+    """Test runner che a fine esecuzione stampa i test con più query ripetute"""
+
+    def run_suite(self, suite, **kwargs):
+        query_report.clear()
+        result = super().run_suite(suite, **kwargs)
+        if query_report.entries:
+            print('\n' + query_report.format())
+        return result
@@ -1,14 +1,43 @@
-from django.test import TestCase
+from unittest import mock, skipIf, skipUnless
+from django.test import SimpleTestCase, TestCase, RequestFactory
+from django.http import HttpResponse, QueryDict
 from django.contrib.auth.models import User
-from rest_framework.test import APITestCase
+from django.core.cache import caches
+from django.db import connection
+from django.db.models import F, Q
+from rest_framework.test import APITestCase, APIRequestFactory, force_authenticate
 from rest_framework import status
 from apps.stores.models import Store
-from apps.products.models import Category, Brand, Product
-from apps.customers.models import Customer
+from apps.stores.views import StoreViewSet
+from apps.products.models import Category, Brand, Product, ProductImage, ProductVariant
+from apps.products.autocomplete import autocomplete_index
+from apps.products.facets import _grouped_counts
+from apps.products.filters import containment_condition, requested_attributes
+from apps.products.views import ProductViewSet
+from apps.customers.models import Customer, Address
+from apps.inventory.availability import AVAILABILITY_CACHE_TIMEOUT
+from apps.inventory.models import StoreInventory
+from apps.inventory.reservations import reserve_stock
+from apps.orders.models import Order, OrderItem
+from apps.orders.views import OrderViewSet
+from apps.common.cache import _MISSING, LocalLRU, TieredRedisCache, app_cache
+from apps.common.middleware import InstrumentationMiddleware
+from apps.common.instrumentation import view_stats
+from apps.common.querybudget import query_budget, normalize_sql
+from apps.common.ratelimit import RateLimitPolicy
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
 
 class BaseAPITestCase(APITestCase):
     """Classe base per test API"""
     
+    def assertMaxQueries(self, max_queries, label=None):
+        """Context manager: fallisce se il blocco supera `max_queries` query"""
+        return query_budget(max_queries, label=label or self.id())
+    
     def setUp(self):
         # Crea utente test
         self.user = User.objects.create_user(
@@ -48,6 +77,70 @@ class BaseAPITestCase(APITestCase):
         """Autentica utente per i test"""
         self.client.force_authenticate(user=self.user)
 
+class EndpointQueryBudgetTestCase(BaseAPITestCase):
+    """Test per budget di query degli endpoint a rischio N+1"""
+    
+    def setUp(self):
+        super().setUp()
+        caches['default'].clear()
+        self.factory = APIRequestFactory(HTTP_HOST='localhost')
+        address = Address.objects.create(
+            customer=self.customer, type='billing', first_name='Mario', last_name='Rossi',
+            address_line_1='Via Roma 1', city='Milano', province='MI', postal_code='20121'
+        )
+        self.products = []
+        for i in range(5):
+            product = Product.objects.create(
+                sku=f'BUDGET{i}', name=f'Prodotto {i}', slug=f'prodotto-{i}',
+                category=self.category, brand=self.brand, product_type='glasses', price=100
+            )
+            ProductImage.objects.create(product=product, image=f'products/{i}.jpg')
+            for n in range(2):
+                variant = ProductVariant.objects.create(product=product, sku=f'BUDGET{i}-{n}', name=f'Variante {n}')
+                StoreInventory.objects.create(store=self.store, product=product, variant=variant, quantity=3)
+            StoreInventory.objects.create(store=self.store, product=product, quantity=3)
+            self.products.append(product)
+            
+            order = Order.objects.create(
+                order_number=f'BUDGET{i}', customer=self.customer, store=self.store, billing_address=address,
+                fulfillment_method='pickup', subtotal=200, total_amount=244,
+            )
+            OrderItem.objects.bulk_create([
+                OrderItem(order=order, product=product, quantity=1, unit_price=100, total_price=100)
+                for _ in range(2)
+            ])
+    
+    def get(self, view, path, params=None, **kwargs):
+        request = self.factory.get(path, params or {})
+        force_authenticate(request, user=self.user)
+        response = view(request, **kwargs)
+        response.render()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response
+    
+    def test_order_list(self):
+        """Lista ordini: conteggio righe annotato, nessuna query per ordine"""
+        with self.assertMaxQueries(2):
+            response = self.get(OrderViewSet.as_view({'get': 'list'}), '/api/v1/orders/')
+        self.assertEqual([order['items_count'] for order in response.data['results']], [2] * 5)
+    
+    def test_product_list(self):
+        """Lista prodotti, anche con disponibilità per store, a query costanti"""
+        view = ProductViewSet.as_view({'get': 'list'})
+        with self.assertMaxQueries(5):
+            self.get(view, '/api/v1/products/')
+        with self.assertMaxQueries(6):
+            response = self.get(view, '/api/v1/products/', {'store_id': self.store.pk})
+        self.assertEqual(len(response.data['results']), 5)
+    
+    def test_product_detail(self):
+        """Dettaglio prodotto con disponibilità"""
+        with self.assertMaxQueries(5):
+            response = self.get(
+                ProductViewSet.as_view({'get': 'retrieve'}), '/api/v1/products/prodotto-0/', slug='prodotto-0'
+            )
+        self.assertEqual(response.data['name'], 'Prodotto 0')
+
 class ProductAPITestCase(BaseAPITestCase):
     """Test per API prodotti"""
     
@@ -115,4 +208,429 @@ class AuthenticationTestCase(APITestCase):
         
         response = self.client.post('/api/v1/auth/login/', data)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertIn('access', response.data)
\ No newline at end of file
+        self.assertIn('access', response.data)
+
+class ProductResponseCacheTestCase(BaseAPITestCase):
+    """Test per cache delle risposte e GET condizionali degli endpoint prodotti"""
+    
+    def setUp(self):
+        super().setUp()
+        caches['default'].clear()
+        self.factory = APIRequestFactory()
+        self.product = Product.objects.create(
+            sku='CACHE1', name='Prodotto', slug='prodotto',
+            category=self.category, brand=self.brand, product_type='glasses', price=100
+        )
+        self.inventory = StoreInventory.objects.create(store=self.store, product=self.product, quantity=3)
+    
+    def get(self, view, path, params=None, host='localhost', **kwargs):
+        request = self.factory.get(path, params or {}, HTTP_HOST=host, **kwargs.pop('headers', {}))
+        force_authenticate(request, user=self.user)
+        response = view(request, **kwargs)
+        if hasattr(response, 'render'):
+            response.render()
+        return response
+    
+    def test_detail_etag_follows_availability_window(self):
+        """Test che le prenotazioni non tocchino la versione dell'inventario e l'ETag scada con la disponibilità"""
+        view = ProductViewSet.as_view({'get': 'retrieve'})
+        with mock.patch('apps.products.views.time.time', return_value=AVAILABILITY_CACHE_TIMEOUT * 100):
+            etag = self.get(view, '/api/v1/products/prodotto/', slug='prodotto')['ETag']
+            with self.captureOnCommitCallbacks(execute=True):
+                reserve_stock([(self.inventory.pk, 1)], 'ORD-1')
+            response = self.get(view, '/api/v1/products/prodotto/', slug='prodotto', headers={'HTTP_IF_NONE_MATCH': etag})
+            self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        
+        with mock.patch('apps.products.views.time.time', return_value=AVAILABILITY_CACHE_TIMEOUT * 101):
+            response = self.get(view, '/api/v1/products/prodotto/', slug='prodotto', headers={'HTTP_IF_NONE_MATCH': etag})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_cached_list_hit_and_invalidation(self):
+        """Test risposta servita dalla cache e ricostruita dopo una modifica"""
+        view = ProductViewSet.as_view({'get': 'list'})
+        self.get(view, '/api/v1/products/')
+        with self.assertNumQueries(0):
+            response = self.get(view, '/api/v1/products/')
+        self.assertEqual([product['name'] for product in response.data['results']], ['Prodotto'])
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.name = 'Prodotto rinominato'
+            self.product.save()
+        response = self.get(view, '/api/v1/products/')
+        self.assertEqual([product['name'] for product in response.data['results']], ['Prodotto rinominato'])
+    
+    def test_cache_key_includes_host(self):
+        """Test che gli URL assoluti in cache non passino da un host all'altro"""
+        self.product.main_image = 'products/cache.jpg'
+        self.product.save()
+        view = ProductViewSet.as_view({'get': 'list'})
+        first = self.get(view, '/api/v1/products/', host='localhost')
+        second = self.get(view, '/api/v1/products/', host='testserver')
+        
+        self.assertTrue(first.data['results'][0]['main_image'].startswith('http://localhost/'))
+        self.assertTrue(second.data['results'][0]['main_image'].startswith('http://testserver/'))
+
+class StoreConditionalGetTestCase(BaseAPITestCase):
+    """Test per GET condizionali degli endpoint store"""
+    
+    def setUp(self):
+        super().setUp()
+        self.factory = APIRequestFactory(HTTP_HOST='localhost')
+        self.other = Store.objects.create(
+            name='Altro Store', slug='altro-store', address='Via Altra, 2', city='Milano',
+            province='MI', postal_code='20121'
+        )
+        self.view = StoreViewSet.as_view({'get': 'list'})
+    
+    def get(self, **headers):
+        response = self.view(self.factory.get('/api/v1/stores/', **headers))
+        if hasattr(response, 'render'):
+            response.render()
+        return response
+    
+    def test_not_modified_until_change(self):
+        """Test 304 con ETag invariato, 200 dopo modifica ed eliminazione"""
+        first = self.get()
+        self.assertNotIn('Last-Modified', first)
+        etag = first['ETag']
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_304_NOT_MODIFIED)
+        
+        self.other.name = 'Store rinominato'
+        self.other.save()
+        changed = self.get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(changed.status_code, status.HTTP_200_OK)
+        
+        etag = changed['ETag']
+        self.other.delete()
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            self.get(HTTP_IF_MODIFIED_SINCE='Fri, 01 Jan 2100 00:00:00 GMT').status_code, status.HTTP_200_OK
+        )
+
+class TieredCacheTestCase(SimpleTestCase):
+    """Test per LRU locale, backend Redis a due livelli e cache versionata per app"""
+    
+    def test_local_lru_eviction_and_expiry(self):
+        """Test espulsione della chiave meno usata e scadenza della copia locale"""
+        lru = LocalLRU(max_entries=2, timeout=5)
+        with mock.patch('apps.common.cache.time.monotonic', return_value=100):
+            lru.set('a', 1)
+            lru.set('b', 2)
+            lru.get('a')
+            lru.set('c', 3, timeout=1)
+            self.assertEqual([lru.get(key) for key in 'abc'], [1, _MISSING, 3])
+        with mock.patch('apps.common.cache.time.monotonic', return_value=102):
+            self.assertEqual([lru.get(key) for key in 'ac'], [1, _MISSING])
+    
+    def test_fallback_when_redis_is_down(self):
+        """Test cache locmem di riserva se Redis non risponde"""
+        cache = TieredRedisCache('redis://127.0.0.1:1/0', {'OPTIONS': {'socket_connect_timeout': 0.1}})
+        cache.set('chiave', 'valore', 60)
+        
+        self.assertTrue(cache.is_degraded)
+        self.assertEqual(cache.get('chiave'), 'valore')
+        self.assertEqual(cache.get_many(['chiave', 'altra']), {'chiave': 'valore'})
+    
+    @skipUnless(fakeredis, 'fakeredis non installato')
+    def test_local_copy_respects_remote_ttl_and_invalidation(self):
+        """Test copia locale limitata alla durata su Redis e versioni sempre lette da Redis"""
+        server = fakeredis.FakeServer()
+        connection_class = getattr(fakeredis, 'FakeRedisConnection', None) or fakeredis.FakeConnection
+        params = {'OPTIONS': {'connection_class': connection_class, 'server': server, 'LOCAL_TIMEOUT': 5}}
+        worker, other = (TieredRedisCache('redis://localhost:6379/0', params) for _ in range(2))
+        
+        other.set('breve', 'valore', 1)
+        with mock.patch('apps.common.cache.time.monotonic', return_value=100):
+            self.assertEqual(worker.get('breve'), 'valore')
+        _, expires_at = worker._local._data[worker.make_and_validate_key('breve')]
+        self.assertLessEqual(expires_at, 101)
+        
+        other.set('model-version:products.product', 1, None)
+        self.assertEqual(worker.get('model-version:products.product'), 1)
+        other.incr('model-version:products.product')
+        self.assertEqual(worker.get('model-version:products.product'), 2)
+        other.delete('model-version:products.product')
+        self.assertIsNone(worker.get('model-version:products.product'))
+    
+    def test_app_cache_version(self):
+        """Test che incrementare la versione dell'app invalidi solo le sue chiavi"""
+        caches['default'].clear()
+        app_cache('products').set('chiave', 'prodotti')
+        app_cache('stores').set('chiave', 'negozi')
+        
+        with self.settings(CACHE_APP_VERSIONS={'products': 2, 'stores': 1}):
+            self.assertIsNone(app_cache('products').get('chiave'))
+            self.assertEqual(app_cache('stores').get('chiave'), 'negozi')
+
+class AutocompleteIndexTestCase(BaseAPITestCase):
+    """Test per indice di prefissi dei suggerimenti di ricerca"""
+    
+    def setUp(self):
+        super().setUp()
+        caches['default'].clear()
+        self.brand.name = 'Ray-Ban'
+        self.brand.save()
+        self.aviator = Product.objects.create(
+            sku='RB3025', name='Aviator Classic', slug='aviator-classic',
+            category=self.category, brand=self.brand, product_type='sunglasses', price=150
+        )
+        Product.objects.create(
+            sku='RB2140', name='Wayfarer', slug='wayfarer',
+            category=self.category, brand=self.brand, product_type='sunglasses', price=140, is_active=False
+        )
+    
+    def titles(self, suggestions):
+        return [suggestion['title'] for suggestion in suggestions]
+    
+    @skipUnless(fakeredis, 'fakeredis non installato')
+    def test_rebuild_and_incremental_updates(self):
+        """Test ricostruzione, prefissi su ogni parola e SKU, aggiornamento e rimozione incrementali"""
+        with mock.patch.object(autocomplete_index, 'client', return_value=fakeredis.FakeRedis()):
+            self.assertIsNone(autocomplete_index.suggest('avi'))
+            self.assertEqual(autocomplete_index.rebuild(), 2)
+            
+            self.assertEqual(self.titles(autocomplete_index.suggest('classic')), ['Aviator Classic'])
+            self.assertEqual(self.titles(autocomplete_index.suggest('rb30')), ['Aviator Classic'])
+            self.assertEqual(self.titles(autocomplete_index.suggest('ray')), ['Ray-Ban'])
+            self.assertEqual(autocomplete_index.suggest('wayf'), [])
+            
+            with self.captureOnCommitCallbacks(execute=True):
+                self.aviator.name = 'Pilot Gold'
+                self.aviator.save()
+            self.assertEqual(autocomplete_index.suggest('aviator'), [])
+            self.assertEqual(self.titles(autocomplete_index.suggest('gold')), ['Pilot Gold'])
+            
+            with self.captureOnCommitCallbacks(execute=True):
+                self.aviator.delete()
+            self.assertEqual(autocomplete_index.suggest('pilot'), [])
+    
+    def test_cold_index_falls_back_to_database(self):
+        """Test suggerimenti dal database e ricostruzione accodata senza indice"""
+        view = ProductViewSet.as_view({'get': 'search_suggestions'})
+        request = APIRequestFactory(HTTP_HOST='localhost').get('/api/v1/products/search_suggestions/', {'q': 'avia'})
+        with mock.patch('apps.products.views.schedule_autocomplete_rebuild') as schedule:
+            response = view(request)
+        
+        self.assertEqual(self.titles(response.data), ['Aviator Classic'])
+        schedule.assert_called_once_with()
+
+class ProductSearchTestCase(BaseAPITestCase):
+    """Test per ricerca prodotti: full-text, fallback trigram, ILIKE fuori da PostgreSQL"""
+    
+    def setUp(self):
+        super().setUp()
+        caches['default'].clear()
+        self.brand.name = 'Ray-Ban'
+        self.brand.save()
+        persol = Brand.objects.create(name='Persol', slug='persol')
+        for sku, name, brand, description in (
+            ('RB3025', 'Aviator Classic', self.brand, ''),
+            ('RB2140', 'Wayfarer', self.brand, ''),
+            ('PO0649', 'Pilot', persol, 'Montatura in stile aviator'),
+        ):
+            Product.objects.create(
+                sku=sku, name=name, slug=sku.lower(), short_description=description,
+                category=self.category, brand=brand, product_type='sunglasses', price=150
+            )
+    
+    def search(self, query, **params):
+        request = APIRequestFactory(HTTP_HOST='localhost').get('/api/v1/products/', {'search': query, **params})
+        response = ProductViewSet.as_view({'get': 'list'})(request)
+        return [product['name'] for product in response.data['results']]
+    
+    @skipIf(connection.vendor == 'postgresql', 'ricerca standard solo fuori da PostgreSQL')
+    def test_search_without_postgres(self):
+        """Test ricerca ILIKE sui search_fields"""
+        self.assertEqual(self.search('wayf'), ['Wayfarer'])
+        self.assertEqual(self.search('ray-ban', ordering='name'), ['Aviator Classic', 'Wayfarer'])
+    
+    @skipUnless(connection.vendor == 'postgresql', 'full-text e trigram richiedono PostgreSQL')
+    def test_full_text_ranked_by_weight(self):
+        """Test rilevanza: nome (A) prima della descrizione (C), ordinamento esplicito rispettato"""
+        self.assertEqual(self.search('aviator'), ['Aviator Classic', 'Pilot'])
+        self.assertEqual(self.search('aviator', ordering='-name'), ['Pilot', 'Aviator Classic'])
+    
+    @skipUnless(connection.vendor == 'postgresql', 'full-text e trigram richiedono PostgreSQL')
+    def test_trigram_fallback_on_typo(self):
+        """Test similarità trigram sul brand quando il full-text non trova nulla"""
+        self.assertEqual(sorted(self.search('Ray-Bam')), ['Aviator Classic', 'Wayfarer'])
+
+class AttributeFilterTestCase(BaseAPITestCase):
+    """Test per filtri su specifiche prodotto e attributi variante"""
+    
+    def setUp(self):
+        super().setUp()
+        caches['default'].clear()
+        for sku, material, variants in (
+            ('ACE1', 'acetato', [({'color': 'nero', 'size': '52'}, True)]),
+            ('ACE2', 'acetato', [({'color': 'nero', 'size': '50'}, False), ({'color': 'blu', 'size': '52'}, True)]),
+            ('MET1', 'metallo', [({'color': 'nero', 'size': '52'}, True)]),
+        ):
+            product = Product.objects.create(
+                sku=sku, name=sku, slug=sku.lower(), specifications={'frame_material': material},
+                category=self.category, brand=self.brand, product_type='glasses', price=100
+            )
+            for n, (attributes, is_active) in enumerate(variants):
+                ProductVariant.objects.create(
+                    product=product, sku=f'{sku}-{n}', name=f'Variante {n}', attributes=attributes, is_active=is_active
+                )
+    
+    def test_requested_attributes_from_whitelist(self):
+        """Test raggruppamento per sorgente, valori separati da virgola, attributi non filtrabili ignorati"""
+        params = QueryDict('optical_frame_material=acetato&optical_color=nero,blu&optical_color=nero&optical_price=1')
+        self.assertEqual(requested_attributes(params), {
+            'specifications': {'frame_material': ['acetato']},
+            'variant': {'color': ['blu', 'nero']},
+        })
+        self.assertEqual(
+            containment_condition('attributes', {'size': ['52'], 'color': ['blu', 'nero']}),
+            Q(attributes__contains={'size': '52'})
+            & (Q(attributes__contains={'color': 'blu'}) | Q(attributes__contains={'color': 'nero'}))
+        )
+    
+    @skipUnless(connection.vendor == 'postgresql', 'contenimento JSON (@>) richiede PostgreSQL')
+    def test_same_active_variant_must_match(self):
+        """Test filtro combinato: specifiche del prodotto e attributi di una stessa variante attiva"""
+        view = ProductViewSet.as_view({'get': 'list'})
+        
+        def skus(query):
+            request = APIRequestFactory(HTTP_HOST='localhost').get(f'/api/v1/products/?{query}&ordering=sku')
+            return [product['sku'] for product in view(request).data['results']]
+        
+        self.assertEqual(skus('optical_frame_material=acetato'), ['ACE1', 'ACE2'])
+        self.assertEqual(skus('optical_frame_material=acetato&optical_color=nero'), ['ACE1'])
+        self.assertEqual(skus('optical_color=nero&optical_size=50'), [])
+        self.assertEqual(skus('optical_color=nero,blu&optical_size=52'), ['ACE1', 'ACE2', 'MET1'])
+
+class ProductFacetsTestCase(BaseAPITestCase):
+    """Test per conteggi delle faccette prodotto"""
+    
+    def setUp(self):
+        super().setUp()
+        caches['default'].clear()
+        persol = Brand.objects.create(name='Persol', slug='persol')
+        for sku, brand, product_type, specifications, colors in (
+            ('F1', self.brand, 'glasses', {'frame_material': 'acetato'}, ['nero', 'blu']),
+            ('F2', self.brand, 'sunglasses', {'frame_material': 'acetato', 'lens_type': 'polarizzate'}, ['nero']),
+            ('F3', persol, 'sunglasses', {'frame_material': 'metallo'}, []),
+        ):
+            product = Product.objects.create(
+                sku=sku, name=sku, slug=sku.lower(), specifications=specifications,
+                category=self.category, brand=brand, product_type=product_type, price=100
+            )
+            for color in colors:
+                ProductVariant.objects.create(product=product, sku=f'{sku}-{color}', name=color, attributes={'color': color})
+    
+    def test_facet_counts(self):
+        """Test conteggi per brand, tipo e attributi, anche sui risultati filtrati"""
+        view = ProductViewSet.as_view({'get': 'facets'})
+        request = APIRequestFactory(HTTP_HOST='localhost').get('/api/v1/products/facets/')
+        facets = view(request).data
+        
+        self.assertEqual(
+            [(brand['slug'], brand['count']) for brand in facets['brands']], [('test-brand', 2), ('persol', 1)]
+        )
+        self.assertEqual([category['count'] for category in facets['categories']], [3])
+        self.assertEqual(
+            {item['value']: item['count'] for item in facets['product_types']}, {'sunglasses': 2, 'glasses': 1}
+        )
+        self.assertEqual(
+            {item['value']: item['count'] for item in facets['attributes']['frame_material']},
+            {'acetato': 2, 'metallo': 1}
+        )
+        self.assertEqual(facets['attributes']['lens_type'], [{'value': 'polarizzate', 'count': 1}])
+        self.assertEqual(
+            {item['value']: item['count'] for item in facets['attributes']['color']}, {'nero': 2, 'blu': 1}
+        )
+        
+        request = APIRequestFactory(HTTP_HOST='localhost').get('/api/v1/products/facets/', {'brand__slug': 'persol'})
+        facets = view(request).data
+        self.assertEqual([(brand['slug'], brand['count']) for brand in facets['brands']], [('persol', 1)])
+        self.assertEqual(facets['attributes']['color'], [])
+    
+    def test_grouping_sets_rows(self):
+        """Test classificazione delle righe GROUPING SETS: un insieme per riga, attributi assenti ignorati"""
+        rows = [
+            ('test-brand', 'Test Brand', None, None, None, None, None, 2),
+            (None, None, 'test-category', 'Test Category', None, None, None, 3),
+            (None, None, None, None, 'sunglasses', None, None, 2),
+            (None, None, None, None, None, 'acetato', None, 2),
+            (None, None, None, None, None, None, None, 1),
+            (None, None, None, None, None, None, 'polarizzate', 1),
+        ]
+        fake_connection = mock.MagicMock()
+        fake_connection.cursor.return_value.__enter__.return_value.fetchall.return_value = rows
+        base = Product.objects.annotate(
+            f_brand_slug=F('brand__slug'), f_brand_name=F('brand__name'),
+            f_category_slug=F('category__slug'), f_category_name=F('category__name'),
+        )
+        with mock.patch('apps.products.facets.connection', fake_connection):
+            counts = _grouped_counts(base, ['frame_material', 'lens_type'])
+        
+        self.assertEqual(counts['brand'], {('test-brand', 'Test Brand'): 2})
+        self.assertEqual(counts['category'], {('test-category', 'Test Category'): 3})
+        self.assertEqual(counts['product_type'], {'sunglasses': 2})
+        self.assertEqual(counts['frame_material'], {'acetato': 2})
+        self.assertEqual(counts['lens_type'], {'polarizzate': 1})
+        sql = fake_connection.cursor.return_value.__enter__.return_value.execute.call_args.args[0]
+        self.assertIn("GROUPING SETS", sql)
+        self.assertIn("(p.specifications ->> 'lens_type')", sql)
+
+class InstrumentationMiddlewareTestCase(TestCase):
+    """Test per la strumentazione delle richieste"""
+    
+    def setUp(self):
+        view_stats.reset()
+    
+    def test_records_queries_and_server_timing(self):
+        """Query contate, header Server-Timing e istogramma per vista"""
+        def view(request):
+            list(User.objects.all())
+            list(Store.objects.all())
+            return HttpResponse('ok')
+        
+        middleware = InstrumentationMiddleware(view)
+        response = middleware(RequestFactory().get('/api/test/'))
+        
+        self.assertIn('db;', response['Server-Timing'])
+        self.assertIn('"2 queries"', response['Server-Timing'])
+        stats = view_stats.snapshot('<unresolved>')['<unresolved>']
+        self.assertEqual(stats['requests'], 1)
+        self.assertEqual(stats['max_db_queries'], 2)
+
+class QueryBudgetTestCase(TestCase):
+    """Test per il rilevamento N+1"""
+    
+    def test_normalize_sql(self):
+        """Letterali e liste IN non distinguono le forme"""
+        self.assertEqual(
+            normalize_sql("SELECT * FROM t WHERE id = 1 AND name = 'a'"),
+            normalize_sql("SELECT * FROM t WHERE id = 25 AND name = 'b''c'"),
+        )
+        self.assertEqual(
+            normalize_sql('SELECT * FROM t WHERE id IN (%s, %s)'),
+            normalize_sql('SELECT * FROM t WHERE id IN (%s, %s, %s)'),
+        )
+    
+    def test_budget_exceeded_lists_repeated_shapes(self):
+        """Il superamento del budget riporta la forma ripetuta"""
+        with self.assertRaisesMessage(AssertionError, 'x4'):
+            with query_budget(2, label='n+1'):
+                for pk in range(4):
+                    Store.objects.filter(pk=pk).exists()
+
+class RateLimitPolicyTestCase(TestCase):
+    """Test per IP client e whitelist del rate limiting"""
+    
+    def test_forwarded_for_only_from_trusted_proxies(self):
+        """X-Forwarded-For ignorato senza proxy fidato, hop più a destra non fidato altrimenti"""
+        policy = RateLimitPolicy({'whitelist': ['127.0.0.1'], 'trusted_proxies': ['172.18.0.0/16']})
+        
+        ip = policy.client_ip('203.0.113.9', '127.0.0.1')
+        self.assertEqual(ip, '203.0.113.9')
+        self.assertFalse(policy.is_whitelisted(ip))
+        
+        ip = policy.client_ip('172.18.0.5', '127.0.0.1, 203.0.113.9')
+        self.assertEqual(ip, '203.0.113.9')
+        self.assertFalse(policy.is_whitelisted(ip))
+        self.assertEqual(policy.client_ip('172.18.0.5', '198.51.100.1, 172.18.0.7'), '198.51.100.1')
@@ -1,4 +1,5 @@
 import uuid
+import json
 import hashlib
 from decimal import Decimal
 from typing import Dict, Any, Optional
@@ -11,9 +12,14 @@ def generate_sku() -> str:
     """Genera un SKU univoco"""
     return f"OC{uuid.uuid4().hex[:8].upper()}"
 
-def generate_order_number() -> str:
-    """Genera numero ordine univoco"""
-    return f"ORD{uuid.uuid4().hex[:10].upper()}"
+def generate_order_number(prefix: str = 'ORD', length: int = 10) -> str:
+    """Genera numero ordine univoco: prefisso seguito da length cifre esadecimali"""
+    return f"{prefix}{uuid.uuid4().hex[:length].upper()}"
+
+def payload_hash(data: Any) -> str:
+    """Hash SHA-256 stabile di un payload JSON (chiavi ordinate)"""
+    serialized = json.dumps(data, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(serialized.encode('utf-8')).hexdigest()
 
 def calculate_tax(amount: Decimal, rate: Decimal = Decimal('0.22')) -> Decimal:
     """Calcola tasse (IVA italiana 22% default)"""
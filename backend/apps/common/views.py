@@ -0,0 +1,23 @@
+from rest_framework import status
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from .instrumentation import view_stats
+
+
+@api_view(['GET', 'DELETE'])
+@permission_classes([IsAdminUser])
+def performance_stats(request):
+    """
+    Istogrammi di latenza per vista raccolti da InstrumentationMiddleware.
+
+    I dati sono del singolo processo worker che risponde. ?view=<nome>
+    filtra una vista; DELETE azzera le statistiche.
+    """
+    if request.method == 'DELETE':
+        view_stats.reset()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    return Response({
+        'views': view_stats.snapshot(request.query_params.get('view')),
+    })
@@ -0,0 +1,395 @@
+import logging
+from typing import Dict, List, Any, Iterable, Iterator, Optional
+from decimal import Decimal
+from django.db import transaction, DatabaseError
+from django.utils import timezone
+from apps.products.models import Product, ProductVariant, Brand, Category
+from apps.inventory.ledger import append_movements
+from apps.inventory.models import StoreInventory, InventoryMovement
+from apps.stores.models import Store
+from apps.common.utils import payload_hash
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 500
+
+
+def chunked(iterable: Iterable, size: int) -> Iterator[List]:
+    """Suddivide un iterabile in liste di lunghezza massima `size`"""
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _slug_from_name(name: str) -> str:
+    return name.lower().replace(' ', '-')
+
+
+class SyncResult:
+    """Contatori e messaggi accumulati durante una sincronizzazione"""
+
+    def __init__(self):
+        self.success = 0
+        self.failed = 0
+        self.messages: List[str] = []
+
+    def ok(self, message: Optional[str] = None):
+        self.success += 1
+        if message:
+            self.messages.append(message)
+
+    def error(self, message: str, count: int = 1):
+        self.failed += count
+        self.messages.append(message)
+        logger.error(message)
+
+
+class ProductBulkUpserter:
+    """
+    Upsert massivo dei prodotti provenienti dal gestionale.
+
+    Categorie e brand vengono precaricati una sola volta, i prodotti esistenti
+    vengono letti con una query per chunk e confrontati con i dati in arrivo:
+    solo le righe nuove o modificate vengono scritte con bulk_create/bulk_update.
+    """
+
+    def __init__(self, batch_size: int = DEFAULT_BATCH_SIZE):
+        self.batch_size = max(1, int(batch_size))
+        self.categories: Dict[str, Category] = {}
+        self.brands: Dict[str, Brand] = {}
+
+    def run(self, products_data: Iterable[Dict], result: Optional[SyncResult] = None) -> SyncResult:
+        result = result or SyncResult()
+        self._preload_lookups()
+
+        for chunk in chunked(products_data, self.batch_size):
+            self._process_chunk(chunk, result)
+
+        return result
+
+    def _preload_lookups(self):
+        """Carica categorie e brand in memoria, indicizzati per nome"""
+        self.categories = {c.name: c for c in Category.objects.all()}
+        self.brands = {b.name: b for b in Brand.objects.all()}
+
+    def _ensure_lookups(self, chunk: List[Dict]):
+        """Crea in blocco categorie e brand mancanti per il chunk"""
+        missing_categories = {
+            row.get('category', 'Senza Categoria') for row in chunk
+        } - set(self.categories)
+        missing_brands = {
+            row.get('brand', 'Generico') for row in chunk
+        } - set(self.brands)
+
+        if missing_categories:
+            Category.objects.bulk_create(
+                [Category(name=name, slug=_slug_from_name(name)) for name in missing_categories],
+                ignore_conflicts=True
+            )
+            for category in Category.objects.filter(name__in=missing_categories):
+                self.categories[category.name] = category
+
+        if missing_brands:
+            Brand.objects.bulk_create(
+                [Brand(name=name, slug=_slug_from_name(name)) for name in missing_brands],
+                ignore_conflicts=True
+            )
+            for brand in Brand.objects.filter(name__in=missing_brands):
+                self.brands[brand.name] = brand
+
+    def map_row(self, external_data: Dict) -> Dict[str, Any]:
+        """Mappa dati prodotto dal formato gestionale al formato interno"""
+        category_name = external_data.get('category', 'Senza Categoria')
+        brand_name = external_data.get('brand', 'Generico')
+
+        category = self.categories.get(category_name)
+        if category is None:
+            raise ValueError(f"Categoria '{category_name}' non disponibile")
+        brand = self.brands.get(brand_name)
+        if brand is None:
+            raise ValueError(f"Brand '{brand_name}' non disponibile")
+
+        weight = external_data.get('weight')
+        return {
+            'sku': external_data['sku'],
+            'name': external_data['name'],
+            'slug': _slug_from_name(external_data['name']),
+            'description': external_data.get('description', ''),
+            'short_description': external_data.get('short_description', ''),
+            'category': category,
+            'brand': brand,
+            'product_type': external_data.get('product_type', 'glasses'),
+            'price': Decimal(str(external_data.get('price', 0))),
+            'cost_price': Decimal(str(external_data.get('cost_price', 0))),
+            'specifications': external_data.get('attributes', {}),
+            'is_active': external_data.get('active', True),
+            'weight': Decimal(str(weight)) if weight is not None else None,
+        }
+
+    @staticmethod
+    def _differs(product: Product, field: str, value: Any) -> bool:
+        # Le FK si confrontano per id per non innescare query
+        if field in ('category', 'brand'):
+            return getattr(product, f'{field}_id') != value.pk
+        return getattr(product, field) != value
+
+    def _process_chunk(self, chunk: List[Dict], result: SyncResult):
+        self._ensure_lookups(chunk)
+
+        skus = [row.get('sku') for row in chunk if row.get('sku')]
+        existing = Product.objects.order_by().in_bulk(skus, field_name='sku')
+
+        to_create: Dict[str, Product] = {}
+        to_update: Dict[str, Product] = {}
+        update_fields = set()
+        pending = []  # (sku, messaggio) da confermare dopo la scrittura
+
+        for row in chunk:
+            # Payload identico all'ultima sync: nessun mapping né scrittura
+            row_hash = payload_hash(row)
+            current = existing.get(row.get('sku'))
+            if current is not None and current.source_hash == row_hash \
+                    and row['sku'] not in to_update:
+                pending.append((row['sku'], None))
+                continue
+
+            try:
+                mapped = self.map_row(row)
+            except Exception as e:
+                result.error(f"Errore prodotto {row.get('sku', 'N/A')}: {str(e)}")
+                continue
+
+            mapped['source_hash'] = row_hash
+            sku = mapped['sku']
+            product = existing.get(sku) or to_create.get(sku)
+
+            if product is None:
+                to_create[sku] = Product(**mapped)
+                pending.append((sku, f"Prodotto {sku} creato"))
+                continue
+
+            changed = [
+                field for field, value in mapped.items()
+                if self._differs(product, field, value)
+            ]
+            for field in changed:
+                setattr(product, field, mapped[field])
+
+            if sku in to_create:
+                pending.append((sku, f"Prodotto {sku} creato"))
+            elif changed:
+                to_update[sku] = product
+                update_fields.update(changed)
+                pending.append((sku, f"Prodotto {sku} aggiornato"))
+            else:
+                # Nessuna differenza: nessuna scrittura
+                pending.append((sku, None))
+
+        try:
+            self._write(list(to_create.values()), list(to_update.values()), update_fields)
+        except DatabaseError as e:
+            logger.warning(f"Scrittura bulk fallita ({e}), riprovo riga per riga")
+            self._write_rowwise(to_create, to_update, update_fields, pending, result)
+            return
+
+        for _, message in pending:
+            result.ok(message)
+
+    def _write(self, to_create: List[Product], to_update: List[Product], update_fields: set):
+        """Scrive un chunk in un'unica transazione"""
+        if not to_create and not to_update:
+            return
+
+        with transaction.atomic():
+            if to_create:
+                Product.objects.bulk_create(to_create, batch_size=self.batch_size)
+            if to_update:
+                now = timezone.now()
+                for product in to_update:
+                    product.updated_at = now
+                Product.objects.bulk_update(
+                    to_update,
+                    sorted(update_fields | {'updated_at'}),
+                    batch_size=self.batch_size
+                )
+
+    def _write_rowwise(self, to_create, to_update, update_fields, pending, result: SyncResult):
+        """Fallback: isola le righe che violano vincoli del database"""
+        errors = {}
+        for sku, product in list(to_create.items()) + list(to_update.items()):
+            try:
+                with transaction.atomic():
+                    if sku in to_create:
+                        product.pk = None
+                        product.save(force_insert=True)
+                    else:
+                        product.save(update_fields=sorted(update_fields | {'updated_at'}))
+            except DatabaseError as e:
+                errors[sku] = f"Errore prodotto {sku}: {str(e)}"
+
+        for sku, message in pending:
+            if sku in errors:
+                result.error(errors[sku])
+            else:
+                result.ok(message)
+
+
+class InventoryReconciler:
+    """
+    Riconciliazione set-based dell'inventario con il feed del gestionale.
+
+    Per ogni chunk del feed le righe StoreInventory correnti vengono caricate
+    in memoria indicizzate per (store, product, variant); il delta viene
+    calcolato in un solo passaggio e applicato con scritture bulk insieme ai
+    relativi movimenti di rettifica. Le righe invariate non vengono toccate.
+    """
+
+    UPDATE_FIELDS = ['quantity', 'store_price', 'is_online_available', 'last_restocked', 'updated_at']
+
+    def __init__(self, batch_size: int = DEFAULT_BATCH_SIZE):
+        self.batch_size = max(1, int(batch_size))
+        self.stores: Dict[str, Store] = {}
+
+    def run(self, inventory_data: Iterable[Dict], result: Optional[SyncResult] = None) -> SyncResult:
+        result = result or SyncResult()
+        self.stores = Store.objects.in_bulk(field_name='slug')
+
+        for chunk in chunked(inventory_data, self.batch_size):
+            self._process_chunk(chunk, result)
+
+        return result
+
+    def _load_chunk(self, chunk: List[Dict]):
+        """Carica prodotti, varianti e inventario corrente per il chunk"""
+        products = Product.objects.order_by().in_bulk(
+            {row.get('product_sku') for row in chunk if row.get('product_sku')},
+            field_name='sku'
+        )
+        variant_skus = {row['variant_sku'] for row in chunk if row.get('variant_sku')}
+        variants = ProductVariant.objects.in_bulk(variant_skus, field_name='sku') if variant_skus else {}
+
+        store_ids = {
+            self.stores[row['store_slug']].pk
+            for row in chunk if row.get('store_slug') in self.stores
+        }
+        current = {
+            (inv.store_id, inv.product_id, inv.variant_id): inv
+            for inv in StoreInventory.objects.filter(
+                store_id__in=store_ids,
+                product_id__in=[p.pk for p in products.values()]
+            )
+        }
+        return products, variants, current
+
+    def _process_chunk(self, chunk: List[Dict], result: SyncResult):
+        products, variants, current = self._load_chunk(chunk)
+        now = timezone.now()
+
+        to_create: Dict[tuple, StoreInventory] = {}
+        to_update: Dict[tuple, StoreInventory] = {}
+        movements: List[InventoryMovement] = []
+        pending: List[Optional[str]] = []
+
+        for row in chunk:
+            sku = row.get('product_sku', 'N/A')
+            product = products.get(row.get('product_sku'))
+            store = self.stores.get(row.get('store_slug'))
+            variant = variants.get(row.get('variant_sku')) if row.get('variant_sku') else None
+
+            if product is None:
+                result.error(f"Errore inventario {sku}: prodotto non trovato")
+                continue
+            if store is None:
+                result.error(f"Errore inventario {sku}: store '{row.get('store_slug')}' non trovato")
+                continue
+            if row.get('variant_sku') and variant is None:
+                result.error(f"Errore inventario {sku}: variante '{row['variant_sku']}' non trovata")
+                continue
+
+            try:
+                quantity = int(row.get('quantity', 0))
+                store_price = Decimal(str(row.get('price', product.price)))
+            except Exception as e:
+                result.error(f"Errore inventario {sku}: {str(e)}")
+                continue
+            online_available = row.get('online_available', True)
+
+            key = (store.pk, product.pk, variant.pk if variant else None)
+            inventory = to_create.get(key) or current.get(key)
+
+            if inventory is None:
+                to_create[key] = StoreInventory(
+                    store=store,
+                    product=product,
+                    variant=variant,
+                    quantity=quantity,
+                    store_price=store_price,
+                    is_online_available=online_available,
+                    last_restocked=now
+                )
+                pending.append(f"Inventario {store.name} - {product.sku} creato")
+                continue
+
+            if (inventory.quantity == quantity
+                    and inventory.store_price == store_price
+                    and inventory.is_online_available == online_available):
+                # Riga invariata: nessuna scrittura
+                pending.append(None)
+                continue
+
+            if key not in to_create and inventory.quantity != quantity:
+                movements.append(InventoryMovement(
+                    store=store,
+                    product=product,
+                    variant=variant,
+                    movement_type='adjustment',
+                    quantity_change=quantity - inventory.quantity,
+                    quantity_after=quantity,
+                    reference_id='sync_gestionale',
+                    notes='Sincronizzazione automatica da gestionale'
+                ))
+
+            inventory.quantity = quantity
+            inventory.store_price = store_price
+            inventory.is_online_available = online_available
+            inventory.last_restocked = now
+            inventory.updated_at = now
+            if key not in to_create:
+                to_update[key] = inventory
+            pending.append(f"Inventario {store.name} - {product.sku} aggiornato")
+
+        # Quantità iniziale delle righe nuove nel registro: lo stock a una data
+        # (apps.inventory.snapshots) si ricostruisce solo da movimenti completi
+        movements.extend(
+            InventoryMovement(
+                store=inventory.store,
+                product=inventory.product,
+                variant=inventory.variant,
+                movement_type='restock',
+                quantity_change=inventory.quantity,
+                quantity_after=inventory.quantity,
+                reference_id='sync_gestionale',
+                notes='Inventario iniziale da gestionale'
+            )
+            for inventory in to_create.values()
+        )
+
+        try:
+            if to_create or to_update or movements:
+                with transaction.atomic():
+                    StoreInventory.objects.bulk_create(to_create.values(), batch_size=self.batch_size)
+                    StoreInventory.objects.bulk_update(
+                        to_update.values(), self.UPDATE_FIELDS, batch_size=self.batch_size
+                    )
+                    append_movements(movements, batch_size=self.batch_size)
+        except DatabaseError as e:
+            result.error(f"Errore inventario: chunk di {len(pending)} righe non applicato: {str(e)}", count=len(pending))
+            return
+
+        for message in pending:
+            result.ok(message)
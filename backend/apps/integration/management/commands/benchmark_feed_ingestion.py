@@ -0,0 +1,104 @@
+import os
+import json
+import time
+import tempfile
+import tracemalloc
+from django.core.management.base import BaseCommand
+from apps.integration.streaming import iter_json_array, iter_ndjson, iter_file_chunks
+
+class Command(BaseCommand):
+    help = 'Benchmark ingestione feed gestionale: json.load vs parsing incrementale'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--records',
+            type=int,
+            default=200000,
+            help='Numero di record del feed generato (default 200000)',
+        )
+        parser.add_argument(
+            '--format',
+            choices=['json', 'ndjson'],
+            default='json',
+            help='Formato del feed generato',
+        )
+        parser.add_argument(
+            '--file',
+            help='Usa un feed esistente invece di generarne uno',
+        )
+        parser.add_argument(
+            '--key',
+            default='products',
+            help="Chiave dell'array nel documento JSON (default 'products')",
+        )
+
+    def handle(self, *args, **options):
+        path = options['file']
+        generated = False
+
+        if not path:
+            path = self.generate_fixture(options['records'], options['format'], options['key'])
+            generated = True
+
+        try:
+            size_mb = os.path.getsize(path) / (1024 * 1024)
+            self.stdout.write(f'Feed: {path} ({size_mb:.1f} MB)')
+
+            is_ndjson = path.endswith('.ndjson')
+            if not is_ndjson:
+                self.report('json.load (payload intero)', lambda: self.run_full_load(path, options['key']))
+            self.report('streaming incrementale', lambda: self.run_streaming(path, options['key'], is_ndjson))
+        finally:
+            if generated:
+                os.remove(path)
+
+    def generate_fixture(self, records, fmt, key):
+        """Genera un feed di prodotti su file temporaneo"""
+        suffix = '.ndjson' if fmt == 'ndjson' else '.json'
+        fd, path = tempfile.mkstemp(suffix=suffix, prefix='feed_')
+        self.stdout.write(f'Generazione feed di {records} record...')
+
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            if fmt == 'json':
+                f.write('{"%s": [' % key)
+            for i in range(records):
+                row = json.dumps({
+                    'sku': f'BENCH{i:08d}',
+                    'name': f'Occhiale da vista modello {i}',
+                    'description': 'Montatura in acetato, lenti antiriflesso. ' * 4,
+                    'category': f'Categoria {i % 20}',
+                    'brand': f'Brand {i % 50}',
+                    'price': 79.9 + i % 300,
+                    'attributes': {'frame_material': 'acetato', 'lens_type': 'progressiva'},
+                })
+                if fmt == 'json':
+                    f.write(row if i == 0 else ',' + row)
+                else:
+                    f.write(row + '\n')
+            if fmt == 'json':
+                f.write(']}')
+
+        return path
+
+    def run_full_load(self, path, key):
+        with open(path, 'rb') as f:
+            return sum(1 for _ in json.load(f)[key])
+
+    def run_streaming(self, path, key, is_ndjson):
+        with open(path, 'rb') as f:
+            chunks = iter_file_chunks(f)
+            records = iter_ndjson(chunks) if is_ndjson else iter_json_array(chunks, key)
+            return sum(1 for _ in records)
+
+    def report(self, label, func):
+        tracemalloc.start()
+        started = time.perf_counter()
+        count = func()
+        elapsed = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{label}: {count} record in {elapsed:.2f}s '
+            f'({count / elapsed:,.0f} rec/s), picco memoria {peak / (1024 * 1024):.1f} MB'
+        ))
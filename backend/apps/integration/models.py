@@ -21,6 +21,15 @@ class IntegrationLog(TimeStampedModel):
     operation_type = models.CharField(max_length=50, choices=OPERATION_TYPES)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     
+    # Sync distribuite: log padre che aggrega i log dei singoli shard
+    parent = models.ForeignKey(
+        'self',
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='children'
+    )
+    
     # Parametri operazione
     parameters = models.JSONField(default=dict, blank=True)
     
@@ -37,9 +46,16 @@ class IntegrationLog(TimeStampedModel):
     started_at = models.DateTimeField(null=True, blank=True)
     completed_at = models.DateTimeField(null=True, blank=True)
     
+    # Latenze richieste HTTP verso il sistema esterno (count, avg, p95, ...)
+    request_metrics = models.JSONField(default=dict, blank=True)
+    
     class Meta:
         db_table = 'integration_logs'
         ordering = ['-created_at']
+        indexes = [
+            # Paginazione keyset (apps.common.pagination.KeysetPagination)
+            models.Index(fields=['created_at', 'id'], name='integration_logs_keyset_idx'),
+        ]
     
     def __str__(self):
         return f"{self.operation_type} - {self.status} ({self.created_at})"
@@ -7,10 +7,10 @@ class IntegrationLogSerializer(serializers.ModelSerializer):
     class Meta:
         model = IntegrationLog
         fields = [
-            'id', 'operation_type', 'status', 'parameters',
+            'id', 'parent', 'operation_type', 'status', 'parameters',
             'records_processed', 'records_success', 'records_failed',
             'log_messages', 'error_details', 'started_at', 'completed_at',
-            'duration', 'created_at'
+            'duration', 'request_metrics', 'created_at'
         ]
     
     def get_duration(self, obj):
@@ -1,16 +1,29 @@
+import time
 import logging
 import requests
-from typing import Dict, List, Any, Optional
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Any, Iterator, Optional
+from django.db import transaction
+from django.db.models import Q, F
 from django.utils import timezone
-from decimal import Decimal
+from django.utils.dateparse import parse_datetime
 from .models import IntegrationLog, ExternalSystemConfig
-from apps.products.models import Product, Brand, Category
-from apps.inventory.models import StoreInventory, InventoryMovement
-from apps.stores.models import Store
 from apps.orders.models import Order
+from apps.common.cache import bump_model_versions
+from apps.products.models import Product
+from apps.products.search import refresh_search_vectors
+from apps.inventory.models import StoreInventory
+from apps.inventory.pricing import refresh_effective_prices
+from apps.products.autocomplete import schedule_autocomplete_rebuild
+from .bulk import ProductBulkUpserter, InventoryReconciler, SyncResult, chunked, DEFAULT_BATCH_SIZE
+from .streaming import iter_json_array, iter_ndjson, DEFAULT_CHUNK_SIZE
+from .transport import build_session, RequestMetrics, RateLimiter, DEFAULT_TIMEOUT
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_EXPORT_CONCURRENCY = 4
+DEFAULT_FULL_SYNC_INTERVAL_HOURS = 24
+
 class BaseIntegrationService:
     """Classe base per servizi di integrazione"""
     
@@ -22,9 +35,19 @@ class BaseIntegrationService:
             )
         except ExternalSystemConfig.DoesNotExist:
             raise ValueError(f"Sistema esterno '{system_name}' non configurato")
+        
+        # Sessione HTTP condivisa: connessioni keep-alive riutilizzate tra richieste
+        self.session = build_session(self.config.config_data)
+        self.timeout = self.config.config_data.get('http_timeout', DEFAULT_TIMEOUT)
+        self.metrics = RequestMetrics()
     
-    def _make_request(self, method: str, endpoint: str, data: Dict = None) -> Dict:
-        """Effettua richiesta HTTP al sistema esterno"""
+    def close(self):
+        """Chiude le connessioni del pool HTTP"""
+        self.session.close()
+    
+    def _send(self, method: str, endpoint: str, data: Dict = None,
+              params: Dict = None, stream: bool = False) -> requests.Response:
+        """Effettua richiesta HTTP al sistema esterno e ritorna la risposta grezza"""
         url = f"{self.config.endpoint_url.rstrip('/')}/{endpoint.lstrip('/')}"
         
         headers = {
@@ -40,24 +63,132 @@ class BaseIntegrationService:
         if self.config.username and self.config.password:
             auth = (self.config.username, self.config.password)
         
+        started = time.perf_counter()
         try:
-            response = requests.request(
+            response = self.session.request(
                 method=method,
                 url=url,
                 json=data,
+                params=params,
                 headers=headers,
                 auth=auth,
-                timeout=30
+                timeout=self.timeout,
+                stream=stream
             )
             response.raise_for_status()
-            return response.json()
+            self.metrics.record((time.perf_counter() - started) * 1000)
+            return response
         
         except requests.RequestException as e:
+            self.metrics.record((time.perf_counter() - started) * 1000, failed=True)
             logger.error(f"Errore richiesta {method} {url}: {e}")
             raise
     
+    def _make_request(self, method: str, endpoint: str, data: Dict = None, params: Dict = None) -> Dict:
+        """Effettua richiesta HTTP al sistema esterno"""
+        return self._send(method, endpoint, data=data, params=params).json()
+    
+    def _iter_records(self, endpoint: str, key: str, params: Dict = None) -> Iterator[Dict]:
+        """
+        Itera i record di un feed senza caricarlo interamente in memoria.
+        
+        La modalità si configura con config_data['feed_mode']:
+        - 'stream' (default): parsing incrementale del body JSON o NDJSON
+        - 'page': paginazione ?page=N&page_size=M
+        - 'cursor': paginazione ?cursor=... seguendo 'next_cursor'
+        """
+        mode = self.config.config_data.get('feed_mode', 'stream')
+        params = dict(params or {})
+        
+        if mode == 'page':
+            page_size = self.config.config_data.get('page_size', DEFAULT_BATCH_SIZE)
+            page = 1
+            while True:
+                response = self._make_request(
+                    'GET', endpoint, params={**params, 'page': page, 'page_size': page_size}
+                )
+                records = self._records(response, key)
+                yield from records
+                if not records or ('next' in response and not response['next']):
+                    return
+                page += 1
+        
+        elif mode == 'cursor':
+            cursor = None
+            while True:
+                page_params = {**params, 'cursor': cursor} if cursor else params
+                response = self._make_request('GET', endpoint, params=page_params)
+                yield from self._records(response, key)
+                cursor = response.get('next_cursor')
+                if not cursor:
+                    return
+        
+        else:
+            response = self._send('GET', endpoint, params=params, stream=True)
+            try:
+                chunks = response.iter_content(chunk_size=DEFAULT_CHUNK_SIZE)
+                if 'ndjson' in response.headers.get('Content-Type', ''):
+                    yield from iter_ndjson(chunks)
+                else:
+                    yield from iter_json_array(chunks, key)
+            finally:
+                response.close()
+    
+    @staticmethod
+    def _records(response: Dict, key: str) -> List[Dict]:
+        """Record di una pagina: una risposta senza la chiave è un errore, non una pagina vuota"""
+        if key not in response:
+            raise ValueError(f"Chiave '{key}' non trovata nella risposta")
+        return response[key]
+    
+    def _delta_params(self, watermark_key: str, full: bool = False) -> Dict:
+        """
+        Parametri per una sync delta ({'updated_since': ...}).
+        
+        Ritorna un dict vuoto (sync completa) se richiesto esplicitamente, se
+        non esiste ancora un watermark o se l'ultima sync completa è più
+        vecchia di config_data['full_sync_interval_hours'] (default 24).
+        """
+        config_data = self.config.config_data
+        watermark = config_data.get('sync_watermarks', {}).get(watermark_key)
+        
+        if full or not config_data.get('delta_sync', True) or not watermark:
+            return {}
+        
+        interval = timezone.timedelta(
+            hours=config_data.get('full_sync_interval_hours', DEFAULT_FULL_SYNC_INTERVAL_HOURS)
+        )
+        last_full = parse_datetime(watermark.get('last_full', ''))
+        if not last_full or timezone.now() - last_full >= interval:
+            return {}
+        
+        return {'updated_since': watermark['updated_since']}
+    
+    def _save_watermark(self, watermark_key: str, started_at, full: bool):
+        """
+        Avanza il watermark della sync e ExternalSystemConfig.last_sync.
+        
+        Shard e sync prodotti girano in parallelo: il read-modify-write avviene
+        sulla riga riletta sotto lock, così non si sovrascrivono i watermark
+        degli altri né le modifiche a config_data fatte durante la sync.
+        """
+        with transaction.atomic():
+            config = ExternalSystemConfig.objects.select_for_update().get(pk=self.config.pk)
+            watermarks = config.config_data.setdefault('sync_watermarks', {})
+            entry = watermarks.setdefault(watermark_key, {})
+            # Si usa l'inizio della sync: le modifiche avvenute durante verranno riprese
+            entry['updated_since'] = started_at.isoformat()
+            if full:
+                entry['last_full'] = started_at.isoformat()
+            
+            if config.last_sync is None or config.last_sync < started_at:
+                config.last_sync = started_at
+            config.save(update_fields=['config_data', 'last_sync', 'updated_at'])
+        self.config = config
+    
     def _log_operation(self, operation_type: str, **kwargs) -> IntegrationLog:
         """Crea log operazione"""
+        self.metrics.reset()
         return IntegrationLog.objects.create(
             operation_type=operation_type,
             started_at=timezone.now(),
@@ -68,6 +199,7 @@ class BaseIntegrationService:
         """Aggiorna log operazione"""
         log.status = status
         log.completed_at = timezone.now()
+        log.request_metrics = self.metrics.summary()
         
         for field, value in kwargs.items():
             setattr(log, field, value)
@@ -77,48 +209,40 @@ class BaseIntegrationService:
 class GestionaleIntegrationService(BaseIntegrationService):
     """Servizio integrazione con gestionale aziendale"""
     
-    def sync_products(self) -> IntegrationLog:
-        """Sincronizza prodotti dal gestionale"""
-        log = self._log_operation('sync_products', status='running')
+    def sync_products(self, batch_size: Optional[int] = None, full: bool = False) -> IntegrationLog:
+        """Sincronizza prodotti dal gestionale in modalità batch (delta se possibile)"""
+        params = self._delta_params('sync_products', full)
+        log = self._log_operation('sync_products', parameters=params, status='running')
         
         try:
-            # Recupera prodotti dal gestionale
-            response = self._make_request('GET', '/api/products')
-            products_data = response.get('products', [])
+            # Recupera prodotti dal gestionale in streaming
+            products_data = self._iter_records('/api/products', 'products', params)
             
-            log.records_processed = len(products_data)
-            success_count = 0
-            failed_count = 0
-            messages = []
+            # Dimensione chunk: parametro esplicito o config_data del sistema esterno
+            batch_size = batch_size or self.config.config_data.get('batch_size', DEFAULT_BATCH_SIZE)
+            result = ProductBulkUpserter(batch_size).run(products_data)
             
-            for product_data in products_data:
-                try:
-                    # Mappa dati prodotto
-                    mapped_data = self._map_product_data(product_data)
-                    
-                    # Crea o aggiorna prodotto
-                    product, created = Product.objects.update_or_create(
-                        sku=mapped_data['sku'],
-                        defaults=mapped_data
-                    )
-                    
-                    action = "creato" if created else "aggiornato"
-                    messages.append(f"Prodotto {product.sku} {action}")
-                    success_count += 1
-                    
-                except Exception as e:
-                    error_msg = f"Errore prodotto {product_data.get('sku', 'N/A')}: {str(e)}"
-                    messages.append(error_msg)
-                    logger.error(error_msg)
-                    failed_count += 1
+            # bulk_create/bulk_update non inviano segnali: indice di ricerca e cache aggiornati qui
+            changed = list(Product.objects.filter(updated_at__gte=log.started_at).values_list('pk', flat=True))
+            if changed:
+                refresh_search_vectors(Product.objects.filter(pk__in=changed))
+                refresh_effective_prices(changed)
+                bump_model_versions('products.product', 'products.category', 'products.brand')
+                # Una sola ricostruzione alla volta (REBUILD_LOCK_KEY)
+                schedule_autocomplete_rebuild()
             
             self._update_log(
                 log, 'completed',
-                records_success=success_count,
-                records_failed=failed_count,
-                log_messages='\n'.join(messages)
+                records_processed=result.success + result.failed,
+                records_success=result.success,
+                records_failed=result.failed,
+                log_messages='\n'.join(result.messages)
             )
             
+            # Con righe fallite il watermark resta fermo, così verranno ritentate
+            if not result.failed:
+                self._save_watermark('sync_products', log.started_at, full=not params)
+            
         except Exception as e:
             self._update_log(
                 log, 'failed',
@@ -128,77 +252,46 @@ class GestionaleIntegrationService(BaseIntegrationService):
         
         return log
     
-    def sync_inventory(self, store_id: Optional[int] = None) -> IntegrationLog:
-        """Sincronizza inventario dal gestionale"""
-        log = self._log_operation('sync_inventory', parameters={'store_id': store_id}, status='running')
+    def sync_inventory(self, store_id: Optional[int] = None, full: bool = False,
+                       parent_log_id: Optional[int] = None) -> IntegrationLog:
+        """Sincronizza inventario dal gestionale tramite riconciliazione set-based"""
+        watermark_key = f'sync_inventory:{store_id}' if store_id else 'sync_inventory'
+        
+        # Parametri richiesta
+        params = self._delta_params(watermark_key, full)
+        if store_id:
+            params['store_id'] = store_id
+        
+        log = self._log_operation(
+            'sync_inventory',
+            parameters=params,
+            parent_id=parent_log_id,
+            status='running'
+        )
         
         try:
-            # Parametri richiesta
-            params = {}
-            if store_id:
-                params['store_id'] = store_id
+            # Recupera inventario dal gestionale in streaming
+            inventory_data = self._iter_records('/api/inventory', 'inventory', params)
             
-            # Recupera inventario dal gestionale
-            response = self._make_request('GET', '/api/inventory', params)
-            inventory_data = response.get('inventory', [])
-            
-            log.records_processed = len(inventory_data)
-            success_count = 0
-            failed_count = 0
-            messages = []
-            
-            for inv_data in inventory_data:
-                try:
-                    # Trova prodotto e store
-                    product = Product.objects.get(sku=inv_data['product_sku'])
-                    store = Store.objects.get(slug=inv_data['store_slug'])
-                    
-                    # Aggiorna o crea inventario
-                    inventory, created = StoreInventory.objects.update_or_create(
-                        store=store,
-                        product=product,
-                        defaults={
-                            'quantity': inv_data.get('quantity', 0),
-                            'store_price': Decimal(str(inv_data.get('price', product.base_price))),
-                            'is_online_available': inv_data.get('online_available', True),
-                            'last_restocked': timezone.now()
-                        }
-                    )
-                    
-                    # Log movimento se necessario
-                    if not created and inventory.quantity != inv_data.get('quantity', 0):
-                        InventoryMovement.objects.create(
-                            store=store,
-                            product=product,
-                            movement_type='adjustment',
-                            quantity_change=inv_data.get('quantity', 0) - inventory.quantity,
-                            quantity_after=inv_data.get('quantity', 0),
-                            reference_id='sync_gestionale',
-                            notes=f'Sincronizzazione automatica da gestionale'
-                        )
-                    
-                    action = "creato" if created else "aggiornato"
-                    messages.append(f"Inventario {store.name} - {product.sku} {action}")
-                    success_count += 1
-                    
-                except (Product.DoesNotExist, Store.DoesNotExist) as e:
-                    error_msg = f"Errore inventario {inv_data.get('product_sku', 'N/A')}: {str(e)}"
-                    messages.append(error_msg)
-                    failed_count += 1
-                
-                except Exception as e:
-                    error_msg = f"Errore inventario {inv_data.get('product_sku', 'N/A')}: {str(e)}"
-                    messages.append(error_msg)
-                    logger.error(error_msg)
-                    failed_count += 1
+            batch_size = self.config.config_data.get('batch_size', DEFAULT_BATCH_SIZE)
+            result = InventoryReconciler(batch_size).run(inventory_data)
+            refresh_effective_prices(list(
+                StoreInventory.objects.filter(updated_at__gte=log.started_at)
+                .order_by().values_list('product_id', flat=True).distinct()
+            ))
+            bump_model_versions('inventory.storeinventory')
             
             self._update_log(
                 log, 'completed',
-                records_success=success_count,
-                records_failed=failed_count,
-                log_messages='\n'.join(messages)
+                records_processed=result.success + result.failed,
+                records_success=result.success,
+                records_failed=result.failed,
+                log_messages='\n'.join(result.messages)
             )
             
+            if not result.failed:
+                self._save_watermark(watermark_key, log.started_at, full='updated_since' not in params)
+            
         except Exception as e:
             self._update_log(
                 log, 'failed',
@@ -208,58 +301,112 @@ class GestionaleIntegrationService(BaseIntegrationService):
         
         return log
     
-    def export_orders(self, date_from: str = None, date_to: str = None) -> IntegrationLog:
-        """Esporta ordini verso gestionale"""
+    def export_orders(self, date_from: str = None, date_to: str = None,
+                      incremental: bool = True) -> IntegrationLog:
+        """
+        Esporta ordini verso gestionale con parallelismo limitato.
+        
+        In modalità incrementale vengono inviati solo gli ordini mai esportati
+        o modificati dopo l'ultimo export (updated_at > exported_at). Con
+        config_data['export_batch_size'] > 1 gli ordini vengono inviati a
+        gruppi all'endpoint batch del gestionale.
+        """
         log = self._log_operation(
             'export_orders', 
-            parameters={'date_from': date_from, 'date_to': date_to},
+            parameters={'date_from': date_from, 'date_to': date_to, 'incremental': incremental},
             status='running'
         )
         
         try:
-            # Filtra ordini da esportare
+            # Watermark preso prima di leggere gli ordini: una modifica durante
+            # l'export ha updated_at successivo e verrà esportata la volta dopo
+            exported_at = timezone.now()
+            
+            # Filtra ordini da esportare, con tutte le relazioni usate dal mapping
             orders_query = Order.objects.filter(
                 status__in=['confirmed', 'processing']
-            ).select_related('customer', 'store').prefetch_related('items__product')
+            ).select_related(
+                'customer__user', 'store', 'billing_address'
+            ).prefetch_related('items__product')
             
+            if incremental:
+                orders_query = orders_query.filter(
+                    Q(exported_at__isnull=True) | Q(updated_at__gt=F('exported_at'))
+                )
             if date_from:
                 orders_query = orders_query.filter(created_at__gte=date_from)
             if date_to:
                 orders_query = orders_query.filter(created_at__lte=date_to)
             
-            orders = list(orders_query)
+            orders = {order.order_number: order for order in orders_query}
             log.records_processed = len(orders)
             
-            success_count = 0
-            failed_count = 0
-            messages = []
+            result = SyncResult()
             
-            for order in orders:
+            # Il mapping resta nel thread principale: i thread eseguono solo HTTP
+            payloads = []
+            for order in orders.values():
                 try:
-                    # Mappa ordine per gestionale
-                    order_data = self._map_order_data(order)
-                    
-                    # Invia al gestionale
-                    response = self._make_request('POST', '/api/orders', order_data)
-                    
-                    # Aggiorna stato ordine se necessario
-                    if response.get('success'):
-                        external_id = response.get('order_id')
-                        # Qui potresti salvare l'ID esterno in un campo dell'ordine
-                        messages.append(f"Ordine {order.order_number} esportato (ID: {external_id})")
-                        success_count += 1
-                    
+                    payloads.append(self._map_order_data(order))
                 except Exception as e:
-                    error_msg = f"Errore export ordine {order.order_number}: {str(e)}"
-                    messages.append(error_msg)
-                    logger.error(error_msg)
-                    failed_count += 1
+                    result.error(f"Errore export ordine {order.order_number}: {str(e)}")
+            
+            config_data = self.config.config_data
+            concurrency = max(1, int(config_data.get('export_concurrency', DEFAULT_EXPORT_CONCURRENCY)))
+            batch_size = max(1, int(config_data.get('export_batch_size', 1)))
+            rate_limiter = RateLimiter(config_data.get('export_rate_limit'))
+            
+            def send(batch: List[Dict]) -> List[Dict]:
+                rate_limiter.wait()
+                if batch_size == 1:
+                    response = self._make_request('POST', '/api/orders', batch[0])
+                    return [{**response, 'order_number': batch[0]['order_number']}]
+                response = self._make_request(
+                    'POST',
+                    config_data.get('export_batch_endpoint', '/api/orders/batch'),
+                    {'orders': batch}
+                )
+                return response.get('results', [])
+            
+            exported = {}
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                futures = {
+                    executor.submit(send, batch): [data['order_number'] for data in batch]
+                    for batch in chunked(payloads, batch_size)
+                }
+                for future in as_completed(futures):
+                    order_numbers = futures[future]
+                    try:
+                        outcomes = {item.get('order_number'): item for item in future.result()}
+                    except Exception as e:
+                        for order_number in order_numbers:
+                            result.error(f"Errore export ordine {order_number}: {str(e)}")
+                        continue
+                    
+                    for order_number in order_numbers:
+                        outcome = outcomes.get(order_number, {})
+                        if outcome.get('success'):
+                            exported[order_number] = outcome.get('order_id') or ''
+                            result.ok(f"Ordine {order_number} esportato (ID: {exported[order_number]})")
+                        else:
+                            reason = outcome.get('error', 'rifiutato dal gestionale')
+                            result.error(f"Errore export ordine {order_number}: {reason}")
+            
+            # Watermark per ordine: updated_at non viene toccato da bulk_update
+            for order_number, external_id in exported.items():
+                orders[order_number].external_id = str(external_id)
+                orders[order_number].exported_at = exported_at
+            Order.objects.bulk_update(
+                [orders[order_number] for order_number in exported],
+                ['external_id', 'exported_at'],
+                batch_size=DEFAULT_BATCH_SIZE
+            )
             
             self._update_log(
                 log, 'completed',
-                records_success=success_count,
-                records_failed=failed_count,
-                log_messages='\n'.join(messages)
+                records_success=result.success,
+                records_failed=result.failed,
+                log_messages='\n'.join(result.messages)
             )
             
         except Exception as e:
@@ -271,37 +418,6 @@ class GestionaleIntegrationService(BaseIntegrationService):
         
         return log
     
-    def _map_product_data(self, external_data: Dict) -> Dict:
-        """Mappa dati prodotto dal formato gestionale al formato interno"""
-        # Trova o crea categoria
-        category_name = external_data.get('category', 'Senza Categoria')
-        category, _ = Category.objects.get_or_create(
-            name=category_name,
-            defaults={'slug': category_name.lower().replace(' ', '-')}
-        )
-        
-        # Trova o crea brand
-        brand_name = external_data.get('brand', 'Generico')
-        brand, _ = Brand.objects.get_or_create(
-            name=brand_name,
-            defaults={'slug': brand_name.lower().replace(' ', '-')}
-        )
-        
-        return {
-            'sku': external_data['sku'],
-            'name': external_data['name'],
-            'slug': external_data['name'].lower().replace(' ', '-'),
-            'description': external_data.get('description', ''),
-            'short_description': external_data.get('short_description', ''),
-            'category': category,
-            'brand': brand,
-            'base_price': Decimal(str(external_data.get('price', 0))),
-            'cost_price': Decimal(str(external_data.get('cost_price', 0))),
-            'optical_attributes': external_data.get('attributes', {}),
-            'is_active': external_data.get('active', True),
-            'weight': external_data.get('weight'),
-        }
-    
     def _map_order_data(self, order: Order) -> Dict:
         """Mappa ordine dal formato interno al formato gestionale"""
         return {
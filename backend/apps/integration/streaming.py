@@ -0,0 +1,211 @@
+import re
+import json
+import codecs
+from typing import Any, Iterable, Iterator, Optional, Union
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+# Oltre questa soglia il buffer già consumato viene scartato
+_BUFFER_COMPACT_THRESHOLD = 256 * 1024
+
+_WHITESPACE = ' \t\r\n'
+
+# Ricerca della chiave: caratteri strutturali fuori dalle stringhe, fine stringa o escape dentro
+_STRUCTURAL = re.compile(r'["{}\[\]:,]')
+_STRING_SPECIAL = re.compile(r'["\\]')
+
+
+def _decode_chunks(chunks: Iterable[Union[bytes, str]]) -> Iterator[str]:
+    """Decodifica incrementale UTF-8 (i caratteri multibyte possono essere spezzati)"""
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    for chunk in chunks:
+        if isinstance(chunk, bytes):
+            chunk = decoder.decode(chunk)
+        if chunk:
+            yield chunk
+    tail = decoder.decode(b'', final=True)
+    if tail:
+        yield tail
+
+
+def iter_file_chunks(fileobj, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[bytes]:
+    """Legge un file a blocchi"""
+    return iter(lambda: fileobj.read(chunk_size), b'')
+
+
+def _seek_key(source: Iterator[str], key: str) -> str:
+    """
+    Avanza sul documento fino all'array valore di `key` nell'oggetto radice
+    e ritorna il testo che segue la '['. Le chiavi vengono riconosciute solo a
+    profondità 1: oggetti annidati e stringhe con lo stesso testo non contano.
+    Ogni carattere è esaminato una sola volta e del testo già esaminato non
+    resta nulla in memoria, tranne il nome della chiave in lettura.
+    """
+    buffer, pos = '', 0
+    depth = 0
+    in_string = escape = False
+    expect_key = False
+    key_parts = None  # nome della chiave di profondità 1 in lettura
+    last_key = None  # ultima chiave letta, in attesa dei ':'
+    value_of = None  # chiave di cui si attende il valore
+
+    while True:
+        if pos >= len(buffer):
+            try:
+                buffer, pos = next(source), 0
+            except StopIteration:
+                raise ValueError(f"Chiave '{key}' non trovata nel feed")
+            continue
+
+        if in_string:
+            if escape:
+                escape = False
+                if key_parts is not None:
+                    key_parts.append(buffer[pos])
+                pos += 1
+                continue
+            match = _STRING_SPECIAL.search(buffer, pos)
+            end = match.start() if match else len(buffer)
+            if key_parts is not None:
+                key_parts.append(buffer[pos:end])
+            pos = end
+            if match:
+                pos += 1
+                if match.group() == '\\':
+                    escape = True
+                    if key_parts is not None:
+                        key_parts.append('\\')
+                else:
+                    in_string = False
+                    if key_parts is not None:
+                        last_key = json.loads('"%s"' % ''.join(key_parts))
+                        key_parts = None
+            continue
+
+        if value_of is not None or depth == 0:
+            while pos < len(buffer) and buffer[pos] in _WHITESPACE:
+                pos += 1
+            if pos >= len(buffer):
+                continue
+            char = buffer[pos]
+            if depth == 0:
+                if char != '{':
+                    raise ValueError('Oggetto JSON radice non trovato nel feed')
+                depth, expect_key, pos = 1, True, pos + 1
+                continue
+            if value_of == key:
+                if char != '[':
+                    raise ValueError(f"Chiave '{key}' del feed non contiene un array")
+                return buffer[pos + 1:]
+            value_of = None
+
+        match = _STRUCTURAL.search(buffer, pos)
+        if not match:
+            pos = len(buffer)
+            continue
+        char, pos = match.group(), match.end()
+        if char == '"':
+            in_string = True
+            if depth == 1 and expect_key:
+                key_parts, expect_key = [], False
+        elif char in '{[':
+            depth += 1
+        elif char in '}]':
+            depth -= 1
+            if depth == 0:
+                raise ValueError(f"Chiave '{key}' non trovata nel feed")
+        elif depth == 1 and char == ':':
+            value_of, last_key = last_key, None
+        elif depth == 1 and char == ',':
+            expect_key = True
+
+
+def iter_json_array(chunks: Iterable[Union[bytes, str]], key: Optional[str] = None) -> Iterator[Any]:
+    """
+    Parser incrementale di un array JSON.
+
+    Se `key` è indicato l'array viene cercato come valore di quella chiave
+    nell'oggetto radice (es. {"products": [...]}), altrimenti il documento
+    deve essere esso stesso un array; se manca, ValueError. Gli elementi
+    vengono restituiti uno alla volta: la memoria occupata dipende dalla
+    dimensione del singolo record, non da quella del feed.
+    """
+    decoder = json.JSONDecoder()
+    source = _decode_chunks(chunks)
+    buffer = _seek_key(source, key) if key is not None else ''
+    pos = 0
+    exhausted = False
+
+    def read_more() -> bool:
+        nonlocal buffer, exhausted
+        try:
+            buffer += next(source)
+            return True
+        except StopIteration:
+            exhausted = True
+            return False
+
+    # Posizionamento sull'apertura dell'array. Un feed senza la chiave attesa
+    # è un errore, non un feed vuoto (la sync delta avanzerebbe il watermark)
+    while key is None:
+        while pos < len(buffer) and buffer[pos] in _WHITESPACE:
+            pos += 1
+        if pos < len(buffer):
+            if buffer[pos] != '[':
+                raise ValueError('Array JSON non trovato nel feed')
+            pos += 1
+            break
+        if not read_more():
+            raise ValueError('Array JSON non trovato nel feed')
+
+    while True:
+        # Salta separatori
+        while True:
+            while pos < len(buffer) and (buffer[pos] in _WHITESPACE or buffer[pos] == ','):
+                pos += 1
+            if pos < len(buffer) or not read_more():
+                break
+
+        if pos >= len(buffer):
+            raise ValueError('Feed JSON troncato')
+
+        if buffer[pos] == ']':
+            return
+
+        try:
+            item, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            if read_more():
+                continue
+            raise
+
+        # Un valore scalare non seguito da un separatore potrebbe proseguire
+        # nel blocco successivo (es. "2" seguito da ".5")
+        if not isinstance(item, (dict, list)) and (end == len(buffer) or buffer[end] not in _WHITESPACE + ',]'):
+            if read_more():
+                continue
+            if end < len(buffer):
+                raise ValueError('Feed JSON non valido')
+
+        yield item
+        pos = end
+
+        if pos > _BUFFER_COMPACT_THRESHOLD:
+            buffer = buffer[pos:]
+            pos = 0
+
+
+def iter_ndjson(chunks: Iterable[Union[bytes, str]]) -> Iterator[Any]:
+    """Parser incrementale NDJSON (un documento JSON per riga)"""
+    pending = ''
+    for text in _decode_chunks(chunks):
+        pending += text
+        lines = pending.split('\n')
+        pending = lines.pop()
+        for line in lines:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+    if pending.strip():
+        yield json.loads(pending)
@@ -1,16 +1,19 @@
-from celery import shared_task
+from celery import shared_task, chord
 from celery.utils.log import get_task_logger
+from django.db.models import Sum
 from django.utils import timezone
+from apps.stores.models import Store
+from .models import IntegrationLog
 from .services import GestionaleIntegrationService
 
 logger = get_task_logger(__name__)
 
 @shared_task(bind=True, max_retries=3)
-def sync_products_task(self):
+def sync_products_task(self, full=False):
     """Task per sincronizzazione prodotti"""
     try:
         service = GestionaleIntegrationService('gestionale_principale')
-        log = service.sync_products()
+        log = service.sync_products(full=full)
         
         logger.info(f"Sync prodotti completato. Processed: {log.records_processed}, Success: {log.records_success}, Failed: {log.records_failed}")
         
@@ -26,11 +29,11 @@ def sync_products_task(self):
         self.retry(countdown=300, exc=exc)  # Retry dopo 5 minuti
 
 @shared_task(bind=True, max_retries=3)
-def sync_inventory_task(self, store_id=None):
+def sync_inventory_task(self, store_id=None, full=False):
     """Task per sincronizzazione inventario"""
     try:
         service = GestionaleIntegrationService('gestionale_principale')
-        log = service.sync_inventory(store_id)
+        log = service.sync_inventory(store_id, full=full)
         
         logger.info(f"Sync inventario completato. Processed: {log.records_processed}, Success: {log.records_success}, Failed: {log.records_failed}")
         
@@ -46,11 +49,11 @@ def sync_inventory_task(self, store_id=None):
         self.retry(countdown=300, exc=exc)
 
 @shared_task(bind=True, max_retries=3)
-def export_orders_task(self, date_from=None, date_to=None):
+def export_orders_task(self, date_from=None, date_to=None, incremental=True):
     """Task per esportazione ordini"""
     try:
         service = GestionaleIntegrationService('gestionale_principale')
-        log = service.export_orders(date_from, date_to)
+        log = service.export_orders(date_from, date_to, incremental=incremental)
         
         logger.info(f"Export ordini completato. Processed: {log.records_processed}, Success: {log.records_success}, Failed: {log.records_failed}")
         
@@ -65,6 +68,87 @@ def export_orders_task(self, date_from=None, date_to=None):
         logger.error(f"Errore export ordini: {exc}")
         self.retry(countdown=300, exc=exc)
 
+@shared_task
+def sync_inventory_shard_task(store_id, parent_log_id, full=False):
+    """Shard di una sync inventario distribuita (un negozio)"""
+    try:
+        service = GestionaleIntegrationService('gestionale_principale')
+        log = service.sync_inventory(store_id, full=full, parent_log_id=parent_log_id)
+    except Exception as exc:
+        # Nessun raise: la chord deve comunque arrivare all'aggregazione
+        logger.error(f"Errore shard inventario store {store_id}: {exc}")
+        return {'store_id': store_id, 'status': 'failed', 'error': str(exc)}
+    
+    return {
+        'store_id': store_id,
+        'log_id': log.id,
+        'status': log.status,
+        'processed': log.records_processed,
+        'success': log.records_success,
+        'failed': log.records_failed
+    }
+
+@shared_task
+def aggregate_inventory_shards_task(results, parent_log_id):
+    """Aggrega i log degli shard nel log padre della sync distribuita"""
+    parent = IntegrationLog.objects.get(pk=parent_log_id)
+    totals = parent.children.aggregate(
+        processed=Sum('records_processed'),
+        success=Sum('records_success'),
+        failed=Sum('records_failed')
+    )
+    
+    failed_shards = [r for r in results if r.get('status') != 'completed']
+    if not failed_shards:
+        status = 'completed'
+    elif len(failed_shards) == len(results):
+        status = 'failed'
+    else:
+        status = 'partial'
+    
+    messages = [
+        f"Store {r['store_id']}: {r['status']}" + (f" ({r['error']})" if r.get('error') else '')
+        for r in results
+    ]
+    
+    parent.status = status
+    parent.completed_at = timezone.now()
+    parent.records_processed = totals['processed'] or 0
+    parent.records_success = totals['success'] or 0
+    parent.records_failed = totals['failed'] or 0
+    parent.log_messages = '\n'.join(messages)
+    parent.save()
+    
+    logger.info(f"Sync inventario distribuita completata ({status}). Shards: {len(results)}, Processed: {parent.records_processed}")
+    
+    return {
+        'status': parent.status,
+        'processed': parent.records_processed,
+        'success': parent.records_success,
+        'failed': parent.records_failed
+    }
+
+@shared_task
+def sharded_sync_inventory_task(full=False):
+    """Sync inventario distribuita: uno shard per negozio, eseguiti in parallelo sui worker"""
+    store_ids = list(Store.objects.filter(is_active=True).values_list('id', flat=True))
+    
+    parent = IntegrationLog.objects.create(
+        operation_type='sync_inventory',
+        status='running',
+        started_at=timezone.now(),
+        parameters={'sharded': True, 'full': full, 'store_ids': store_ids}
+    )
+    
+    if not store_ids:
+        return aggregate_inventory_shards_task([], parent.id)
+    
+    chord(
+        sync_inventory_shard_task.s(store_id, parent.id, full) for store_id in store_ids
+    )(aggregate_inventory_shards_task.s(parent.id))
+    
+    return {'log_id': parent.id, 'shards': len(store_ids)}
+
 @shared_task
 def daily_sync_products():
     """Task automatico giornaliero sync prodotti"""
@@ -72,11 +156,10 @@ def daily_sync_products():
 
 @shared_task  
 def hourly_sync_inventory():
-    """Task automatico orario sync inventario"""
-    return sync_inventory_task.delay()
+    """Task automatico orario sync inventario (distribuita per negozio)"""
+    return sharded_sync_inventory_task.delay()
 
 @shared_task
 def daily_export_orders():
-    """Task automatico giornaliero export ordini"""
-    yesterday = (timezone.now() - timezone.timedelta(days=1)).strftime('%Y-%m-%d')
-    return export_orders_task.delay(date_from=yesterday)
\ No newline at end of file
+    """Task automatico giornaliero export ordini (solo ordini nuovi o modificati)"""
+    return export_orders_task.delay()
\ No newline at end of file
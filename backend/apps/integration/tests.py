@@ -0,0 +1,437 @@
+import json
+import threading
+import time
+from decimal import Decimal
+from unittest import mock
+from django.contrib.auth.models import User
+from django.test import TestCase, SimpleTestCase
+from django.utils import timezone
+from apps.customers.models import Customer, Address
+from apps.orders.models import Order
+from apps.products.models import Category, Brand, Product
+from apps.inventory.models import StoreInventory, InventoryMovement
+from apps.stores.models import Store
+from .bulk import ProductBulkUpserter, InventoryReconciler
+from .models import ExternalSystemConfig, IntegrationLog
+from .services import GestionaleIntegrationService
+from .streaming import iter_json_array, iter_ndjson
+from .tasks import aggregate_inventory_shards_task, sharded_sync_inventory_task, sync_inventory_shard_task
+from .transport import RateLimiter, build_session
+
+class ProductBulkUpserterTestCase(TestCase):
+    """Test per upsert massivo prodotti"""
+
+    def setUp(self):
+        self.rows = [
+            {
+                'sku': f'SKU{i:04d}',
+                'name': f'Prodotto {i}',
+                'category': 'Occhiali',
+                'brand': 'Ray-Ban' if i % 2 else 'Oakley',
+                'price': 100 + i,
+            }
+            for i in range(25)
+        ]
+
+    def test_creates_products_and_lookups(self):
+        """Test creazione prodotti, categorie e brand mancanti"""
+        result = ProductBulkUpserter(batch_size=10).run(self.rows)
+
+        self.assertEqual(result.success, 25)
+        self.assertEqual(result.failed, 0)
+        self.assertEqual(Product.objects.count(), 25)
+        self.assertEqual(Category.objects.count(), 1)
+        self.assertEqual(Brand.objects.count(), 2)
+
+    def test_unchanged_rows_are_not_written(self):
+        """Test che le righe invariate non generino scritture"""
+        ProductBulkUpserter(batch_size=10).run(self.rows)
+        self.rows[3]['price'] = 999
+
+        with self.assertNumQueries(8):
+            # lookups (2) + 1 select per chunk (3) + savepoint/bulk_update/release (3)
+            result = ProductBulkUpserter(batch_size=10).run(self.rows)
+
+        self.assertEqual(result.success, 25)
+        self.assertEqual(Product.objects.get(sku='SKU0003').price, 999)
+
+    def test_unchanged_payload_is_skipped_by_hash(self):
+        """Test che un payload identico non venga nemmeno confrontato"""
+        ProductBulkUpserter(batch_size=10).run(self.rows)
+
+        with self.assertNumQueries(5):
+            # lookups (2) + 1 select per chunk (3), nessuna scrittura
+            result = ProductBulkUpserter(batch_size=10).run(self.rows)
+
+        self.assertEqual(result.success, 25)
+        self.assertEqual(result.messages, [])
+
+    def test_constraint_errors_are_counted_per_row(self):
+        """Test che un errore di vincolo non faccia fallire l'intero chunk"""
+        self.rows.append({'sku': 'DUPSLUG', 'name': 'Prodotto 1'})
+
+        result = ProductBulkUpserter(batch_size=50).run(self.rows)
+
+        self.assertEqual(result.success, 25)
+        self.assertEqual(result.failed, 1)
+        self.assertFalse(Product.objects.filter(sku='DUPSLUG').exists())
+
+class InventoryReconcilerTestCase(TestCase):
+    """Test per riconciliazione inventario"""
+
+    def setUp(self):
+        self.store = Store.objects.create(
+            name='Test Store',
+            slug='test-store',
+            address='Via Test, 1',
+            postal_code='20121',
+            phone='+39 02 1234567',
+            optician_name='Mario Rossi'
+        )
+        category = Category.objects.create(name='Occhiali', slug='occhiali')
+        brand = Brand.objects.create(name='Ray-Ban', slug='ray-ban')
+        self.products = [
+            Product.objects.create(
+                sku=f'SKU{i:04d}',
+                name=f'Prodotto {i}',
+                slug=f'prodotto-{i}',
+                category=category,
+                brand=brand,
+                product_type='glasses',
+                price=100
+            )
+            for i in range(5)
+        ]
+        self.feed = [
+            {'product_sku': p.sku, 'store_slug': 'test-store', 'quantity': 10, 'price': 100}
+            for p in self.products
+        ]
+
+    def test_creates_inventory_with_initial_movements(self):
+        """Test creazione righe inventario mancanti con movimento di quantità iniziale"""
+        result = InventoryReconciler().run(self.feed)
+
+        self.assertEqual(result.success, 5)
+        self.assertEqual(StoreInventory.objects.count(), 5)
+        self.assertEqual(
+            list(InventoryMovement.objects.values_list('movement_type', 'quantity_change', 'quantity_after')),
+            [('restock', 10, 10)] * 5
+        )
+
+    def test_only_changed_rows_are_written(self):
+        """Test che solo le righe modificate generino scritture e movimenti"""
+        InventoryReconciler().run(self.feed)
+        self.feed[0]['quantity'] = 7
+
+        result = InventoryReconciler().run(self.feed)
+
+        self.assertEqual(result.success, 5)
+        self.assertEqual(result.messages, ['Inventario Test Store - SKU0000 aggiornato'])
+        movement = InventoryMovement.objects.get(movement_type='adjustment')
+        self.assertEqual(movement.quantity_change, -3)
+        self.assertEqual(movement.quantity_after, 7)
+
+    def test_unknown_product_and_store_are_counted_as_failed(self):
+        """Test righe con prodotto o store sconosciuti"""
+        self.feed.append({'product_sku': 'MISSING', 'store_slug': 'test-store'})
+        self.feed.append({'product_sku': 'SKU0001', 'store_slug': 'missing-store'})
+
+        result = InventoryReconciler().run(self.feed)
+
+        self.assertEqual(result.success, 5)
+        self.assertEqual(result.failed, 2)
+
+class DeltaSyncTestCase(TestCase):
+    """Test per parametri sync delta"""
+
+    def setUp(self):
+        ExternalSystemConfig.objects.create(name='gestionale_test', system_type='gestionale')
+        self.service = GestionaleIntegrationService('gestionale_test')
+
+    def test_first_sync_is_full(self):
+        """Test sync completa in assenza di watermark"""
+        self.assertEqual(self.service._delta_params('sync_products'), {})
+
+    def test_delta_after_full_sync(self):
+        """Test sync delta dopo una sync completa recente"""
+        started_at = timezone.now()
+        self.service._save_watermark('sync_products', started_at, full=True)
+
+        params = self.service._delta_params('sync_products')
+
+        self.assertEqual(params, {'updated_since': started_at.isoformat()})
+        self.assertEqual(self.service._delta_params('sync_products', full=True), {})
+        self.service.config.refresh_from_db()
+        self.assertEqual(self.service.config.last_sync, started_at)
+
+    def test_full_sync_when_interval_elapsed(self):
+        """Test ritorno alla sync completa dopo full_sync_interval_hours"""
+        self.service._save_watermark('sync_products', timezone.now() - timezone.timedelta(days=2), full=True)
+        self.service._save_watermark('sync_products', timezone.now(), full=False)
+
+        self.assertEqual(self.service._delta_params('sync_products'), {})
+
+    def test_feed_without_key_fails_and_keeps_watermark(self):
+        """Test feed senza la chiave attesa: sync fallita, watermark fermo"""
+        response = mock.Mock(headers={'Content-Type': 'application/json'})
+        response.iter_content.return_value = [b'{"items": [{"sku": "A"}]}']
+        with mock.patch.object(self.service, '_send', return_value=response):
+            log = self.service.sync_products()
+
+        self.assertEqual(log.status, 'failed')
+        self.service.config.refresh_from_db()
+        self.assertNotIn('sync_watermarks', self.service.config.config_data)
+
+    def test_parallel_syncs_keep_each_other_watermarks(self):
+        """Test che sync parallele con config_data vecchio non cancellino watermark e modifiche altrui"""
+        other = GestionaleIntegrationService('gestionale_test')
+        ExternalSystemConfig.objects.filter(name='gestionale_test').update(config_data={'page_size': 50})
+
+        self.service._save_watermark('sync_products', timezone.now(), full=True)
+        other._save_watermark('sync_inventory', timezone.now(), full=True)
+
+        config_data = ExternalSystemConfig.objects.get(name='gestionale_test').config_data
+        self.assertEqual(set(config_data['sync_watermarks']), {'sync_products', 'sync_inventory'})
+        self.assertEqual(config_data['page_size'], 50)
+
+class ExportOrdersTestCase(TestCase):
+    """Test per export incrementale e a gruppi degli ordini"""
+
+    def setUp(self):
+        ExternalSystemConfig.objects.create(name='gestionale_test', system_type='gestionale')
+        self.service = GestionaleIntegrationService('gestionale_test')
+        user = User.objects.create_user(username='cliente', email='cliente@example.com')
+        customer = Customer.objects.create(user=user)
+        address = Address.objects.create(
+            customer=customer, type='billing', first_name='Mario', last_name='Rossi',
+            address_line_1='Via Roma 1', city='Palermo', province='PA', postal_code='90100'
+        )
+        store = Store.objects.create(
+            name='Store Test', slug='store-test', address='Via Test 1', postal_code='90100', phone='091000000'
+        )
+        self.orders = [
+            Order.objects.create(
+                order_number=f'OC{i:04d}', customer=customer, store=store, billing_address=address,
+                fulfillment_method='pickup', status='confirmed',
+                subtotal=Decimal('100.00'), total_amount=Decimal('122.00'),
+            )
+            for i in range(3)
+        ]
+        self.sent = []
+
+    def accept(self, method, endpoint, data=None, params=None):
+        self.sent.append((endpoint, data))
+        if 'orders' in data:
+            return {'results': [
+                {'order_number': order['order_number'], 'success': order['order_number'] != 'OC0001',
+                 'order_id': f"G-{order['order_number']}"}
+                for order in data['orders']
+            ]}
+        return {'success': True, 'order_id': f"G-{data['order_number']}"}
+
+    def export(self):
+        self.sent = []
+        with mock.patch.object(self.service, '_make_request', side_effect=self.accept):
+            return self.service.export_orders()
+
+    def exported(self):
+        return sorted(order['order_number'] for _, data in self.sent for order in data.get('orders', [data]))
+
+    def test_incremental_export(self):
+        """Test export dei soli ordini nuovi o modificati dopo l'ultimo export"""
+        log = self.export()
+        self.assertEqual((log.status, log.records_success), ('completed', 3))
+        self.assertEqual(self.exported(), ['OC0000', 'OC0001', 'OC0002'])
+        self.assertEqual(Order.objects.get(order_number='OC0001').external_id, 'G-OC0001')
+
+        self.export()
+        self.assertEqual(self.exported(), [])
+
+        self.orders[1].notes = 'Modificato'
+        self.orders[1].save()
+        self.export()
+        self.assertEqual(self.exported(), ['OC0001'])
+
+    def test_change_during_export_is_exported_again(self):
+        """Test che un ordine modificato mentre l'export è in corso venga riesportato"""
+        map_order_data = self.service._map_order_data
+
+        def map_and_modify(order):
+            # Modifica salvata dopo la lettura degli ordini, prima dell'invio
+            Order.objects.filter(order_number='OC0002').update(updated_at=timezone.now())
+            return map_order_data(order)
+
+        with mock.patch.object(self.service, '_map_order_data', side_effect=map_and_modify):
+            self.export()
+
+        self.export()
+        self.assertEqual(self.exported(), ['OC0002'])
+
+    def test_batch_export_marks_only_accepted_orders(self):
+        """Test export a gruppi: una richiesta per gruppo, watermark solo sugli ordini accettati"""
+        self.service.config.config_data = {'export_batch_size': 2}
+
+        log = self.export()
+
+        self.assertEqual([endpoint for endpoint, _ in self.sent], ['/api/orders/batch'] * 2)
+        self.assertEqual((log.records_success, log.records_failed), (2, 1))
+        self.assertEqual(
+            list(Order.objects.filter(exported_at__isnull=True).values_list('order_number', flat=True)),
+            ['OC0001']
+        )
+        self.export()
+        self.assertEqual(self.exported(), ['OC0001'])
+
+    def test_concurrency_is_bounded_and_failures_isolated(self):
+        """Test invii paralleli entro export_concurrency e errore di un ordine che non ferma gli altri"""
+        self.service.config.config_data = {'export_concurrency': 2}
+        lock = threading.Lock()
+        in_flight = peak = 0
+
+        def send(method, endpoint, data=None, params=None):
+            nonlocal in_flight, peak
+            with lock:
+                in_flight += 1
+                peak = max(peak, in_flight)
+            time.sleep(0.05)
+            with lock:
+                in_flight -= 1
+            if data['order_number'] == 'OC0002':
+                raise ConnectionError('timeout')
+            return self.accept(method, endpoint, data, params)
+
+        with mock.patch.object(self.service, '_make_request', side_effect=send):
+            log = self.service.export_orders()
+
+        self.assertEqual(peak, 2)
+        self.assertEqual((log.status, log.records_success, log.records_failed), ('completed', 2, 1))
+        self.assertIn('Errore export ordine OC0002: timeout', log.log_messages)
+        self.assertIsNone(Order.objects.get(order_number='OC0002').exported_at)
+
+class RateLimiterTestCase(SimpleTestCase):
+    """Test per il limite di richieste al secondo dell'export"""
+
+    def test_requests_are_spaced(self):
+        """Test attese crescenti oltre il ritmo consentito, nessuna attesa senza limite"""
+        with mock.patch('apps.integration.transport.time.monotonic', return_value=100.0), \
+                mock.patch('apps.integration.transport.time.sleep') as sleep:
+            limiter = RateLimiter(2)
+            for _ in range(3):
+                limiter.wait()
+            RateLimiter(None).wait()
+
+        self.assertEqual([call.args[0] for call in sleep.call_args_list], [0.5, 1.0])
+
+class ShardedInventorySyncTestCase(TestCase):
+    """Test per sync inventario distribuita per negozio"""
+
+    def setUp(self):
+        self.stores = [
+            Store.objects.create(
+                name=f'Store {i}', slug=f'store-{i}', address='Via Test 1', postal_code='90100', phone='091000000'
+            )
+            for i in range(2)
+        ]
+
+    def test_one_shard_per_active_store(self):
+        """Test log padre e uno shard per negozio attivo nella chord"""
+        Store.objects.create(
+            name='Chiuso', slug='chiuso', address='Via Test 2', postal_code='90100', phone='091000001', is_active=False
+        )
+        with mock.patch('apps.integration.tasks.chord') as chord:
+            result = sharded_sync_inventory_task(full=True)
+
+        parent = IntegrationLog.objects.get(pk=result['log_id'])
+        store_ids = [store.pk for store in self.stores]
+        self.assertEqual((parent.status, parent.parameters['store_ids']), ('running', store_ids))
+        shards = list(chord.call_args.args[0])
+        self.assertEqual([shard.args for shard in shards], [(store_id, parent.pk, True) for store_id in store_ids])
+        chord.return_value.assert_called_once_with(aggregate_inventory_shards_task.s(parent.pk))
+
+    def test_aggregation_of_shard_logs(self):
+        """Test stato e conteggi del log padre dagli shard, con uno shard fallito"""
+        parent = IntegrationLog.objects.create(operation_type='sync_inventory', status='running')
+        child = IntegrationLog.objects.create(
+            operation_type='sync_inventory', status='completed', parent=parent,
+            records_processed=10, records_success=9, records_failed=1,
+        )
+        # Senza configurazione del gestionale lo shard fallisce senza sollevare
+        failed = sync_inventory_shard_task(self.stores[1].pk, parent.pk)
+        self.assertEqual(failed['status'], 'failed')
+
+        result = aggregate_inventory_shards_task(
+            [{'store_id': self.stores[0].pk, 'log_id': child.pk, 'status': 'completed'}, failed], parent.pk
+        )
+
+        parent.refresh_from_db()
+        self.assertEqual(result, {'status': 'partial', 'processed': 10, 'success': 9, 'failed': 1})
+        self.assertEqual(parent.status, 'partial')
+        self.assertIsNotNone(parent.completed_at)
+        self.assertIn(f'Store {self.stores[1].pk}: failed', parent.log_messages)
+
+    def test_all_shards_failed(self):
+        """Test log padre fallito se nessuno shard è riuscito"""
+        parent = IntegrationLog.objects.create(operation_type='sync_inventory', status='running')
+        results = [{'store_id': store.pk, 'status': 'failed', 'error': 'timeout'} for store in self.stores]
+
+        self.assertEqual(aggregate_inventory_shards_task(results, parent.pk)['status'], 'failed')
+
+class StreamingParserTestCase(SimpleTestCase):
+    """Test per parsing incrementale dei feed"""
+
+    def split(self, payload: bytes, size: int):
+        return [payload[i:i + size] for i in range(0, len(payload), size)]
+
+    def test_json_array_across_chunk_boundaries(self):
+        """Test record spezzati tra blocchi, anche su caratteri multibyte"""
+        document = {
+            'meta': {'total': 3},
+            'products': [{'sku': 'A', 'name': 'Occhiale è'}, {'sku': 'B', 'price': 2.5}, 42],
+        }
+        payload = json.dumps(document, ensure_ascii=False).encode('utf-8')
+
+        for size in (1, 3, 64):
+            records = list(iter_json_array(self.split(payload, size), 'products'))
+            self.assertEqual(records, document['products'])
+
+    def test_key_only_at_root_level(self):
+        """Test chiave riconosciuta solo nell'oggetto radice, non in oggetti annidati o stringhe"""
+        payload = json.dumps({
+            'meta': {'products': [{'sku': 'ANNIDATO'}]},
+            'note': 'testo con "products": [{"sku": "STRINGA"}] dentro',
+            'pro\"ducts': [{'sku': 'ESCAPE'}],
+            'products': [{'sku': 'A'}],
+        }).encode('utf-8')
+
+        for size in (1, 7, 4096):
+            self.assertEqual(list(iter_json_array(self.split(payload, size), 'products')), [{'sku': 'A'}])
+        with self.assertRaises(ValueError):
+            list(iter_json_array([b'{"meta": {"products": []}}'], 'products'))
+        with self.assertRaises(ValueError):
+            list(iter_json_array([b'{"products": {"sku": "A"}}'], 'products'))
+
+    def test_missing_key_raises(self):
+        """Test feed senza la chiave richiesta: errore, non feed vuoto"""
+        with self.assertRaises(ValueError):
+            list(iter_json_array([b'{"inventory": []}'], 'products'))
+        self.assertEqual(list(iter_json_array([b'{"products": []}'], 'products')), [])
+
+    def test_ndjson(self):
+        """Test parsing NDJSON"""
+        payload = b'{"sku": "A"}\n\n{"sku": "B"}'
+        self.assertEqual(
+            list(iter_ndjson(self.split(payload, 5))),
+            [{'sku': 'A'}, {'sku': 'B'}]
+        )
+
+class TransportRetryTestCase(SimpleTestCase):
+    """Test per la politica di retry delle richieste HTTP"""
+
+    def test_post_is_retried_only_when_rejected(self):
+        """Test POST ritentato su 429/503, non su 500 (potrebbe essere stato elaborato)"""
+        retry = build_session({}).get_adapter('https://gestionale.example').max_retries
+
+        self.assertTrue(retry.is_retry('POST', 429))
+        self.assertTrue(retry.is_retry('POST', 503, has_retry_after=True))
+        self.assertFalse(retry.is_retry('POST', 500))
+        self.assertTrue(retry.is_retry('GET', 500))
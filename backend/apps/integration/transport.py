@@ -0,0 +1,133 @@
+import time
+import threading
+from typing import Dict, List, Any
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_TIMEOUT = 30
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_BACKOFF_FACTOR = 0.5
+DEFAULT_RETRY_STATUSES = [429, 500, 502, 503, 504]
+# Richiesta rifiutata senza essere elaborata: ritentabile anche per POST
+REJECTED_STATUSES = frozenset([429, 503])
+
+
+class RejectedRequestRetry(Retry):
+    """
+    Retry che ritenta qualsiasi metodo (anche POST) sulle risposte 429 e 503,
+    rispettando Retry-After: il server non ha elaborato la richiesta. Gli
+    altri status ed errori di lettura restano limitati a allowed_methods.
+    """
+
+    def is_retry(self, method: str, status_code: int, has_retry_after: bool = False) -> bool:
+        if status_code in REJECTED_STATUSES and status_code in (self.status_forcelist or ()):
+            return True
+        return super().is_retry(method, status_code, has_retry_after)
+
+
+def build_session(config_data: Dict[str, Any]) -> requests.Session:
+    """
+    Crea una sessione HTTP con pool di connessioni keep-alive e retry/backoff.
+
+    Chiavi supportate in ExternalSystemConfig.config_data:
+    - http_pool_size: connessioni mantenute aperte per host (default 10)
+    - http_max_retries: tentativi su errori di connessione e status in
+      http_retry_statuses (default 3)
+    - http_backoff_factor: backoff esponenziale tra i tentativi (default 0.5s)
+    - http_retry_statuses: status da ritentare (default 429 e 5xx)
+    - http_retry_methods: metodi ritentabili (default solo idempotenti; 429 e
+      503 sono ritentati per ogni metodo, POST compreso)
+    """
+    # Il pool deve coprire almeno i thread dell'export concorrente
+    pool_size = max(
+        int(config_data.get('http_pool_size', DEFAULT_POOL_SIZE)),
+        int(config_data.get('export_concurrency', 1)),
+    )
+
+    retry = RejectedRequestRetry(
+        total=int(config_data.get('http_max_retries', DEFAULT_MAX_RETRIES)),
+        backoff_factor=float(config_data.get('http_backoff_factor', DEFAULT_BACKOFF_FACTOR)),
+        status_forcelist=config_data.get('http_retry_statuses', DEFAULT_RETRY_STATUSES),
+        allowed_methods=config_data.get('http_retry_methods', Retry.DEFAULT_ALLOWED_METHODS),
+        respect_retry_after_header=True,
+        # L'ultimo tentativo fallito ritorna la risposta: raise_for_status la gestisce
+        raise_on_status=False,
+    )
+
+    adapter = HTTPAdapter(
+        pool_connections=pool_size,
+        pool_maxsize=pool_size,
+        max_retries=retry,
+    )
+
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+class RequestMetrics:
+    """Raccoglie le latenze delle richieste HTTP di un'operazione (thread-safe)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.latencies: List[float] = []
+            self.errors = 0
+
+    def record(self, elapsed_ms: float, failed: bool = False):
+        with self._lock:
+            self.latencies.append(elapsed_ms)
+            if failed:
+                self.errors += 1
+
+    def summary(self) -> Dict[str, Any]:
+        """Riepilogo serializzabile in IntegrationLog.request_metrics"""
+        with self._lock:
+            latencies = sorted(self.latencies)
+            errors = self.errors
+
+        if not latencies:
+            return {'requests': 0, 'errors': errors}
+
+        def percentile(p: float) -> float:
+            index = min(len(latencies) - 1, int(round(p * (len(latencies) - 1))))
+            return round(latencies[index], 2)
+
+        total = sum(latencies)
+        return {
+            'requests': len(latencies),
+            'errors': errors,
+            'total_ms': round(total, 2),
+            'avg_ms': round(total / len(latencies), 2),
+            'min_ms': round(latencies[0], 2),
+            'p50_ms': percentile(0.50),
+            'p95_ms': percentile(0.95),
+            'max_ms': round(latencies[-1], 2),
+        }
+
+
+class RateLimiter:
+    """Limita le richieste a `rate` al secondo, condiviso tra thread"""
+
+    def __init__(self, rate: float = None):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+
+    def wait(self):
+        if not self.interval:
+            return
+
+        with self._lock:
+            now = time.monotonic()
+            slot = max(self._next_slot, now)
+            self._next_slot = slot + self.interval
+
+        if slot > now:
+            time.sleep(slot - now)
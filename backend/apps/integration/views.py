@@ -2,6 +2,7 @@ from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
+from apps.common.pagination import KeysetPagination
 from .models import IntegrationLog, ExternalSystemConfig
 from .tasks import sync_products_task, sync_inventory_task, export_orders_task
 from .serializers import IntegrationLogSerializer
@@ -12,8 +13,9 @@ class IntegrationLogViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = IntegrationLogSerializer
     permission_classes = [permissions.IsAdminUser]
     filter_backends = [DjangoFilterBackend]
-    filterset_fields = ['operation_type', 'status']
+    filterset_fields = ['operation_type', 'status', 'parent']
     ordering = ['-created_at']
+    pagination_class = KeysetPagination
 
 @action(detail=False, methods=['post'])
 def trigger_sync_products(self, request):
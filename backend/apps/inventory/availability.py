@@ -0,0 +1,86 @@
+from typing import Dict, Iterable, Optional, Tuple
+from django.db.models import F, IntegerField, Min, Sum, Value
+from django.db.models.functions import Greatest
+from apps.common.cache import app_cache
+from .models import StoreInventory
+
+# Durata in cache della disponibilità per (store, prodotto): breve, perché
+# la disponibilità mostrata può essere leggermente vecchia ma la prenotazione
+# (apps.inventory.reservations) ricontrolla sempre lo stock sul database
+AVAILABILITY_CACHE_TIMEOUT = 30
+
+
+def _cache_key(store_id: Optional[int], product_id: int) -> str:
+    return f"availability:{store_id or 'all'}:{product_id}"
+
+
+def _empty(store_id: Optional[int]) -> Dict:
+    if store_id:
+        return {'available': False, 'quantity': 0}
+    return {'available': False, 'total_quantity': 0}
+
+
+def availability_for_products(product_ids: Iterable[int], store_id: Optional[int] = None) -> Dict[int, Dict]:
+    """
+    Disponibilità online per un blocco di prodotti: {product_id: dati}.
+
+    Con store_id: quantità disponibile (al netto delle prenotazioni) e prezzo
+    dello store; senza: quantità disponibile totale su tutti gli store.
+    I prodotti non in cache sono calcolati con una sola query raggruppata.
+    """
+    store_id = int(store_id) if store_id else None
+    product_ids = list(dict.fromkeys(product_ids))
+    if not product_ids:
+        return {}
+
+    cache = app_cache('inventory')
+    keys = {_cache_key(store_id, product_id): product_id for product_id in product_ids}
+    found = cache.get_many(list(keys))
+    availability = {keys[key]: value for key, value in found.items()}
+
+    missing = [product_id for product_id in product_ids if product_id not in availability]
+    if not missing:
+        return availability
+
+    queryset = StoreInventory.objects.filter(product_id__in=missing, is_online_available=True)
+    if store_id:
+        queryset = queryset.filter(store_id=store_id)
+
+    # Una riga per prodotto (le varianti si sommano); le righe con più
+    # prenotazioni che stock non sottraggono disponibilità alle altre
+    rows = queryset.order_by().values('product_id').annotate(
+        available_quantity=Sum(
+            Greatest(F('quantity') - F('reserved_quantity'), Value(0)),
+            output_field=IntegerField(),
+        ),
+        min_store_price=Min('store_price'),
+    )
+
+    computed = {product_id: _empty(store_id) for product_id in missing}
+    for row in rows:
+        quantity = row['available_quantity'] or 0
+        if store_id:
+            computed[row['product_id']] = {
+                'available': quantity > 0,
+                'quantity': quantity,
+                'store_price': row['min_store_price'],
+            }
+        else:
+            computed[row['product_id']] = {'available': quantity > 0, 'total_quantity': quantity}
+
+    cache.set_many(
+        {_cache_key(store_id, product_id): data for product_id, data in computed.items()},
+        AVAILABILITY_CACHE_TIMEOUT,
+    )
+    availability.update(computed)
+    return availability
+
+
+def invalidate_availability(pairs: Iterable[Tuple[int, int]]):
+    """Rimuove dalla cache la disponibilità delle coppie (store_id, product_id)"""
+    keys = set()
+    for store_id, product_id in pairs:
+        keys.add(_cache_key(store_id, product_id))
+        keys.add(_cache_key(None, product_id))
+    if keys:
+        app_cache('inventory').delete_many(keys)
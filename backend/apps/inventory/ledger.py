@@ -0,0 +1,276 @@
+import logging
+from datetime import date
+from typing import Dict, Iterable, List, Optional, Tuple
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from .models import InventoryMovement
+
+logger = logging.getLogger(__name__)
+
+LEDGER_TABLE = InventoryMovement._meta.db_table
+LEGACY_TABLE = f'{LEDGER_TABLE}_legacy'
+DEFAULT_PARTITION = f'{LEDGER_TABLE}_default'
+SEQUENCE = f'{LEDGER_TABLE}_ledger_id_seq'
+DEFAULT_BATCH_SIZE = 1000
+
+DEFAULT_LEDGER_SETTINGS = {
+    'premake_months': 3,  # partizioni mensili create in anticipo
+    'retention_months': 24,  # partizioni più vecchie vengono staccate
+    'archive_schema': 'archive',  # schema delle partizioni staccate (None: eliminate)
+}
+
+
+def ledger_settings() -> Dict:
+    return {**DEFAULT_LEDGER_SETTINGS, **getattr(settings, 'INVENTORY_LEDGER', {})}
+
+
+def append_movements(movements: Iterable[InventoryMovement],
+                     batch_size: int = DEFAULT_BATCH_SIZE) -> List[InventoryMovement]:
+    """Unico punto di scrittura del registro: INSERT a blocchi, mai UPDATE o DELETE"""
+    movements = list(movements)
+    if not movements:
+        return []
+    return InventoryMovement.objects.bulk_create(movements, batch_size=batch_size)
+
+
+def month_start(value: date) -> date:
+    return value.replace(day=1)
+
+
+def add_months(value: date, months: int) -> date:
+    index = value.year * 12 + value.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f'{LEDGER_TABLE}_y{month.year}m{month.month:02d}'
+
+
+def _partition_month(name: str) -> Optional[date]:
+    suffix = name[len(LEDGER_TABLE) + 2:]  # '_y'
+    try:
+        year, month = suffix.split('m')
+        return date(int(year), int(month), 1)
+    except ValueError:
+        return None
+
+
+def partitioning_available() -> bool:
+    """Partizionamento dichiarativo: solo PostgreSQL"""
+    return connection.vendor == 'postgresql'
+
+
+def is_partitioned() -> bool:
+    if not partitioning_available():
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT EXISTS (SELECT 1 FROM pg_partitioned_table pt '
+            'JOIN pg_class c ON c.oid = pt.partrelid '
+            'WHERE c.relname = %s AND pg_table_is_visible(c.oid))',
+            [LEDGER_TABLE],
+        )
+        return cursor.fetchone()[0]
+
+
+def list_partitions() -> List[Tuple[str, date]]:
+    """Partizioni mensili collegate al registro, (nome, mese), in ordine di mese"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT child.relname FROM pg_inherits i '
+            'JOIN pg_class parent ON parent.oid = i.inhparent '
+            'JOIN pg_class child ON child.oid = i.inhrelid '
+            'WHERE parent.relname = %s AND pg_table_is_visible(parent.oid)',
+            [LEDGER_TABLE],
+        )
+        names = [row[0] for row in cursor.fetchall()]
+    partitions = [(name, _partition_month(name)) for name in names]
+    return sorted((item for item in partitions if item[1]), key=lambda item: item[1])
+
+
+def _bound(month: date) -> str:
+    # Limiti in UTC espliciti: indipendenti dal fuso della sessione
+    return f"'{month.isoformat()} 00:00:00+00'"
+
+
+def ensure_default_partition():
+    """
+    Partizione DEFAULT: se la manutenzione salta e il mese corrente non ha
+    partizione, le scritture del registro finiscono qui invece di fallire.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(f'CREATE TABLE IF NOT EXISTS {DEFAULT_PARTITION} PARTITION OF {LEDGER_TABLE} DEFAULT')
+
+
+def default_partition_exists() -> bool:
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT to_regclass(%s) IS NOT NULL', [DEFAULT_PARTITION])
+        return cursor.fetchone()[0]
+
+
+def _create_partition(cursor, month: date):
+    """
+    Crea la partizione del mese. Le righe del mese già finite nella partizione
+    DEFAULT impedirebbero la CREATE: la DEFAULT viene staccata, le righe
+    spostate nella nuova partizione e la DEFAULT ricollegata, nella stessa
+    transazione.
+    """
+    name = connection.ops.quote_name(partition_name(month))
+    start, end = _bound(month), _bound(add_months(month, 1))
+    range_condition = f'created_at >= {start} AND created_at < {end}'
+
+    cursor.execute(f'SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} WHERE {range_condition})')
+    if not cursor.fetchone()[0]:
+        cursor.execute(f'CREATE TABLE {name} PARTITION OF {LEDGER_TABLE} FOR VALUES FROM ({start}) TO ({end})')
+        return
+
+    logger.error(f"Movimenti di {month:%Y-%m} nella partizione DEFAULT: partizione creata in ritardo, righe spostate")
+    cursor.execute(f'ALTER TABLE {LEDGER_TABLE} DETACH PARTITION {DEFAULT_PARTITION}')
+    cursor.execute(f'CREATE TABLE {name} PARTITION OF {LEDGER_TABLE} FOR VALUES FROM ({start}) TO ({end})')
+    cursor.execute(f'INSERT INTO {name} SELECT * FROM {DEFAULT_PARTITION} WHERE {range_condition}')
+    cursor.execute(f'DELETE FROM {DEFAULT_PARTITION} WHERE {range_condition}')
+    cursor.execute(f'ALTER TABLE {LEDGER_TABLE} ATTACH PARTITION {DEFAULT_PARTITION} DEFAULT')
+
+
+def ensure_partitions(first_month: Optional[date] = None, months_ahead: Optional[int] = None) -> List[str]:
+    """Crea le partizioni mancanti da first_month (default: mese corrente) a months_ahead mesi avanti"""
+    months_ahead = ledger_settings()['premake_months'] if months_ahead is None else months_ahead
+    current = month_start(timezone.now().date())
+    month = month_start(first_month or current)
+    last = add_months(current, months_ahead)
+
+    ensure_default_partition()
+    existing = {name for name, _ in list_partitions()}
+    created = []
+    with transaction.atomic(), connection.cursor() as cursor:
+        while month <= last:
+            name = partition_name(month)
+            if name not in existing:
+                _create_partition(cursor, month)
+                created.append(name)
+            month = add_months(month, 1)
+    if created:
+        logger.info(f"Partizioni registro movimenti create: {', '.join(created)}")
+    return created
+
+
+def convert_to_partitioned(keep_legacy: bool = False) -> int:
+    """
+    Trasforma inventory_movements in una tabella partizionata per mese su
+    created_at e vi copia i movimenti esistenti, in un'unica transazione.
+
+    La chiave primaria diventa (id, created_at), come richiesto da
+    PostgreSQL; id resta generato da una sequenza. Indici e foreign key
+    vengono ricreati sulla tabella padre e si propagano alle partizioni.
+    Operazione una tantum da eseguire a scritture ferme.
+    """
+    quote = connection.ops.quote_name
+    model = InventoryMovement
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'ALTER TABLE {LEDGER_TABLE} RENAME TO {LEGACY_TABLE}')
+        # I nomi di indici e vincoli sono unici nello schema: quelli vecchi vanno spostati
+        cursor.execute(
+            'SELECT indexname FROM pg_indexes WHERE tablename = %s AND schemaname = current_schema()',
+            [LEGACY_TABLE],
+        )
+        for (index_name,) in cursor.fetchall():
+            cursor.execute(f'ALTER INDEX {quote(index_name)} RENAME TO {quote(("old_" + index_name)[:63])}')
+
+        cursor.execute(
+            f'CREATE TABLE {LEDGER_TABLE} (LIKE {LEGACY_TABLE} INCLUDING DEFAULTS) '
+            f'PARTITION BY RANGE (created_at)'
+        )
+        cursor.execute(f'CREATE SEQUENCE IF NOT EXISTS {SEQUENCE}')
+        cursor.execute(f"ALTER TABLE {LEDGER_TABLE} ALTER COLUMN id SET DEFAULT nextval('{SEQUENCE}')")
+        cursor.execute(f'ALTER SEQUENCE {SEQUENCE} OWNED BY {LEDGER_TABLE}.id')
+        cursor.execute(f'ALTER TABLE {LEDGER_TABLE} ADD PRIMARY KEY (id, created_at)')
+
+        for field in model._meta.concrete_fields:
+            if not field.remote_field:
+                continue
+            target = field.remote_field.model._meta
+            cursor.execute(
+                f'ALTER TABLE {LEDGER_TABLE} ADD CONSTRAINT {quote(f"{LEDGER_TABLE}_{field.column}_fk")} '
+                f'FOREIGN KEY ({quote(field.column)}) '
+                f'REFERENCES {quote(target.db_table)} ({quote(field.target_field.column)}) '
+                f'DEFERRABLE INITIALLY DEFERRED'
+            )
+            if field.column in ('variant_id', 'user_id'):
+                # store e product sono coperti dagli indici compositi
+                cursor.execute(
+                    f'CREATE INDEX {quote(f"{LEDGER_TABLE}_{field.column}_idx")} '
+                    f'ON {LEDGER_TABLE} ({quote(field.column)})'
+                )
+
+        cursor.execute(f'SELECT MIN(created_at) FROM {LEGACY_TABLE}')
+        oldest = cursor.fetchone()[0]
+        ensure_partitions(oldest.date() if oldest else None)
+
+        cursor.execute(f'INSERT INTO {LEDGER_TABLE} SELECT * FROM {LEGACY_TABLE}')
+        copied = cursor.rowcount
+        cursor.execute(f"SELECT setval('{SEQUENCE}', COALESCE((SELECT MAX(id) FROM {LEDGER_TABLE}), 0) + 1, false)")
+
+        if not keep_legacy:
+            cursor.execute(f'DROP TABLE {LEGACY_TABLE}')
+
+    with connection.schema_editor() as editor:
+        for index in model._meta.indexes:
+            editor.add_index(model, index)
+
+    logger.info(f"Registro movimenti partizionato: {copied} movimenti copiati")
+    return copied
+
+
+def detach_old_partitions(retention_months: Optional[int] = None,
+                          archive_schema: Optional[str] = '') -> List[str]:
+    """
+    Stacca le partizioni interamente più vecchie di retention_months: niente
+    DELETE sul registro. Le partizioni staccate vanno nello schema di
+    archivio (se configurato) oppure vengono eliminate.
+    """
+    config = ledger_settings()
+    retention_months = config['retention_months'] if retention_months is None else retention_months
+    archive_schema = config['archive_schema'] if archive_schema == '' else archive_schema
+    cutoff = add_months(month_start(timezone.now().date()), -retention_months)
+
+    quote = connection.ops.quote_name
+    # DETACH CONCURRENTLY (PostgreSQL 14+) non blocca le scritture, ma non può stare in una
+    # transazione ed è rifiutato se la tabella ha una partizione DEFAULT
+    concurrently = (
+        connection.pg_version >= 140000 and not connection.in_atomic_block and not default_partition_exists()
+    )
+
+    detached = []
+    for name, month in list_partitions():
+        if add_months(month, 1) > cutoff:
+            break
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"ALTER TABLE {LEDGER_TABLE} DETACH PARTITION {quote(name)}{' CONCURRENTLY' if concurrently else ''}"
+            )
+            if archive_schema:
+                cursor.execute(f'CREATE SCHEMA IF NOT EXISTS {quote(archive_schema)}')
+                cursor.execute(f'ALTER TABLE {quote(name)} SET SCHEMA {quote(archive_schema)}')
+            else:
+                cursor.execute(f'DROP TABLE {quote(name)}')
+        detached.append(name)
+
+    if detached:
+        logger.info(f"Partizioni registro movimenti staccate: {', '.join(detached)}")
+    return detached
+
+
+def maintain_partitions() -> Dict[str, List[str]]:
+    """Partizioni future create e vecchie staccate; nulla da fare se il registro non è partizionato"""
+    if not is_partitioned():
+        return {'created': [], 'detached': []}
+    result = {'created': ensure_partitions(), 'detached': detach_old_partitions()}
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT COUNT(*) FROM {DEFAULT_PARTITION}')
+        stray = cursor.fetchone()[0]
+    if stray:
+        # Righe fuori da ogni partizione mensile anche dopo la manutenzione (es. date future)
+        logger.error(f"Partizione DEFAULT del registro movimenti non vuota: {stray} righe")
+    return result
@@ -0,0 +1,138 @@
+import time
+import random
+import statistics
+import threading
+from decimal import Decimal
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.db.models import Sum
+from apps.stores.models import Store
+from apps.products.models import Category, Brand, Product
+from apps.inventory.models import StockReservation, StoreInventory
+from apps.inventory.reservations import InsufficientStock, reserve_stock
+
+PREFIX = 'benchmark-reservations'
+
+
+class Command(BaseCommand):
+    help = 'Benchmark prenotazioni concorrenti su pochi SKU molto richiesti: throughput, latenza, assenza di oversell'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16, help='Checkout paralleli (default 16)')
+        parser.add_argument('--orders', type=int, default=200, help='Ordini per thread (default 200)')
+        parser.add_argument('--skus', type=int, default=5, help='SKU contesi (default 5)')
+        parser.add_argument('--stock', type=int, default=500, help='Stock iniziale per SKU (default 500)')
+        parser.add_argument('--lines', type=int, default=3, help='Righe massime per ordine (default 3)')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            self.stderr.write(self.style.WARNING(
+                'Database non PostgreSQL: le scritture sono serializzate, il risultato non è indicativo'
+            ))
+
+        inventory_ids = self.generate(options['skus'], options['stock'])
+        try:
+            self.run(inventory_ids, options)
+            self.verify(inventory_ids)
+        finally:
+            self.cleanup()
+
+    def generate(self, skus, stock):
+        self.cleanup()
+        store = Store.objects.create(
+            name='Benchmark prenotazioni', slug=PREFIX, address='-', postal_code='00000', phone='-'
+        )
+        category = Category.objects.create(name='Benchmark prenotazioni', slug=PREFIX)
+        brand = Brand.objects.create(name='Benchmark prenotazioni', slug=PREFIX)
+        products = Product.objects.bulk_create([
+            Product(
+                sku=f'BENCHRES{i:04d}', name=f'SKU conteso {i}', slug=f'{PREFIX}-{i}',
+                category=category, brand=brand, product_type='glasses', price=Decimal('100.00'),
+            )
+            for i in range(skus)
+        ])
+        StoreInventory.objects.bulk_create([
+            StoreInventory(store=store, product=product, quantity=stock) for product in products
+        ])
+        return list(StoreInventory.objects.filter(store=store).values_list('pk', flat=True))
+
+    def run(self, inventory_ids, options):
+        timings, outcomes = [], {'reserved': 0, 'insufficient': 0, 'errors': 0}
+        lock = threading.Lock()
+
+        def checkout(worker):
+            rng = random.Random(worker)
+            local_timings, local = [], {'reserved': 0, 'insufficient': 0, 'errors': 0}
+            try:
+                for i in range(options['orders']):
+                    lines = [
+                        (inventory_id, rng.randint(1, 2))
+                        for inventory_id in rng.sample(inventory_ids, min(len(inventory_ids), rng.randint(1, options['lines'])))
+                    ]
+                    started = time.perf_counter()
+                    try:
+                        reserve_stock(lines, f'{PREFIX}-{worker}-{i}')
+                        local['reserved'] += 1
+                    except InsufficientStock:
+                        local['insufficient'] += 1
+                    except Exception as e:
+                        local['errors'] += 1
+                        self.stderr.write(f'Errore nel thread {worker}: {e}')
+                    local_timings.append((time.perf_counter() - started) * 1000)
+            finally:
+                connections.close_all()
+            with lock:
+                timings.extend(local_timings)
+                for key, value in local.items():
+                    outcomes[key] += value
+
+        threads = [threading.Thread(target=checkout, args=(worker,)) for worker in range(options['threads'])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        timings.sort()
+        total = len(timings)
+        self.stdout.write(
+            f"{options['threads']} thread, {total} ordini su {len(inventory_ids)} SKU in {elapsed:.2f}s: "
+            f"{total / elapsed:.0f} ordini/s"
+        )
+        self.stdout.write(
+            f"prenotati {outcomes['reserved']}, stock insufficiente {outcomes['insufficient']}, "
+            f"errori {outcomes['errors']}"
+        )
+        if timings:
+            self.stdout.write(
+                f'latenza p50 {statistics.median(timings):.2f} ms, '
+                f'p99 {timings[min(total - 1, int(total * 0.99))]:.2f} ms'
+            )
+
+    def verify(self, inventory_ids):
+        """Nessun oversell e reserved_quantity coerente con le prenotazioni attive"""
+        active = dict(
+            StockReservation.objects.filter(inventory_id__in=inventory_ids, status='active')
+            .values('inventory_id').annotate(total=Sum('quantity')).values_list('inventory_id', 'total')
+        )
+        problems = []
+        for inventory in StoreInventory.objects.filter(pk__in=inventory_ids):
+            if inventory.reserved_quantity > inventory.quantity:
+                problems.append(f'{inventory.pk}: prenotati {inventory.reserved_quantity} su {inventory.quantity}')
+            if inventory.reserved_quantity != active.get(inventory.pk, 0):
+                problems.append(
+                    f'{inventory.pk}: reserved_quantity {inventory.reserved_quantity}, '
+                    f'prenotazioni attive {active.get(inventory.pk, 0)}'
+                )
+        if problems:
+            raise CommandError('Inventario incoerente: ' + '; '.join(problems))
+        self.stdout.write(self.style.SUCCESS('Nessun oversell: inventario coerente con le prenotazioni'))
+
+    def cleanup(self):
+        StockReservation.objects.filter(inventory__store__slug=PREFIX).delete()
+        StoreInventory.objects.filter(store__slug=PREFIX).delete()
+        Product.objects.filter(slug__startswith=f'{PREFIX}-').delete()
+        Category.objects.filter(slug=PREFIX).delete()
+        Brand.objects.filter(slug=PREFIX).delete()
+        Store.objects.filter(slug=PREFIX).delete()
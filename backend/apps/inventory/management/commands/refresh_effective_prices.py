@@ -0,0 +1,28 @@
+import time
+from django.core.management.base import BaseCommand
+from apps.inventory.pricing import refresh_effective_prices, DEFAULT_BATCH_SIZE
+
+class Command(BaseCommand):
+    help = 'Ricalcola la tabella dei prezzi effettivi (prodotto, variante, store)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=DEFAULT_BATCH_SIZE,
+            help=f'Prodotti per transazione (default {DEFAULT_BATCH_SIZE})',
+        )
+        parser.add_argument(
+            '--product',
+            type=int,
+            action='append',
+            dest='products',
+            help='Solo il prodotto indicato (ripetibile)',
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        count = refresh_effective_prices(options['products'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Prezzi effettivi ricalcolati: {count} righe in {time.perf_counter() - started:.1f}s'
+        ))
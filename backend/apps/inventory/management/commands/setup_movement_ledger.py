@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand, CommandError
+from apps.inventory.ledger import (
+    convert_to_partitioned, detach_old_partitions, ensure_partitions, is_partitioned, partitioning_available,
+)
+
+class Command(BaseCommand):
+    help = 'Partiziona per mese il registro movimenti inventario e ne gestisce le partizioni'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--months-ahead',
+            type=int,
+            help='Partizioni future da creare (default INVENTORY_LEDGER["premake_months"])',
+        )
+        parser.add_argument(
+            '--keep-legacy',
+            action='store_true',
+            help='Conserva la tabella originale come inventory_movements_legacy dopo la conversione',
+        )
+        parser.add_argument(
+            '--detach',
+            action='store_true',
+            help='Stacca anche le partizioni oltre la retention',
+        )
+        parser.add_argument(
+            '--retention-months',
+            type=int,
+            help='Mesi di storico da mantenere con --detach (default INVENTORY_LEDGER["retention_months"])',
+        )
+
+    def handle(self, *args, **options):
+        if not partitioning_available():
+            raise CommandError('Il partizionamento del registro movimenti richiede PostgreSQL')
+
+        if not is_partitioned():
+            copied = convert_to_partitioned(keep_legacy=options['keep_legacy'])
+            self.stdout.write(self.style.SUCCESS(f'Registro partizionato: {copied} movimenti copiati'))
+
+        created = ensure_partitions(months_ahead=options['months_ahead'])
+        self.stdout.write(f"Partizioni create: {', '.join(created) or 'nessuna'}")
+
+        if options['detach']:
+            detached = detach_old_partitions(options['retention_months'])
+            self.stdout.write(f"Partizioni staccate: {', '.join(detached) or 'nessuna'}")
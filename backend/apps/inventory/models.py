@@ -44,7 +44,11 @@ class StoreInventory(TimeStampedModel):
 
 
 class InventoryMovement(TimeStampedModel):
-    """Log movimenti inventario"""
+    """
+    Log movimenti inventario: registro append-only, scritto a blocchi da
+    apps.inventory.ledger.append_movements. In PostgreSQL la tabella è
+    partizionata per mese su created_at (comando setup_movement_ledger).
+    """
     MOVEMENT_TYPES = [
         ('restock', 'Rifornimento'),
         ('sale', 'Vendita'),
@@ -72,6 +76,96 @@ class InventoryMovement(TimeStampedModel):
     class Meta:
         db_table = 'inventory_movements'
         ordering = ['-created_at']
+        indexes = [
+            # Paginazione keyset (apps.common.pagination.KeysetPagination)
+            models.Index(fields=['created_at', 'id'], name='inv_movements_keyset_idx'),
+            # Storico per store/prodotto e per prodotto
+            models.Index(fields=['store', 'product', 'created_at'], name='inv_movements_store_prod_idx'),
+            models.Index(fields=['product', 'created_at'], name='inv_movements_product_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.movement_type} - {self.product.name} ({self.quantity_change:+d})"
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError("I movimenti di inventario non si modificano: registrare un movimento di correzione")
+        super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        raise ValueError("I movimenti di inventario non si eliminano: lo storico vecchio viene archiviato per partizione")
+
+class StockReservation(TimeStampedModel):
+    """Quantità impegnata da un ordine su una riga di inventario (apps.inventory.reservations)"""
+    STATUS_CHOICES = [
+        ('active', 'Attiva'),
+        ('committed', 'Confermata'),
+        ('released', 'Rilasciata'),
+        ('expired', 'Scaduta'),
+    ]
+
+    inventory = models.ForeignKey(StoreInventory, on_delete=models.CASCADE, related_name='reservations')
+    reference = models.CharField(max_length=100)  # Numero ordine o identificativo checkout
+    quantity = models.PositiveIntegerField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='active')
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        db_table = 'stock_reservations'
+        indexes = [
+            models.Index(fields=['reference', 'status']),
+            # Sweeper delle prenotazioni scadute
+            models.Index(fields=['status', 'expires_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.reference} - {self.inventory_id} x{self.quantity} ({self.status})"
+
+
+class EffectivePrice(TimeStampedModel):
+    """
+    Prezzo di vendita precalcolato (apps.inventory.pricing): una riga per
+    prodotto, per variante attiva e per riga di inventario dello store.
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='effective_prices')
+    variant = models.ForeignKey(ProductVariant, on_delete=models.CASCADE, null=True, blank=True)
+    store = models.ForeignKey(Store, on_delete=models.CASCADE, null=True, blank=True)
+    inventory = models.OneToOneField(
+        StoreInventory, on_delete=models.CASCADE, null=True, blank=True, related_name='effective_price'
+    )
+
+    list_price = models.DecimalField(max_digits=10, decimal_places=2)  # Prezzo pieno (senza saldi)
+    price = models.DecimalField(max_digits=10, decimal_places=2)  # Prezzo applicato
+
+    class Meta:
+        db_table = 'effective_prices'
+        indexes = [
+            models.Index(fields=['product', 'store', 'variant']),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id}/{self.variant_id}/{self.store_id}: {self.price}"
+
+
+class StockSnapshot(models.Model):
+    """
+    Checkpoint giornaliero della quantità di una riga di inventario
+    (apps.inventory.snapshots): base per ricostruire lo stock a una data
+    con i soli movimenti successivi al checkpoint.
+    """
+    store = models.ForeignKey(Store, on_delete=models.CASCADE, related_name='stock_snapshots')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    variant = models.ForeignKey(ProductVariant, on_delete=models.CASCADE, null=True, blank=True)
+
+    quantity = models.PositiveIntegerField()
+    taken_at = models.DateTimeField()  # Istante di lettura di StoreInventory
+
+    class Meta:
+        db_table = 'stock_snapshots'
+        indexes = [
+            # Checkpoint più vicino per store e righe del checkpoint
+            models.Index(fields=['store', 'taken_at', 'product']),
+        ]
 
     def __str__(self):
-        return f"{self.movement_type} - {self.product.name} ({self.quantity_change:+d})"
\ No newline at end of file
+        return f"{self.store_id} - {self.product_id}/{self.variant_id} @ {self.taken_at:%Y-%m-%d}: {self.quantity}"
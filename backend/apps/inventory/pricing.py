@@ -0,0 +1,122 @@
+from decimal import Decimal
+from itertools import islice
+from typing import Dict, Iterable, List, Optional
+from django.db import transaction
+from django.db.models import Q
+from apps.products.models import Product, ProductVariant
+from .models import EffectivePrice, StoreInventory
+
+DEFAULT_BATCH_SIZE = 500
+
+
+def resolve_price(product: Product, variant: Optional[ProductVariant] = None,
+                  store_price: Optional[Decimal] = None) -> Decimal:
+    """Regola di prezzo: prezzo store se presente, altrimenti prezzo attuale del prodotto più la variante"""
+    if store_price is not None:
+        return store_price
+    adjustment = variant.price_adjustment if variant is not None else Decimal('0')
+    return product.current_price + adjustment
+
+
+def list_price(product: Product, variant: Optional[ProductVariant] = None) -> Decimal:
+    """Prezzo pieno, senza saldi né prezzi store"""
+    return product.price + (variant.price_adjustment if variant is not None else Decimal('0'))
+
+
+def inventory_price(inventory: StoreInventory) -> Decimal:
+    """Prezzo di una riga di inventario: dalla tabella precalcolata, o calcolato se non ancora presente"""
+    try:
+        return inventory.effective_price.price
+    except EffectivePrice.DoesNotExist:
+        return resolve_price(inventory.product, inventory.variant, inventory.store_price)
+
+
+def _price_rows(product_ids: List[int]) -> List[EffectivePrice]:
+    products = Product.objects.in_bulk(product_ids)
+    variants = {variant.pk: variant for variant in ProductVariant.objects.filter(product_id__in=product_ids)}
+
+    rows = []
+    for product in products.values():
+        rows.append(EffectivePrice(
+            product=product, list_price=list_price(product), price=resolve_price(product)
+        ))
+    for variant in variants.values():
+        if variant.is_active:
+            product = products[variant.product_id]
+            rows.append(EffectivePrice(
+                product=product, variant=variant,
+                list_price=list_price(product, variant), price=resolve_price(product, variant),
+            ))
+    for inventory in StoreInventory.objects.filter(product_id__in=product_ids).only(
+        'id', 'store_id', 'product_id', 'variant_id', 'store_price'
+    ):
+        product = products[inventory.product_id]
+        variant = variants.get(inventory.variant_id)
+        rows.append(EffectivePrice(
+            product=product, variant=variant, store_id=inventory.store_id, inventory=inventory,
+            list_price=list_price(product, variant),
+            price=resolve_price(product, variant, inventory.store_price),
+        ))
+    return rows
+
+
+def refresh_effective_prices(product_ids: Optional[Iterable[int]] = None,
+                             batch_size: int = DEFAULT_BATCH_SIZE) -> int:
+    """
+    Ricalcola i prezzi effettivi dei prodotti indicati (tutti se None), a
+    blocchi: per ogni blocco i prodotti vengono bloccati, le righe vecchie
+    cancellate e le nuove inserite con bulk_create nella stessa transazione,
+    così due aggiornamenti paralleli dello stesso prodotto non si sovrappongono.
+    """
+    if product_ids is None:
+        product_ids = Product.objects.order_by('pk').values_list('pk', flat=True).iterator(chunk_size=batch_size)
+    product_ids = iter(product_ids)
+
+    count = 0
+    while True:
+        chunk = sorted(set(islice(product_ids, batch_size)))
+        if not chunk:
+            return count
+        with transaction.atomic():
+            locked = list(Product.objects.select_for_update().filter(pk__in=chunk).values_list('pk', flat=True))
+            EffectivePrice.objects.filter(product_id__in=chunk).delete()
+            if locked:
+                count += len(EffectivePrice.objects.bulk_create(_price_rows(locked)))
+
+
+def refresh_inventory_price(inventory: StoreInventory) -> Optional[EffectivePrice]:
+    """
+    Ricalcola il solo prezzo effettivo di una riga di inventario, sotto lo
+    stesso lock di prodotto di refresh_effective_prices
+    """
+    with transaction.atomic():
+        product = Product.objects.select_for_update().filter(pk=inventory.product_id).first()
+        if product is None:
+            return None
+        variant = ProductVariant.objects.filter(pk=inventory.variant_id).first() if inventory.variant_id else None
+        price, _ = EffectivePrice.objects.update_or_create(inventory=inventory, defaults={
+            'product': product, 'variant': variant, 'store_id': inventory.store_id,
+            'list_price': list_price(product, variant),
+            'price': resolve_price(product, variant, inventory.store_price),
+        })
+        return price
+
+
+def effective_prices(product_ids: Iterable[int], store_id: Optional[int] = None) -> Dict[int, Dict]:
+    """
+    Prezzo effettivo a livello prodotto (senza variante) per un blocco di
+    prodotti: {product_id: {'price', 'list_price'}}, con il prezzo dello
+    store se indicato e disponibile. Una sola query sull'indice
+    (product, store, variant).
+    """
+    stores = Q(store__isnull=True) | Q(store_id=store_id) if store_id else Q(store__isnull=True)
+    rows = EffectivePrice.objects.filter(
+        stores, product_id__in=list(product_ids), variant__isnull=True
+    ).values_list('product_id', 'store_id', 'price', 'list_price')
+
+    prices = {}
+    for product_id, row_store_id, price, row_list_price in rows:
+        # La riga dello store prevale su quella generale
+        if row_store_id or product_id not in prices:
+            prices[product_id] = {'price': price, 'list_price': row_list_price}
+    return prices
@@ -0,0 +1,279 @@
+import logging
+from collections import defaultdict
+from datetime import timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import OperationalError, connection, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
+from .availability import invalidate_availability
+from .ledger import append_movements
+from .models import InventoryMovement, StockReservation, StoreInventory
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL_MINUTES = 15
+DEFAULT_ORDER_TTL_HOURS = 72
+DEADLOCK_RETRIES = 3
+
+# Colonne ritornate dagli UPDATE: (id, store_id, product_id, variant_id, quantity)
+Row = Tuple[int, int, int, Optional[int], int]
+ROW_COLUMNS = 'id, store_id, product_id, variant_id, quantity'
+
+
+class InsufficientStock(Exception):
+    """Stock disponibile insufficiente: nessuna riga dell'ordine è stata prenotata"""
+
+    def __init__(self, inventory_ids: Iterable[int]):
+        self.inventory_ids = sorted(inventory_ids)
+        super().__init__(f"Stock insufficiente per le righe di inventario {self.inventory_ids}")
+
+
+def reservation_ttl() -> timedelta:
+    return timedelta(minutes=getattr(settings, 'STOCK_RESERVATION_TTL_MINUTES', DEFAULT_TTL_MINUTES))
+
+
+def order_reservation_ttl() -> timedelta:
+    """
+    Prenotazioni di un ordine piazzato: valgono fino a conferma o
+    annullamento, con un limite di sicurezza. Un ordine confermato dopo la
+    scadenza viene prenotato di nuovo (apps.orders.signals).
+    """
+    return timedelta(hours=getattr(settings, 'ORDER_RESERVATION_TTL_HOURS', DEFAULT_ORDER_TTL_HOURS))
+
+
+def _is_deadlock(error: OperationalError) -> bool:
+    return getattr(error.__cause__, 'pgcode', None) == '40P01'
+
+
+def batched_updates() -> bool:
+    """UPDATE ... FROM con RETURNING: PostgreSQL e SQLite >= 3.35"""
+    if connection.vendor == 'postgresql':
+        return True
+    return connection.vendor == 'sqlite' and connection.Database.sqlite_version_info >= (3, 35)
+
+
+def _batched_update(quantities: Dict[int, int], assignments: str, condition: str = '') -> List[Row]:
+    """
+    Un solo UPDATE per tutte le righe: le quantità arrivano in una CTE
+    r(inventory_id, qty) e `assignments`/`condition` le usano come r.qty.
+    """
+    values = ', '.join(['(%s, %s)'] * len(quantities))
+    params = [value for pair in sorted(quantities.items()) for value in pair]
+    sql = (
+        f'WITH r(inventory_id, qty) AS (VALUES {values}) '
+        f'UPDATE {StoreInventory._meta.db_table} AS si SET {assignments}, updated_at = %s '
+        f'FROM r WHERE si.id = r.inventory_id {condition} '
+        f'RETURNING {ROW_COLUMNS}'
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [*params, connection.ops.adapt_datetimefield_value(timezone.now())])
+        return cursor.fetchall()
+
+
+def _fetch_rows(inventory_ids: Iterable[int]) -> List[Row]:
+    return list(StoreInventory.objects.filter(pk__in=list(inventory_ids)).values_list(
+        'id', 'store_id', 'product_id', 'variant_id', 'quantity'
+    ))
+
+
+def _reserve_rows(quantities: Dict[int, int]) -> List[Row]:
+    """
+    Prenota con un UPDATE condizionale: una riga viene incrementata solo se
+    quantity - reserved_quantity >= richiesta. Ritorna le righe prenotate.
+    Nessuna lettura preventiva: la condizione è valutata sul valore corrente
+    della riga, anche quando un'altra transazione l'ha appena modificata.
+    """
+    if batched_updates():
+        return _batched_update(
+            quantities,
+            'reserved_quantity = si.reserved_quantity + r.qty',
+            'AND si.quantity - si.reserved_quantity >= r.qty',
+        )
+
+    # Altri database: un UPDATE condizionale per riga, stessa semantica
+    now = timezone.now()
+    reserved = [
+        inventory_id for inventory_id, quantity in sorted(quantities.items())
+        if StoreInventory.objects.filter(
+            pk=inventory_id, quantity__gte=F('reserved_quantity') + quantity
+        ).update(reserved_quantity=F('reserved_quantity') + quantity, updated_at=now)
+    ]
+    return _fetch_rows(reserved) if reserved else []
+
+
+def _unreserve_rows(quantities: Dict[int, int], consume: bool = False) -> List[Row]:
+    """
+    Toglie le quantità da reserved_quantity; con consume=True anche da
+    quantity (merce venduta). Mai sotto zero.
+    """
+    if batched_updates():
+        assignments = [
+            'reserved_quantity = CASE WHEN si.reserved_quantity > r.qty '
+            'THEN si.reserved_quantity - r.qty ELSE 0 END'
+        ]
+        if consume:
+            assignments.append('quantity = CASE WHEN si.quantity > r.qty THEN si.quantity - r.qty ELSE 0 END')
+        return _batched_update(quantities, ', '.join(assignments))
+
+    now = timezone.now()
+    for inventory_id, quantity in sorted(quantities.items()):
+        changes = {
+            'reserved_quantity': Greatest(F('reserved_quantity') - quantity, Value(0)),
+            'updated_at': now,
+        }
+        if consume:
+            changes['quantity'] = Greatest(F('quantity') - quantity, Value(0))
+        StoreInventory.objects.filter(pk=inventory_id).update(**changes)
+    return _fetch_rows(quantities)
+
+
+def _restock_rows(quantities: Dict[int, int]) -> List[Row]:
+    """Riporta in quantity la merce di prenotazioni già consumate (vendita annullata)"""
+    if batched_updates():
+        return _batched_update(quantities, 'quantity = si.quantity + r.qty')
+
+    now = timezone.now()
+    for inventory_id, quantity in sorted(quantities.items()):
+        StoreInventory.objects.filter(pk=inventory_id).update(quantity=F('quantity') + quantity, updated_at=now)
+    return _fetch_rows(quantities)
+
+
+def _stock_changed(rows: List[Row]):
+    """
+    Dopo il commit: disponibilità in cache delle sole coppie (store, prodotto)
+    toccate. Nessun incremento della versione dell'inventario: invaliderebbe
+    a ogni checkout tutte le risposte prodotto in cache, che trattengono la
+    disponibilità al più AVAILABILITY_CACHE_TIMEOUT secondi.
+    """
+    pairs = {(store_id, product_id) for _, store_id, product_id, _, _ in rows}
+    transaction.on_commit(lambda: invalidate_availability(pairs))
+
+
+def reserve_stock(lines: Iterable[Tuple[int, int]], reference: str,
+                  ttl: Optional[timedelta] = None) -> List[StockReservation]:
+    """
+    Prenota tutte le righe di un ordine: `lines` sono coppie
+    (id StoreInventory, quantità), `reference` il numero d'ordine.
+
+    Tutto o niente: le righe vanno in un solo UPDATE condizionale; se anche una sola non ha stock sufficiente l'UPDATE viene
+    annullato e si solleva InsufficientStock. Su deadlock (ordini paralleli
+    con righe in comune) il tentativo si ripete dal savepoint.
+    """
+    quantities: Dict[int, int] = defaultdict(int)
+    for inventory_id, quantity in lines:
+        if quantity <= 0:
+            raise ValueError(f"Quantità non valida per la riga di inventario {inventory_id}: {quantity}")
+        quantities[inventory_id] += quantity
+    if not quantities:
+        return []
+
+    expires_at = timezone.now() + (ttl or reservation_ttl())
+    for attempt in range(1, DEADLOCK_RETRIES + 1):
+        try:
+            with transaction.atomic():
+                rows = _reserve_rows(quantities)
+                missing = set(quantities) - {row[0] for row in rows}
+                if missing:
+                    raise InsufficientStock(missing)
+
+                reservations = StockReservation.objects.bulk_create([
+                    StockReservation(
+                        inventory_id=inventory_id,
+                        reference=reference,
+                        quantity=quantity,
+                        expires_at=expires_at,
+                    )
+                    for inventory_id, quantity in quantities.items()
+                ])
+            break
+        except OperationalError as e:
+            if not _is_deadlock(e) or attempt == DEADLOCK_RETRIES:
+                raise
+            logger.warning(f"Deadlock prenotando {reference}, tentativo {attempt}/{DEADLOCK_RETRIES}")
+
+    _stock_changed(rows)
+    return reservations
+
+
+def _close_reservations(queryset, status: str, consume: bool = False, restock: bool = False,
+                        user: Optional[User] = None, limit: Optional[int] = None) -> int:
+    """
+    Porta le prenotazioni attive del queryset (confermate con restock=True)
+    allo stato indicato e aggiorna l'inventario con un solo UPDATE. Le
+    prenotazioni bloccate da un'altra transazione (stesso ordine chiuso in
+    parallelo, altro sweeper) vengono saltate: ognuna è chiusa una sola volta.
+    """
+    with transaction.atomic():
+        current = 'committed' if restock else 'active'
+        claimed = queryset.filter(status=current).select_for_update(skip_locked=True).values_list(
+            'id', 'inventory_id', 'quantity', 'reference'
+        )
+        claimed = list(claimed[:limit] if limit else claimed)
+        if not claimed:
+            return 0
+
+        StockReservation.objects.filter(pk__in=[row[0] for row in claimed]).update(
+            status=status, updated_at=timezone.now()
+        )
+        quantities: Dict[int, int] = defaultdict(int)
+        references: Dict[int, str] = {}
+        for _, inventory_id, quantity, reference in claimed:
+            quantities[inventory_id] += quantity
+            references[inventory_id] = reference
+        rows = _restock_rows(quantities) if restock else _unreserve_rows(quantities, consume=consume)
+
+        if status == 'expired':
+            # Ordini né confermati né annullati entro il TTL: lo stock torna disponibile
+            logger.warning(
+                f"Prenotazioni scadute senza conferma: {', '.join(sorted({row[3] for row in claimed}))}"
+            )
+        if consume or restock:
+            append_movements([
+                InventoryMovement(
+                    store_id=store_id,
+                    product_id=product_id,
+                    variant_id=variant_id,
+                    movement_type='return' if restock else 'sale',
+                    quantity_change=quantities[inventory_id] if restock else -quantities[inventory_id],
+                    quantity_after=quantity_after,
+                    reference_id=references[inventory_id],
+                    user=user,
+                )
+                for inventory_id, store_id, product_id, variant_id, quantity_after in rows
+            ])
+
+        _stock_changed(rows)
+    return len(claimed)
+
+
+def release_reservations(reference: str) -> int:
+    """Rilascia le prenotazioni attive di un ordine (es. ordine annullato)"""
+    return _close_reservations(StockReservation.objects.filter(reference=reference), 'released')
+
+
+def commit_reservations(reference: str, user: Optional[User] = None) -> int:
+    """Conferma le prenotazioni di un ordine: lo stock esce dall'inventario con movimento di vendita"""
+    return _close_reservations(
+        StockReservation.objects.filter(reference=reference), 'committed', consume=True, user=user
+    )
+
+
+def restock_reservations(reference: str, user: Optional[User] = None) -> int:
+    """Annulla la vendita di un ordine già confermato: lo stock rientra con movimento di reso"""
+    return _close_reservations(
+        StockReservation.objects.filter(reference=reference), 'released', restock=True, user=user
+    )
+
+
+def expire_reservations(batch_size: int = 1000) -> int:
+    """Rilascia le prenotazioni scadute, a blocchi di `batch_size` (una transazione per blocco)"""
+    total = 0
+    while True:
+        expired = StockReservation.objects.filter(expires_at__lte=timezone.now()).order_by('expires_at')
+        released = _close_reservations(expired, 'expired', limit=batch_size)
+        total += released
+        if released < batch_size:
+            return total
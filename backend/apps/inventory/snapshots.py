@@ -0,0 +1,154 @@
+import logging
+from collections import defaultdict
+from datetime import datetime
+from itertools import islice
+from typing import Dict, Iterable, List, Optional, Tuple
+from django.db import transaction
+from django.conf import settings
+from django.db.models import Max, Min, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+from apps.stores.models import Store
+from .models import InventoryMovement, StockSnapshot, StoreInventory
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 2000
+
+DEFAULT_SNAPSHOT_SETTINGS = {
+    'daily_days': 90,  # checkpoint giornalieri conservati
+    'monthly_months': 24,  # poi solo il primo checkpoint del mese, fino a questa età
+}
+
+StockKey = Tuple[int, Optional[int]]  # (product_id, variant_id)
+
+
+def take_snapshots(store_ids: Optional[Iterable[int]] = None,
+                   batch_size: int = DEFAULT_BATCH_SIZE) -> int:
+    """
+    Scrive un checkpoint delle quantità di tutte le righe di inventario degli
+    store indicati (tutti se None). Ogni store è scritto in una transazione:
+    un checkpoint è completo o assente, mai parziale.
+    """
+    if store_ids is None:
+        store_ids = Store.objects.order_by('pk').values_list('pk', flat=True)
+
+    count = 0
+    for store_id in store_ids:
+        with transaction.atomic():
+            taken_at = timezone.now()
+            rows = StoreInventory.objects.filter(store_id=store_id).order_by().values_list(
+                'product_id', 'variant_id', 'quantity'
+            ).iterator(chunk_size=batch_size)
+            while True:
+                chunk = list(islice(rows, batch_size))
+                if not chunk:
+                    break
+                count += len(StockSnapshot.objects.bulk_create([
+                    StockSnapshot(
+                        store_id=store_id, product_id=product_id, variant_id=variant_id,
+                        quantity=quantity, taken_at=taken_at,
+                    )
+                    for product_id, variant_id, quantity in chunk
+                ]))
+    logger.info(f"Checkpoint stock scritti: {count} righe")
+    return count
+
+
+def snapshot_settings() -> Dict:
+    return {**DEFAULT_SNAPSHOT_SETTINGS, **getattr(settings, 'STOCK_SNAPSHOTS', {})}
+
+
+def prune_snapshots() -> int:
+    """
+    Retention dei checkpoint: tutti quelli recenti, poi solo il primo di ogni
+    mese per store, poi nessuno. Una DELETE per store e mese sfoltito.
+    """
+    config = snapshot_settings()
+    now = timezone.now()
+    daily_cutoff = now - timezone.timedelta(days=config['daily_days'])
+    monthly_cutoff = now - timezone.timedelta(days=config['monthly_months'] * 31)
+
+    deleted, _ = StockSnapshot.objects.filter(taken_at__lt=monthly_cutoff).delete()
+    months = StockSnapshot.objects.filter(taken_at__lt=daily_cutoff).order_by().values(
+        'store_id', month=TruncMonth('taken_at')
+    ).annotate(first=Min('taken_at'), last=Max('taken_at'))
+    for row in months:
+        if row['first'] != row['last']:
+            deleted += StockSnapshot.objects.filter(
+                store_id=row['store_id'], taken_at__gt=row['first'], taken_at__lte=row['last'],
+            ).delete()[0]
+    if deleted:
+        logger.info(f"Checkpoint stock eliminati dalla retention: {deleted} righe")
+    return deleted
+
+
+def _checkpoint(store_id: int, when: datetime) -> Tuple[Optional[datetime], int]:
+    """
+    Checkpoint da cui ricostruire e verso del replay: l'ultimo non successivo
+    a when, altrimenti il primo dopo (all'indietro), altrimenti nessuno
+    (tutto il registro fino a when)
+    """
+    snapshots = StockSnapshot.objects.filter(store_id=store_id)
+    previous = snapshots.filter(taken_at__lte=when).aggregate(taken_at=Max('taken_at'))['taken_at']
+    if previous is not None:
+        return previous, 1
+    following = snapshots.filter(taken_at__gt=when).aggregate(taken_at=Min('taken_at'))['taken_at']
+    if following is not None:
+        return following, -1
+    return None, 1
+
+
+def stock_at(store_id: int, when: datetime,
+             product_ids: Optional[Iterable[int]] = None) -> Dict[StockKey, int]:
+    """
+    Quantità delle righe di inventario di uno store all'istante when:
+    {(product_id, variant_id): quantità}. Parte dal checkpoint più vicino e
+    somma i soli movimenti tra checkpoint e when: al più un giorno di
+    registro entro STOCK_SNAPSHOTS['daily_days'], un mese oltre; senza alcun
+    checkpoint dello store si ripercorre tutto il registro fino a when.
+    Nessun arrotondamento a zero: una quantità negativa indica un buco nel
+    registro, non uno stock.
+    """
+    product_ids = list(product_ids) if product_ids is not None else None
+    checkpoint, direction = _checkpoint(store_id, when)
+
+    stock: Dict[StockKey, int] = defaultdict(int)
+    if checkpoint is not None:
+        snapshots = StockSnapshot.objects.filter(store_id=store_id, taken_at=checkpoint)
+        if product_ids is not None:
+            snapshots = snapshots.filter(product_id__in=product_ids)
+        for product_id, variant_id, quantity in snapshots.values_list('product_id', 'variant_id', 'quantity'):
+            stock[(product_id, variant_id)] = quantity
+
+    movements = InventoryMovement.objects.filter(store_id=store_id)
+    if product_ids is not None:
+        movements = movements.filter(product_id__in=product_ids)
+    if direction > 0:
+        movements = movements.filter(created_at__lte=when)
+        if checkpoint is not None:
+            movements = movements.filter(created_at__gt=checkpoint)
+    else:
+        movements = movements.filter(created_at__gt=when, created_at__lte=checkpoint)
+
+    for product_id, variant_id, change in movements.order_by().values(
+        'product_id', 'variant_id'
+    ).annotate(change=Sum('quantity_change')).values_list('product_id', 'variant_id', 'change'):
+        stock[(product_id, variant_id)] += direction * change
+
+    return dict(stock)
+
+
+def product_stock_at(store_id: int, product_id: int, when: datetime,
+                     variant_id: Optional[int] = None) -> int:
+    """Quantità di un singolo prodotto (o variante) di uno store all'istante when"""
+    return stock_at(store_id, when, [product_id]).get((product_id, variant_id), 0)
+
+
+def stock_report(store_id: int, when: datetime, product_ids: Optional[Iterable[int]] = None) -> List[Dict]:
+    """Righe di stock_at pronte per la risposta API, ordinate per prodotto e variante"""
+    stock = stock_at(store_id, when, product_ids)
+    return [
+        {'product': product_id, 'variant': variant_id, 'quantity': stock[(product_id, variant_id)]}
+        for product_id, variant_id in sorted(stock, key=lambda key: (key[0], key[1] or 0))
+    ]
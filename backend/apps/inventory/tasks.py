@@ -0,0 +1,30 @@
+from celery import shared_task
+from celery.utils.log import get_task_logger
+from .ledger import maintain_partitions
+from .reservations import expire_reservations
+from .snapshots import prune_snapshots, take_snapshots
+
+logger = get_task_logger(__name__)
+
+@shared_task
+def release_expired_reservations_task():
+    """Rilascia lo stock delle prenotazioni scadute (checkout abbandonati)"""
+    released = expire_reservations()
+    if released:
+        logger.info(f"Prenotazioni scadute rilasciate: {released}")
+    return released
+
+@shared_task
+def maintain_movement_ledger_task():
+    """Crea le partizioni future del registro movimenti e stacca quelle oltre la retention"""
+    result = maintain_partitions()
+    if result['created'] or result['detached']:
+        logger.info(f"Registro movimenti: create {result['created']}, staccate {result['detached']}")
+    return result
+
+@shared_task
+def take_stock_snapshots_task():
+    """Checkpoint giornaliero delle quantità di inventario di tutti gli store, poi retention"""
+    written = take_snapshots()
+    prune_snapshots()
+    return written
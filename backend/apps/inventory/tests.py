@@ -0,0 +1,271 @@
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from unittest import mock
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, force_authenticate
+from apps.products.models import Category, Brand, Product, ProductVariant
+from apps.stores.models import Store
+from apps.common.cache import model_versions
+from .availability import availability_for_products
+from .models import EffectivePrice, StoreInventory, StockReservation, StockSnapshot, InventoryMovement
+from . import ledger
+from .ledger import add_months, append_movements, partition_name
+from .pricing import effective_prices
+from .reservations import (
+    InsufficientStock, commit_reservations, expire_reservations, release_reservations, reserve_stock,
+)
+from .snapshots import product_stock_at, prune_snapshots, stock_at, take_snapshots
+from .views import InventoryMovementViewSet
+
+class StockReservationTestCase(TestCase):
+    """Test per prenotazioni di stock"""
+
+    def setUp(self):
+        caches['default'].clear()
+        store = Store.objects.create(
+            name='Store Test', slug='store-test', address='Via Test 1', postal_code='90100', phone='091000000'
+        )
+        category = Category.objects.create(name='Occhiali', slug='occhiali')
+        brand = Brand.objects.create(name='Ray-Ban', slug='ray-ban')
+        self.inventory = [
+            StoreInventory.objects.create(
+                store=store,
+                product=Product.objects.create(
+                    sku=f'SKU{i}', name=f'Prodotto {i}', slug=f'prodotto-{i}',
+                    category=category, brand=brand, product_type='glasses', price=100
+                ),
+                quantity=5,
+            )
+            for i in range(2)
+        ]
+
+    def reserved(self, inventory):
+        inventory.refresh_from_db()
+        return inventory.reserved_quantity
+
+    def test_order_is_reserved_all_or_nothing(self):
+        """Test che una riga senza stock annulli la prenotazione dell'intero ordine"""
+        first, second = self.inventory
+        reserve_stock([(first.pk, 3), (second.pk, 5)], 'ORD-1')
+
+        with self.assertRaises(InsufficientStock) as raised:
+            reserve_stock([(first.pk, 2), (second.pk, 1)], 'ORD-2')
+
+        self.assertEqual(raised.exception.inventory_ids, [second.pk])
+        self.assertEqual(self.reserved(first), 3)
+        self.assertEqual(StockReservation.objects.filter(reference='ORD-2').count(), 0)
+
+    def test_release_commit_and_expiry(self):
+        """Test rilascio, conferma con movimento di vendita e scadenza"""
+        first, second = self.inventory
+        reserve_stock([(first.pk, 2)], 'ORD-1')
+        reserve_stock([(second.pk, 1)], 'ORD-2')
+        reserve_stock([(first.pk, 1)], 'ORD-3', ttl=timedelta(seconds=-1))
+
+        self.assertEqual(release_reservations('ORD-1'), 1)
+        self.assertEqual(release_reservations('ORD-1'), 0)
+        self.assertEqual(expire_reservations(), 1)
+        self.assertEqual(self.reserved(first), 0)
+
+        self.assertEqual(commit_reservations('ORD-2'), 1)
+        second.refresh_from_db()
+        self.assertEqual((second.quantity, second.reserved_quantity), (4, 0))
+        movement = InventoryMovement.objects.get(reference_id='ORD-2')
+        self.assertEqual((movement.movement_type, movement.quantity_change), ('sale', -1))
+
+    def test_reservation_invalidates_only_its_availability(self):
+        """Test che una prenotazione invalidi la disponibilità del prodotto, non la versione dell'inventario"""
+        first, second = self.inventory
+        product_ids = [first.product_id, second.product_id]
+        availability_for_products(product_ids, first.store_id)
+        versions = model_versions('inventory.storeinventory')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            reserve_stock([(first.pk, 2)], 'ORD-1')
+
+        self.assertEqual(model_versions('inventory.storeinventory'), versions)
+        with self.assertNumQueries(1):
+            availability = availability_for_products(product_ids, first.store_id)
+        self.assertEqual(availability[first.product_id]['quantity'], 3)
+
+class EffectivePriceTestCase(TestCase):
+    """Test per prezzi effettivi precalcolati"""
+
+    def setUp(self):
+        self.store = Store.objects.create(
+            name='Store Test', slug='store-test', address='Via Test 1', postal_code='90100', phone='091000000'
+        )
+        self.product = Product.objects.create(
+            sku='SKU1', name='Prodotto', slug='prodotto',
+            category=Category.objects.create(name='Occhiali', slug='occhiali'),
+            brand=Brand.objects.create(name='Ray-Ban', slug='ray-ban'),
+            product_type='glasses', price=Decimal('120.00')
+        )
+
+    def test_prices_follow_source_changes(self):
+        """Test aggiornamento incrementale da saldi e prezzi store"""
+        self.product.sale_price = Decimal('99.00')
+        self.product.save()
+        self.assertEqual(
+            effective_prices([self.product.pk])[self.product.pk],
+            {'price': Decimal('99.00'), 'list_price': Decimal('120.00')}
+        )
+
+        inventory = StoreInventory.objects.create(store=self.store, product=self.product, quantity=1)
+        self.assertEqual(effective_prices([self.product.pk], self.store.pk)[self.product.pk]['price'], Decimal('99.00'))
+
+        inventory.store_price = Decimal('89.00')
+        inventory.save()
+        self.assertEqual(effective_prices([self.product.pk], self.store.pk)[self.product.pk]['price'], Decimal('89.00'))
+        self.assertEqual(effective_prices([self.product.pk])[self.product.pk]['price'], Decimal('99.00'))
+
+    def test_inventory_save_refreshes_only_its_row(self):
+        """Test che il salvataggio di una riga di inventario non ricostruisca le altre"""
+        other_store = Store.objects.create(
+            name='Store Due', slug='store-due', address='Via Test 2', postal_code='90100', phone='091000001'
+        )
+        untouched = StoreInventory.objects.create(store=other_store, product=self.product, quantity=1)
+        untouched_price = EffectivePrice.objects.get(inventory=untouched).pk
+
+        inventory = StoreInventory.objects.create(store=self.store, product=self.product, quantity=1)
+        inventory.store_price = Decimal('89.00')
+        inventory.save()
+
+        self.assertEqual(EffectivePrice.objects.get(inventory=inventory).price, Decimal('89.00'))
+        self.assertEqual(EffectivePrice.objects.get(inventory=untouched).pk, untouched_price)
+
+    def test_product_with_variants_and_inventory_can_be_deleted(self):
+        """Test eliminazione di un prodotto con varianti e inventario senza prezzi orfani"""
+        variant = ProductVariant.objects.create(product=self.product, sku='SKU1-B', name='Nero')
+        StoreInventory.objects.create(store=self.store, product=self.product, quantity=1)
+        StoreInventory.objects.create(store=self.store, product=self.product, variant=variant, quantity=1)
+        self.assertEqual(EffectivePrice.objects.filter(product=self.product).count(), 4)
+
+        self.product.delete()
+
+        self.assertFalse(EffectivePrice.objects.exists())
+        self.assertFalse(StoreInventory.objects.exists())
+
+class MovementLedgerTestCase(TestCase):
+    """Test per registro movimenti append-only"""
+
+    def test_movements_are_append_only(self):
+        """Test inserimento a blocchi e divieto di modifica ed eliminazione"""
+        store = Store.objects.create(
+            name='Store Test', slug='store-test', address='Via Test 1', postal_code='90100', phone='091000000'
+        )
+        product = Product.objects.create(
+            sku='SKU1', name='Prodotto', slug='prodotto',
+            category=Category.objects.create(name='Occhiali', slug='occhiali'),
+            brand=Brand.objects.create(name='Ray-Ban', slug='ray-ban'),
+            product_type='glasses', price=100
+        )
+        with self.assertNumQueries(1):
+            append_movements([
+                InventoryMovement(
+                    store=store, product=product, movement_type='restock', quantity_change=i, quantity_after=i
+                )
+                for i in range(1, 4)
+            ])
+
+        movement = InventoryMovement.objects.first()
+        movement.notes = 'modificato'
+        with self.assertRaises(ValueError):
+            movement.save()
+        with self.assertRaises(ValueError):
+            movement.delete()
+        self.assertEqual(InventoryMovement.objects.count(), 3)
+
+        # Senza stima del database il conteggio è esatto e dichiarato tale
+        request = APIRequestFactory(HTTP_HOST='localhost').get('/api/v1/inventory/movements/')
+        force_authenticate(request, user=User.objects.create_user(username='magazzino'))
+        response = InventoryMovementViewSet.as_view({'get': 'list'})(request)
+        self.assertEqual((response.data['count'], response.data['count_is_approximate']), (3, False))
+
+    def test_monthly_partition_names(self):
+        """Test nomi e limiti delle partizioni mensili"""
+        self.assertEqual(partition_name(date(2025, 1, 1)), 'inventory_movements_y2025m01')
+        self.assertEqual(add_months(date(2025, 11, 1), 2), date(2026, 1, 1))
+        self.assertEqual(add_months(date(2025, 1, 1), -1), date(2024, 12, 1))
+
+    def test_retention_detach_with_default_partition(self):
+        """Test che la retention non usi DETACH CONCURRENTLY se esiste la partizione DEFAULT"""
+        now = datetime(2025, 6, 15, tzinfo=dt_timezone.utc)
+        old, recent = partition_name(date(2023, 1, 1)), partition_name(date(2025, 6, 1))
+        for default_exists, concurrently in ((True, False), (False, True)):
+            connection = mock.MagicMock(pg_version=160000, in_atomic_block=False)
+            cursor = connection.cursor.return_value.__enter__.return_value
+            with mock.patch.object(ledger, 'connection', connection), \
+                    mock.patch.object(ledger, 'default_partition_exists', return_value=default_exists), \
+                    mock.patch.object(ledger, 'list_partitions', return_value=[
+                        (old, date(2023, 1, 1)), (recent, date(2025, 6, 1)),
+                    ]), \
+                    mock.patch('django.utils.timezone.now', return_value=now):
+                connection.ops.quote_name = lambda name: f'"{name}"'
+                self.assertEqual(ledger.detach_old_partitions(retention_months=24, archive_schema=None), [old])
+
+            statements = [call.args[0] for call in cursor.execute.call_args_list]
+            self.assertEqual(statements, [
+                f'ALTER TABLE inventory_movements DETACH PARTITION "{old}"{" CONCURRENTLY" if concurrently else ""}',
+                f'DROP TABLE "{old}"',
+            ])
+
+class StockSnapshotTestCase(TestCase):
+    """Test per stock a una data da checkpoint e movimenti"""
+
+    def setUp(self):
+        self.store = Store.objects.create(
+            name='Store Test', slug='store-test', address='Via Test 1', postal_code='90100', phone='091000000'
+        )
+        self.product = Product.objects.create(
+            sku='SKU1', name='Prodotto', slug='prodotto',
+            category=Category.objects.create(name='Occhiali', slug='occhiali'),
+            brand=Brand.objects.create(name='Ray-Ban', slug='ray-ban'),
+            product_type='glasses', price=100
+        )
+        self.inventory = StoreInventory.objects.create(store=self.store, product=self.product, quantity=10)
+
+    def at(self, day, hour=12):
+        return datetime(2025, 3, day, hour, tzinfo=dt_timezone.utc)
+
+    def move(self, day, change):
+        self.inventory.quantity += change
+        StoreInventory.objects.filter(pk=self.inventory.pk).update(quantity=self.inventory.quantity)
+        with mock.patch('django.utils.timezone.now', return_value=self.at(day)):
+            append_movements([InventoryMovement(
+                store=self.store, product=self.product, movement_type='adjustment',
+                quantity_change=change, quantity_after=self.inventory.quantity,
+            )])
+
+    def test_stock_from_nearest_checkpoint(self):
+        """Test replay in avanti dal checkpoint precedente e all'indietro prima del primo checkpoint"""
+        self.move(1, 4)  # 14
+        with mock.patch('django.utils.timezone.now', return_value=self.at(2, 0)):
+            self.assertEqual(take_snapshots(), 1)
+        self.move(2, -3)  # 11
+        self.move(4, 5)  # 16
+
+        self.assertEqual(product_stock_at(self.store.pk, self.product.pk, self.at(1, 0)), 10)
+        self.assertEqual(product_stock_at(self.store.pk, self.product.pk, self.at(1, 18)), 14)
+        self.assertEqual(product_stock_at(self.store.pk, self.product.pk, self.at(3)), 11)
+        with self.assertNumQueries(3):
+            self.assertEqual(stock_at(self.store.pk, self.at(5)), {(self.product.pk, None): 16})
+
+    def test_snapshot_retention(self):
+        """Test retention: giornalieri recenti, poi il primo del mese, poi nessuno"""
+        now = timezone.now()
+        for days in (1, 2, 100, 101, 102, 1000):
+            StockSnapshot.objects.create(
+                store=self.store, product=self.product, quantity=1, taken_at=now - timedelta(days=days)
+            )
+
+        with self.settings(STOCK_SNAPSHOTS={'daily_days': 90, 'monthly_months': 24}):
+            prune_snapshots()
+
+        months = {timezone.localtime(now - timedelta(days=days)).strftime('%Y-%m') for days in (100, 101, 102)}
+        self.assertEqual(StockSnapshot.objects.filter(taken_at__lt=now - timedelta(days=90)).count(), len(months))
+        self.assertFalse(StockSnapshot.objects.filter(taken_at__lt=now - timedelta(days=900)).exists())
+        self.assertEqual(StockSnapshot.objects.filter(taken_at__gte=now - timedelta(days=90)).count(), 2)
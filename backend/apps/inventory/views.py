@@ -3,8 +3,12 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
 from django.db.models import Sum, F
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from apps.common.pagination import KeysetPagination
 from .models import StoreInventory, InventoryMovement
 from .serializers import StoreInventorySerializer, InventoryMovementSerializer
+from .snapshots import stock_report
 
 class StoreInventoryViewSet(viewsets.ReadOnlyModelViewSet):
     """ViewSet per inventario stores"""
@@ -48,13 +52,44 @@ class StoreInventoryViewSet(viewsets.ReadOnlyModelViewSet):
         
         return Response(summary)
 
+    @action(detail=False, methods=['get'])
+    def stock_at(self, request):
+        """Stock di uno store a una data (checkpoint giornaliero + movimenti successivi)"""
+        try:
+            store_id = int(request.query_params['store_id'])
+            product_ids = [int(pk) for pk in request.query_params.getlist('product_id')]
+            when = parse_datetime(request.query_params['at'])
+        except (KeyError, ValueError):
+            when = None
+
+        if when is None:
+            return Response(
+                {'error': 'Parametri store_id e at (data e ora ISO 8601) obbligatori'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if timezone.is_naive(when):
+            when = timezone.make_aware(when)
+
+        return Response({
+            'store': store_id,
+            'at': when,
+            'results': stock_report(store_id, when, product_ids or None),
+        })
+
 class InventoryMovementViewSet(viewsets.ReadOnlyModelViewSet):
     """ViewSet per movimenti inventario (solo lettura)"""
     serializer_class = InventoryMovementSerializer
     permission_classes = [permissions.IsAuthenticated]
     filter_backends = [DjangoFilterBackend]
-    filterset_fields = ['store', 'product', 'movement_type']
+    # Un intervallo su created_at limita le partizioni lette
+    filterset_fields = {
+        'store': ['exact'],
+        'product': ['exact'],
+        'movement_type': ['exact'],
+        'created_at': ['gte', 'lt'],
+    }
     ordering = ['-created_at']
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
         return InventoryMovement.objects.select_related(
@@ -0,0 +1,148 @@
+import time
+import statistics
+from decimal import Decimal
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework import serializers
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.test import APIRequestFactory, force_authenticate
+from apps.customers.models import Customer, Address
+from apps.products.models import Category, Brand, Product
+from apps.stores.models import Store
+from apps.orders.models import Order, OrderItem
+from apps.orders.serializers import OrderListSerializer
+from apps.orders.views import OrderViewSet
+
+PREFIX = 'benchmark-orders'
+
+
+class _Rollback(Exception):
+    pass
+
+
+class LegacyOrderListSerializer(OrderListSerializer):
+    """Lista precedente: conteggio righe da items.count (prefetch o una query per ordine)"""
+    items_count = serializers.IntegerField(source='items.count', read_only=True)
+    items_quantity = serializers.IntegerField(default=0, read_only=True)
+
+
+class LegacyOrderViewSet(OrderViewSet):
+    """Lista precedente: righe e prodotti precaricati per ogni pagina"""
+    pagination_class = PageNumberPagination
+
+    def get_queryset(self):
+        return Order.objects.filter(
+            customer=self.request.user.customer_profile
+        ).select_related('store', 'customer').prefetch_related('items__product')
+
+    def get_serializer_class(self):
+        return LegacyOrderListSerializer
+
+
+class Command(BaseCommand):
+    help = 'Benchmark lista ordini di un cliente con storico lungo: prefetch + count per riga contro query annotata'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=5000, help='Ordini del cliente (default 5000)')
+        parser.add_argument('--items', type=int, default=4, help='Righe per ordine (default 4)')
+        parser.add_argument('--repeat', type=int, default=20, help='Esecuzioni per pagina (default 20)')
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                user = self.generate(options['orders'], options['items'])
+                self.run(user, options['orders'], options['repeat'])
+                raise _Rollback
+        except _Rollback:
+            self.stdout.write('Dati generati rimossi (rollback)')
+
+    def generate(self, orders, items):
+        self.stdout.write(f'Generazione di {orders} ordini da {items} righe...')
+        started = time.perf_counter()
+
+        user = User.objects.create_user(username=PREFIX)
+        customer = Customer.objects.create(user=user)
+        address = Address.objects.create(
+            customer=customer, type='billing', first_name='Mario', last_name='Rossi',
+            address_line_1='Via Roma 1', city='Palermo', province='PA', postal_code='90100'
+        )
+        store = Store.objects.create(name='Benchmark ordini', slug=PREFIX, address='-', postal_code='00000', phone='-')
+        category = Category.objects.create(name='Benchmark ordini', slug=PREFIX)
+        brand = Brand.objects.create(name='Benchmark ordini', slug=PREFIX)
+        products = Product.objects.bulk_create([
+            Product(
+                sku=f'BENCHORD{i:03d}', name=f'Prodotto {i}', slug=f'{PREFIX}-{i}',
+                category=category, brand=brand, product_type='glasses', price=Decimal('80.00'),
+            )
+            for i in range(20)
+        ])
+
+        for start in range(0, orders, 1000):
+            created = Order.objects.bulk_create([
+                Order(
+                    order_number=f'BO{i:08d}', customer=customer, store=store, billing_address=address,
+                    fulfillment_method='pickup', status='delivered',
+                    subtotal=Decimal('80.00') * items, total_amount=Decimal('97.60') * items,
+                )
+                for i in range(start, min(start + 1000, orders))
+            ])
+            OrderItem.objects.bulk_create([
+                OrderItem(
+                    order=order, product=products[(order.pk + n) % len(products)], quantity=1,
+                    unit_price=Decimal('80.00'), total_price=Decimal('80.00'),
+                )
+                for order in created for n in range(items)
+            ])
+
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE orders; ANALYZE order_items')
+        self.stdout.write(f'Dati pronti in {time.perf_counter() - started:.1f}s')
+        return user
+
+    def run(self, user, orders, repeat):
+        factory = APIRequestFactory(HTTP_HOST=settings.ALLOWED_HOSTS[0])
+        last_page = max(1, (orders + 19) // 20)
+        pages = {
+            'prima pagina': {},
+            'pagina centrale': {'page': max(1, last_page // 2)},
+            'ultima pagina': {'page': last_page},
+        }
+
+        for label, view_class in [('prefetch righe', LegacyOrderViewSet), ('annotata', OrderViewSet)]:
+            view = view_class.as_view({'get': 'list'})
+            for page, params in pages.items():
+                def call():
+                    request = factory.get('/api/orders/', params)
+                    force_authenticate(request, user=user)
+                    response = view(request)
+                    response.render()
+                    return response
+
+                with CaptureQueriesContext(connection) as queries:
+                    call()
+                median = self.measure(call, repeat)
+                self.stdout.write(f'{label:>26} | {page:>16}: {median:8.2f} ms, {len(queries):3d} query')
+
+        view = OrderViewSet.as_view({'get': 'list'})
+
+        def cursor_call():
+            request = factory.get('/api/orders/', {'pagination': 'cursor'})
+            force_authenticate(request, user=user)
+            return view(request).render()
+
+        with CaptureQueriesContext(connection) as queries:
+            cursor_call()
+        median = self.measure(cursor_call, repeat)
+        self.stdout.write(f"{'annotata keyset':>26} | {'prima pagina':>16}: {median:8.2f} ms, {len(queries):3d} query")
+
+    def measure(self, fn, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            fn()
+            timings.append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings)
@@ -68,6 +68,10 @@ class Order(TimeStampedModel):
     # Tracking
     tracking_number = models.CharField(max_length=100, blank=True)
     
+    # Export verso gestionale
+    external_id = models.CharField(max_length=100, blank=True)
+    exported_at = models.DateTimeField(null=True, blank=True)
+    
     class Meta:
         db_table = 'orders'
         ordering = ['-created_at']
@@ -75,6 +79,9 @@ class Order(TimeStampedModel):
             models.Index(fields=['order_number']),
             models.Index(fields=['customer', 'status']),
             models.Index(fields=['store', 'status']),
+            models.Index(fields=['status', 'exported_at']),
+            # Lista ordini del cliente per data (anche paginazione keyset)
+            models.Index(fields=['customer', 'created_at', 'id'], name='orders_customer_created_idx'),
         ]
     
     def __str__(self):
@@ -0,0 +1,127 @@
+from decimal import Decimal
+from typing import Dict, List
+from django.db import transaction
+from rest_framework import serializers
+from apps.common.utils import calculate_tax, generate_order_number
+from apps.customers.models import Customer
+from apps.inventory.models import StoreInventory
+from apps.inventory.pricing import inventory_price
+from apps.inventory.reservations import InsufficientStock, order_reservation_ttl, reservation_ttl, reserve_stock
+from apps.stores.models import Store
+from .models import Order, OrderItem
+
+
+ORDER_NUMBER_PREFIX = 'OC'
+
+
+def resolve_lines(store: Store, items: List[Dict]) -> List[Dict]:
+    """
+    Valida e prezza tutte le righe con una sola query: inventario dello store
+    con prodotto, variante e prezzo effettivo precalcolato. Le righe non
+    vendibili online nello store producono un errore per riga, come i
+    serializer annidati di DRF.
+    """
+    inventory = {
+        (row.product_id, row.variant_id): row
+        for row in StoreInventory.objects.filter(
+            store=store, product_id__in={item['product_id'] for item in items}
+        ).select_related('product', 'variant', 'effective_price')
+    }
+
+    lines, errors = [], []
+    for item in items:
+        row = inventory.get((item['product_id'], item.get('variant_id')))
+        if (
+            row is None or not row.is_online_available or not row.product.is_active
+            or (row.variant_id and not row.variant.is_active)
+        ):
+            errors.append({'product': ['Prodotto non disponibile in questo negozio']})
+            continue
+
+        price = inventory_price(row)
+        lines.append({
+            **item,
+            'inventory': row,
+            'unit_price': price,
+            'total_price': price * item['quantity'],
+        })
+        errors.append({})
+
+    if any(errors):
+        raise serializers.ValidationError({'items': errors})
+    return lines
+
+
+def place_order(customer: Customer, lines: List[Dict], **order_data) -> Order:
+    """
+    Crea l'ordine in una transazione: prenotazione dello stock di tutte le
+    righe (un solo UPDATE), ordine e righe con bulk_create. Il numero di
+    query non dipende dal numero di righe.
+    """
+    subtotal = sum((line['total_price'] for line in lines), Decimal('0'))
+    tax_amount = calculate_tax(subtotal)
+    order_number = generate_order_number(ORDER_NUMBER_PREFIX, length=8)
+
+    with transaction.atomic():
+        try:
+            # Lo stock resta prenotato fino alla conferma (consumato) o all'annullamento (rilasciato)
+            reserve_stock(
+                [(line['inventory'].pk, line['quantity']) for line in lines], order_number,
+                ttl=order_reservation_ttl(),
+            )
+        except InsufficientStock as e:
+            unavailable = {line['inventory'].pk: line['inventory'].product.name for line in lines}
+            raise serializers.ValidationError({
+                'items': [f"Stock insufficiente: {unavailable[pk]}" for pk in e.inventory_ids]
+            })
+
+        order = Order.objects.create(
+            order_number=order_number,
+            customer=customer,
+            subtotal=subtotal,
+            tax_amount=tax_amount,
+            total_amount=subtotal + tax_amount,
+            **order_data
+        )
+        OrderItem.objects.bulk_create([
+            OrderItem(
+                order=order,
+                product=line['inventory'].product,
+                variant=line['inventory'].variant,
+                quantity=line['quantity'],
+                unit_price=line['unit_price'],
+                total_price=line['total_price'],
+                customizations=line.get('customizations', {}),
+                notes=line.get('notes', ''),
+            )
+            for line in lines
+        ])
+    return order
+
+
+def reserve_order_items(order: Order):
+    """
+    Prenota di nuovo lo stock delle righe di un ordine già piazzato, per
+    breve tempo: serve quando le prenotazioni originali sono scadute prima
+    della conferma. Senza stock sufficiente la conferma va rifiutata.
+    """
+    items = list(order.items.values_list('product_id', 'variant_id', 'quantity', 'product__name'))
+    inventory = {
+        (row.product_id, row.variant_id): row.pk
+        for row in StoreInventory.objects.filter(store_id=order.store_id, product_id__in={item[0] for item in items})
+    }
+    names = {}
+    lines = []
+    for product_id, variant_id, quantity, name in items:
+        inventory_id = inventory.get((product_id, variant_id))
+        if inventory_id is None:
+            raise serializers.ValidationError({'items': [f"Prodotto non disponibile in questo negozio: {name}"]})
+        names[inventory_id] = name
+        lines.append((inventory_id, quantity))
+
+    try:
+        reserve_stock(lines, order.order_number, ttl=reservation_ttl())
+    except InsufficientStock as e:
+        raise serializers.ValidationError({
+            'items': [f"Stock insufficiente: {names[pk]}" for pk in e.inventory_ids]
+        })
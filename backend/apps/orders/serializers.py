@@ -1,5 +1,6 @@
 from rest_framework import serializers
 from .models import Order, OrderItem, PrescriptionUpload
+from .placement import place_order, resolve_lines
 from apps.customers.serializers import AddressSerializer
 
 class OrderItemSerializer(serializers.ModelSerializer):
@@ -18,13 +19,15 @@ class OrderItemSerializer(serializers.ModelSerializer):
 class OrderListSerializer(serializers.ModelSerializer):
     """Serializer per lista ordini (ottimizzato)"""
     store_name = serializers.CharField(source='store.name', read_only=True)
-    items_count = serializers.IntegerField(source='items.count', read_only=True)
+    # Annotazioni del queryset di lista (OrderViewSet.get_queryset)
+    items_count = serializers.IntegerField(read_only=True)
+    items_quantity = serializers.IntegerField(read_only=True)
     
     class Meta:
         model = Order
         fields = [
             'id', 'order_number', 'store_name', 'status', 
-            'fulfillment_method', 'total_amount', 'items_count',
+            'fulfillment_method', 'total_amount', 'items_count', 'items_quantity',
             'created_at', 'estimated_delivery'
         ]
 
@@ -45,9 +48,19 @@ class OrderDetailSerializer(serializers.ModelSerializer):
             'items', 'created_at', 'updated_at'
         ]
 
+class OrderLineSerializer(serializers.Serializer):
+    """Riga d'ordine in ingresso: prezzo e disponibilità sono risolti lato server"""
+    product = serializers.IntegerField(source='product_id', min_value=1)
+    variant = serializers.IntegerField(source='variant_id', min_value=1, required=False, allow_null=True)
+    quantity = serializers.IntegerField(min_value=1)
+    unit_price = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
+    total_price = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
+    customizations = serializers.JSONField(required=False, default=dict)
+    notes = serializers.CharField(required=False, allow_blank=True, default='')
+
 class OrderCreateSerializer(serializers.ModelSerializer):
     """Serializer per creazione ordine"""
-    items = OrderItemSerializer(many=True)
+    items = OrderLineSerializer(many=True, allow_empty=False)
     
     class Meta:
         model = Order
@@ -56,31 +69,12 @@ class OrderCreateSerializer(serializers.ModelSerializer):
             'fulfillment_method', 'customer_notes', 'items'
         ]
     
+    def validate(self, attrs):
+        # Una sola query per prodotti, varianti e prezzi di tutte le righe
+        attrs['items'] = resolve_lines(attrs['store'], attrs['items'])
+        return attrs
+    
     def create(self, validated_data):
-        items_data = validated_data.pop('items')
+        lines = validated_data.pop('items')
         customer = self.context['request'].user.customer_profile
-        
-        # Genera order number
-        import uuid
-        order_number = f"OC{uuid.uuid4().hex[:8].upper()}"
-        
-        # Calcola totali
-        subtotal = sum(item['quantity'] * item['unit_price'] for item in items_data)
-        tax_amount = subtotal * 0.22  # IVA 22%
-        total_amount = subtotal + tax_amount
-        
-        order = Order.objects.create(
-            order_number=order_number,
-            customer=customer,
-            subtotal=subtotal,
-            tax_amount=tax_amount,
-            total_amount=total_amount,
-            **validated_data
-        )
-        
-        # Crea order items
-        for item_data in items_data:
-            item_data['total_price'] = item_data['quantity'] * item_data['unit_price']
-            OrderItem.objects.create(order=order, **item_data)
-        
-        return order
\ No newline at end of file
+        return place_order(customer, lines, **validated_data)
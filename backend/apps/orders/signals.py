@@ -0,0 +1,52 @@
+from django.db.models.signals import pre_save, post_save
+from apps.inventory.models import StockReservation
+from apps.inventory.reservations import commit_reservations, release_reservations, restock_reservations
+from .models import Order
+from .placement import reserve_order_items
+
+# Stati in cui la merce prenotata è venduta (esce dall'inventario) o torna disponibile
+CONSUMED_STATUSES = ('confirmed', 'processing')
+RELEASED_STATUSES = ('cancelled',)
+
+
+def remember_previous_status(sender, instance, update_fields=None, **kwargs):
+    """Stato prima del salvataggio, per riconoscere i cambi di stato"""
+    instance._previous_status = None
+    if instance.pk and (update_fields is None or 'status' in update_fields):
+        instance._previous_status = Order.objects.filter(pk=instance.pk).values_list('status', flat=True).first()
+
+
+def reserve_before_confirmation(sender, instance, **kwargs):
+    """
+    Ordine confermato dopo la scadenza delle sue prenotazioni: lo stock viene
+    prenotato di nuovo dalle righe dell'ordine, e consumato dopo il
+    salvataggio. Senza stock sufficiente la ValidationError blocca il cambio
+    di stato.
+    """
+    previous = getattr(instance, '_previous_status', None)
+    if previous is None or previous in CONSUMED_STATUSES or instance.status not in CONSUMED_STATUSES:
+        return
+    held = StockReservation.objects.filter(reference=instance.order_number, status__in=['active', 'committed'])
+    if not held.exists():
+        reserve_order_items(instance)
+
+
+def apply_status_to_reservations(sender, instance, created, update_fields=None, **kwargs):
+    """
+    Ordine confermato: prenotazioni consumate; annullato: prenotazioni
+    rilasciate e merce già venduta di nuovo in inventario
+    """
+    if created or (update_fields is not None and 'status' not in update_fields):
+        return
+    if instance.status == getattr(instance, '_previous_status', None):
+        return
+    if instance.status in CONSUMED_STATUSES:
+        commit_reservations(instance.order_number)
+    elif instance.status in RELEASED_STATUSES:
+        release_reservations(instance.order_number)
+        restock_reservations(instance.order_number)
+
+
+pre_save.connect(remember_previous_status, sender=Order, dispatch_uid='order-previous-status')
+pre_save.connect(reserve_before_confirmation, sender=Order, dispatch_uid='order-confirmation-stock')
+post_save.connect(apply_status_to_reservations, sender=Order, dispatch_uid='order-status-reservations')
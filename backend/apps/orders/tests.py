@@ -0,0 +1,196 @@
+from datetime import timedelta
+from decimal import Decimal
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+from rest_framework.test import APIRequestFactory, force_authenticate
+from apps.customers.models import Customer, Address
+from apps.inventory.models import InventoryMovement, StockReservation, StoreInventory
+from apps.inventory.reservations import expire_reservations
+from apps.products.models import Category, Brand, Product
+from apps.stores.models import Store
+from .models import Order, OrderItem
+from .serializers import OrderCreateSerializer
+from .views import OrderViewSet
+
+class OrderCreateTestCase(TestCase):
+    """Test per creazione ordini"""
+
+    def setUp(self):
+        user = User.objects.create_user(username='cliente', password='testpass123')
+        self.customer = Customer.objects.create(user=user)
+        self.address = Address.objects.create(
+            customer=self.customer, type='billing', first_name='Mario', last_name='Rossi',
+            address_line_1='Via Roma 1', city='Palermo', province='PA', postal_code='90100'
+        )
+        self.store = Store.objects.create(
+            name='Store Test', slug='store-test', address='Via Test 1', postal_code='90100', phone='091000000'
+        )
+        category = Category.objects.create(name='Occhiali', slug='occhiali')
+        brand = Brand.objects.create(name='Ray-Ban', slug='ray-ban')
+        self.products = []
+        for i in range(10):
+            product = Product.objects.create(
+                sku=f'SKU{i}', name=f'Prodotto {i}', slug=f'prodotto-{i}',
+                category=category, brand=brand, product_type='glasses', price=Decimal('99.90')
+            )
+            StoreInventory.objects.create(store=self.store, product=product, quantity=3)
+            self.products.append(product)
+
+        self.request = APIRequestFactory().post('/')
+        self.request.user = user
+
+    def place(self, products, quantity=1):
+        serializer = OrderCreateSerializer(data={
+            'store': self.store.pk,
+            'billing_address': self.address.pk,
+            'fulfillment_method': 'pickup',
+            'items': [{'product': product.pk, 'quantity': quantity, 'unit_price': '0.01'} for product in products],
+        }, context={'request': self.request})
+        serializer.is_valid(raise_exception=True)
+        return serializer.save()
+
+    def test_prices_lines_and_reserves_stock(self):
+        """Test prezzi lato server, totali Decimal e prenotazione dello stock"""
+        order = self.place(self.products[:2], quantity=2)
+
+        self.assertEqual(order.subtotal, Decimal('399.60'))
+        self.assertEqual(order.tax_amount, Decimal('87.91'))
+        self.assertEqual(order.total_amount, Decimal('487.51'))
+        self.assertEqual(
+            list(StoreInventory.objects.filter(product__in=self.products[:2]).values_list('reserved_quantity', flat=True)),
+            [2, 2]
+        )
+
+    def test_query_count_does_not_depend_on_lines(self):
+        """Test numero di query costante al crescere delle righe"""
+        with CaptureQueriesContext(connection) as single:
+            self.place(self.products[:1])
+        with CaptureQueriesContext(connection) as ten:
+            self.place(self.products)
+
+        self.assertEqual(len(ten), len(single))
+        for line in OrderCreateSerializer(self.customer.orders.first()).data['items']:
+            self.assertEqual(line['unit_price'], '99.90')
+
+    def test_insufficient_stock_creates_nothing(self):
+        """Test che uno stock insufficiente annulli l'intero ordine"""
+        with self.assertRaises(ValidationError):
+            self.place(self.products[:2], quantity=4)
+
+        self.assertFalse(self.customer.orders.exists())
+        self.assertFalse(StoreInventory.objects.filter(reserved_quantity__gt=0).exists())
+
+    def test_confirmation_consumes_and_cancellation_releases(self):
+        """Test conferma (stock venduto) e annullamento (stock rilasciato) dell'ordine"""
+        confirmed = self.place(self.products[:1], quantity=2)
+        cancelled = self.place(self.products[1:2], quantity=2)
+        reservation = StockReservation.objects.get(reference=confirmed.order_number)
+        self.assertGreater(reservation.expires_at, timezone.now() + timedelta(hours=1))
+
+        confirmed.status = 'confirmed'
+        confirmed.save()
+        cancelled.status = 'cancelled'
+        cancelled.save()
+
+        self.assertEqual(
+            list(StoreInventory.objects.filter(product__in=self.products[:2]).order_by('product_id').values_list(
+                'quantity', 'reserved_quantity'
+            )),
+            [(1, 0), (3, 0)]
+        )
+        movement = InventoryMovement.objects.get(reference_id=confirmed.order_number)
+        self.assertEqual((movement.movement_type, movement.quantity_change), ('sale', -2))
+
+    def stock(self, product):
+        return StoreInventory.objects.filter(product=product).values_list('quantity', 'reserved_quantity').get()
+
+    def test_confirmation_after_expiry_reserves_again(self):
+        """Test conferma dopo la scadenza delle prenotazioni: stock prenotato di nuovo e venduto"""
+        order = self.place(self.products[:1], quantity=2)
+        StockReservation.objects.filter(reference=order.order_number).update(expires_at=timezone.now())
+        self.assertEqual(expire_reservations(), 1)
+
+        order.status = 'confirmed'
+        order.save()
+
+        self.assertEqual(self.stock(self.products[0]), (1, 0))
+        movement = InventoryMovement.objects.get(reference_id=order.order_number)
+        self.assertEqual((movement.movement_type, movement.quantity_change), ('sale', -2))
+
+    def test_confirmation_after_expiry_without_stock_is_refused(self):
+        """Test conferma rifiutata se lo stock scaduto è stato nel frattempo venduto"""
+        order = self.place(self.products[:1], quantity=2)
+        StockReservation.objects.filter(reference=order.order_number).update(expires_at=timezone.now())
+        expire_reservations()
+        self.place(self.products[:1], quantity=3)
+
+        order.status = 'confirmed'
+        with self.assertRaises(ValidationError):
+            order.save()
+
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'pending')
+        self.assertEqual(self.stock(self.products[0]), (3, 3))
+        self.assertFalse(InventoryMovement.objects.filter(reference_id=order.order_number).exists())
+
+    def test_cancelling_confirmed_order_restocks(self):
+        """Test annullamento di un ordine confermato: merce di nuovo in inventario con movimento di reso"""
+        order = self.place(self.products[:1], quantity=2)
+        order.status = 'confirmed'
+        order.save()
+        order.status = 'cancelled'
+        order.save()
+
+        self.assertEqual(self.stock(self.products[0]), (3, 0))
+        self.assertEqual(
+            list(InventoryMovement.objects.filter(reference_id=order.order_number).order_by('id').values_list(
+                'movement_type', 'quantity_change', 'quantity_after'
+            )),
+            [('sale', -2, 1), ('return', 2, 3)]
+        )
+
+class OrderListTestCase(TestCase):
+    """Test per lista ordini"""
+
+    def setUp(self):
+        user = User.objects.create_user(username='cliente', password='testpass123')
+        customer = Customer.objects.create(user=user)
+        address = Address.objects.create(
+            customer=customer, type='billing', first_name='Mario', last_name='Rossi',
+            address_line_1='Via Roma 1', city='Palermo', province='PA', postal_code='90100'
+        )
+        store = Store.objects.create(
+            name='Store Test', slug='store-test', address='Via Test 1', postal_code='90100', phone='091000000'
+        )
+        product = Product.objects.create(
+            sku='SKU1', name='Prodotto', slug='prodotto',
+            category=Category.objects.create(name='Occhiali', slug='occhiali'),
+            brand=Brand.objects.create(name='Ray-Ban', slug='ray-ban'),
+            product_type='glasses', price=Decimal('50.00')
+        )
+        for i in range(15):
+            order = Order.objects.create(
+                order_number=f'OC{i:04d}', customer=customer, store=store, billing_address=address,
+                fulfillment_method='pickup', subtotal=Decimal('100.00'), total_amount=Decimal('122.00')
+            )
+            OrderItem.objects.bulk_create([
+                OrderItem(order=order, product=product, quantity=2, unit_price=product.price, total_price=Decimal('100.00'))
+                for _ in range(i % 3)
+            ])
+        self.user = user
+
+    def test_list_counts_items_in_sql(self):
+        """Test conteggio righe annotato senza query per ordine"""
+        request = APIRequestFactory().get('/', HTTP_HOST='localhost')
+        force_authenticate(request, user=self.user)
+        with CaptureQueriesContext(connection) as queries:
+            response = OrderViewSet.as_view({'get': 'list'})(request)
+
+        self.assertEqual(len(queries), 2)  # conteggio e pagina
+        counts = {row['order_number']: (row['items_count'], row['items_quantity']) for row in response.data['results']}
+        self.assertEqual(counts['OC0002'], (2, 4))
+        self.assertEqual(counts['OC0003'], (0, 0))
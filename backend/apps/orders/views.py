@@ -2,21 +2,48 @@ from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
-from .models import Order
+from django.db.models import Count, Prefetch, Sum
+from django.db.models.functions import Coalesce
+from apps.common.pagination import KeysetPagination
+from .models import Order, OrderItem
 from .serializers import OrderListSerializer, OrderDetailSerializer, OrderCreateSerializer
 
+# Colonne lette dalla lista ordini (OrderListSerializer)
+LIST_FIELDS = [
+    'id', 'order_number', 'store__name', 'status', 'fulfillment_method',
+    'total_amount', 'created_at', 'estimated_delivery',
+]
+
+class OrderPagination(KeysetPagination):
+    """Pagine numerate di default; keyset con ?pagination=cursor per storici lunghi"""
+    opt_in = True
+    count_mode = 'exact'
+
 class OrderViewSet(viewsets.ModelViewSet):
     """ViewSet per ordini clienti"""
     permission_classes = [permissions.IsAuthenticated]
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['status', 'fulfillment_method', 'store']
     ordering = ['-created_at']
+    pagination_class = OrderPagination
 
     def get_queryset(self):
         # I clienti vedono solo i propri ordini
-        return Order.objects.filter(
-            customer=self.request.user.customer_profile
-        ).select_related('store', 'customer').prefetch_related('items__product')
+        queryset = Order.objects.filter(customer=self.request.user.customer_profile)
+        
+        if self.action == 'list':
+            # Solo le colonne mostrate; conteggio e quantità delle righe in SQL
+            return queryset.select_related('store').only(*LIST_FIELDS).annotate(
+                items_count=Count('items'),
+                items_quantity=Coalesce(Sum('items__quantity'), 0),
+            )
+        if self.action == 'retrieve':
+            return queryset.select_related(
+                'store', 'billing_address', 'shipping_address'
+            ).prefetch_related(
+                Prefetch('items', queryset=OrderItem.objects.select_related('product', 'variant'))
+            )
+        return queryset
 
     def get_serializer_class(self):
         if self.action == 'create':
@@ -40,6 +67,7 @@ class OrderViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
+        # Le prenotazioni di stock vengono rilasciate dal cambio di stato (apps.orders.signals)
         order.status = 'cancelled'
         order.save()
         
@@ -3,4 +3,7 @@ from django.apps import AppConfig
 class ProductsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.products'
-    verbose_name = 'Prodotti'
\ No newline at end of file
+    verbose_name = 'Prodotti'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,248 @@
+import json
+import logging
+import unicodedata
+import uuid
+from typing import Dict, Iterable, List, Optional, Tuple
+from django.core.cache import caches
+from django.db.models import Q
+from .models import Brand, Product
+
+logger = logging.getLogger(__name__)
+
+INDEX_KEY = 'autocomplete:index'
+KINDS = ('product', 'brand')
+MEMBERS_KEY = 'autocomplete:members'
+READY_KEY = 'autocomplete:ready'
+REBUILD_LOCK_KEY = 'autocomplete:rebuild-lock'
+
+# Durata in cache dei suggerimenti per le query recenti
+SUGGESTIONS_CACHE_TIMEOUT = 60
+
+# Membri letti per prefisso: più del limite, perché un documento ha più termini
+SCAN_FACTOR = 4
+PRODUCT_LIMIT = 5
+BRAND_LIMIT = 3
+
+Document = Tuple[str, Dict, Iterable[str]]
+
+
+def normalize(text: str) -> str:
+    """Minuscolo, senza accenti, spazi compattati"""
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return ' '.join(text.lower().split())
+
+
+def _tails(text: str) -> set:
+    """'ray-ban aviator nero' -> se stesso, 'aviator nero', 'nero': prefisso di ogni parola"""
+    words = normalize(text).split()
+    return {' '.join(words[i:]) for i in range(len(words))}
+
+
+def product_document(product: Product) -> Document:
+    payload = {
+        'type': 'product',
+        'title': product.name,
+        'subtitle': product.brand.name,
+        'url': f'/prodotti/{product.slug}',
+        'image': product.main_image.url if product.main_image else None,
+    }
+    return f'product:{product.pk}', payload, _tails(product.name) | {normalize(product.sku)}
+
+
+def brand_document(brand: Brand) -> Document:
+    payload = {
+        'type': 'brand',
+        'title': brand.name,
+        'url': f'/prodotti?brand={brand.slug}',
+        'image': brand.logo.url if brand.logo else None,
+    }
+    return f'brand:{brand.pk}', payload, _tails(brand.name)
+
+
+def _member(term: str, doc_id: str, payload: Dict) -> str:
+    # Il payload sta nel membro stesso: un solo ZRANGEBYLEX per risposta
+    return f'{term}\x00{doc_id}\x00{json.dumps(payload, separators=(",", ":"))}'
+
+
+class AutocompleteIndex:
+    """
+    Indice di prefissi su Redis (sorted set a punteggio costante, ordine lessicografico).
+
+    Ogni termine normalizzato (nome, ogni coda del nome a partire da una parola,
+    SKU, nome brand) è un membro 'termine\\0doc\\0payload' del sorted set del
+    suo tipo (prodotti e brand separati); una ricerca per prefisso è un
+    ZRANGEBYLEX per tipo, in un'unica pipeline. L'hash MEMBERS_KEY tiene i membri di ogni
+    documento per gli aggiornamenti incrementali. Senza Redis (o con Redis
+    degradato) i metodi ritornano None e il chiamante usa il database.
+    """
+
+    def __init__(self, cache_alias: str = 'default'):
+        self.cache_alias = cache_alias
+
+    def client(self):
+        cache = caches[self.cache_alias]
+        if not hasattr(cache, 'redis_client') or getattr(cache, 'is_degraded', False):
+            return None
+        return cache.redis_client
+
+    def _write(self, pipe, documents: List[Document], index_key: str, members_key: str,
+               previous: Optional[List] = None):
+        for position, (doc_id, payload, terms) in enumerate(documents):
+            kind_key = f"{index_key}:{doc_id.split(':', 1)[0]}"
+            if previous and previous[position]:
+                pipe.zrem(kind_key, *json.loads(previous[position]))
+            members = [_member(term, doc_id, payload) for term in terms if term]
+            if members:
+                pipe.zadd(kind_key, {member: 0 for member in members})
+            pipe.hset(members_key, doc_id, json.dumps(members))
+
+    def index_documents(self, documents: List[Document]) -> bool:
+        """Aggiunge o sostituisce i documenti indicati"""
+        client = self.client()
+        if client is None or not documents:
+            return False
+        try:
+            previous = client.hmget(MEMBERS_KEY, [doc_id for doc_id, _, _ in documents])
+            pipe = client.pipeline(transaction=True)
+            self._write(pipe, documents, INDEX_KEY, MEMBERS_KEY, previous)
+            pipe.execute()
+            return True
+        except Exception as e:
+            logger.warning(f"Aggiornamento indice autocomplete fallito: {e}")
+            return False
+
+    def remove(self, doc_ids: List[str]) -> bool:
+        client = self.client()
+        if client is None or not doc_ids:
+            return False
+        try:
+            previous = client.hmget(MEMBERS_KEY, doc_ids)
+            pipe = client.pipeline(transaction=True)
+            for doc_id, members in zip(doc_ids, previous):
+                if members:
+                    pipe.zrem(f"{INDEX_KEY}:{doc_id.split(':', 1)[0]}", *json.loads(members))
+            pipe.hdel(MEMBERS_KEY, *doc_ids)
+            pipe.execute()
+            return True
+        except Exception as e:
+            logger.warning(f"Rimozione dall'indice autocomplete fallita: {e}")
+            return False
+
+    def rebuild(self, batch_size: int = 1000) -> int:
+        """
+        Ricostruisce l'indice in chiavi temporanee e le sostituisce con RENAME.
+        Le chiavi temporanee sono proprie di ogni esecuzione: due ricostruzioni
+        sovrapposte non si cancellano i dati a vicenda e ognuna pubblica un
+        indice completo. Gli aggiornamenti incrementali arrivati durante la
+        ricostruzione possono andare persi: la ricostruzione notturna li riallinea.
+        """
+        client = self.client()
+        if client is None:
+            return 0
+
+        run = uuid.uuid4().hex
+        tmp_index, tmp_members = f'{INDEX_KEY}:tmp:{run}', f'{MEMBERS_KEY}:tmp:{run}'
+        tmp_keys = [tmp_members, *[f'{tmp_index}:{kind}' for kind in KINDS]]
+
+        try:
+            count = 0
+            batch: List[Document] = [brand_document(brand) for brand in Brand.objects.filter(is_active=True)]
+            products = Product.objects.filter(is_active=True, brand__is_active=True).select_related('brand')
+            for product in products.iterator(chunk_size=batch_size):
+                batch.append(product_document(product))
+                if len(batch) >= batch_size:
+                    count += self._flush(client, batch, tmp_index, tmp_members)
+                    batch = []
+            count += self._flush(client, batch, tmp_index, tmp_members)
+
+            # RENAME fallisce su chiavi inesistenti: tipi senza documenti vanno cancellati
+            existing = [client.exists(f'{tmp_index}:{kind}') for kind in KINDS]
+            pipe = client.pipeline(transaction=True)
+            for kind, exists in zip(KINDS, existing):
+                if exists:
+                    pipe.rename(f'{tmp_index}:{kind}', f'{INDEX_KEY}:{kind}')
+                else:
+                    pipe.delete(f'{INDEX_KEY}:{kind}')
+            if count:
+                pipe.rename(tmp_members, MEMBERS_KEY)
+            else:
+                pipe.delete(MEMBERS_KEY)
+            pipe.set(READY_KEY, 1)
+            pipe.execute()
+        finally:
+            # Ricostruzione interrotta: niente chiavi temporanee orfane (dopo RENAME non esistono più)
+            client.delete(*tmp_keys)
+        logger.info(f"Indice autocomplete ricostruito: {count} documenti")
+        return count
+
+    def _flush(self, client, documents: List[Document], index_key: str, members_key: str) -> int:
+        if not documents:
+            return 0
+        pipe = client.pipeline(transaction=False)
+        self._write(pipe, documents, index_key, members_key)
+        pipe.execute()
+        return len(documents)
+
+    def suggest(self, query: str, products: int = PRODUCT_LIMIT, brands: int = BRAND_LIMIT) -> Optional[List[Dict]]:
+        """Suggerimenti per prefisso, o None se l'indice non è disponibile o non è pronto"""
+        client = self.client()
+        prefix = normalize(query)
+        if client is None or not prefix:
+            return None
+        try:
+            limits = {'product': products, 'brand': brands}
+            encoded = prefix.encode('utf-8')
+            pipe = client.pipeline(transaction=False)
+            pipe.exists(READY_KEY)
+            for kind in KINDS:
+                pipe.zrangebylex(
+                    f'{INDEX_KEY}:{kind}', b'[' + encoded, b'[' + encoded + b'\xff',
+                    start=0, num=limits[kind] * SCAN_FACTOR,
+                )
+            ready, *members_by_kind = pipe.execute()
+        except Exception as e:
+            logger.warning(f"Indice autocomplete non disponibile: {e}")
+            return None
+        if not ready:
+            return None
+
+        suggestions = []
+        for kind, members in zip(KINDS, members_by_kind):
+            seen = set()
+            for member in members:
+                _, doc_id, payload = member.decode('utf-8').split('\x00', 2)
+                if doc_id in seen:
+                    continue
+                seen.add(doc_id)
+                suggestions.append(json.loads(payload))
+                if len(seen) >= limits[kind]:
+                    break
+        return suggestions
+
+
+autocomplete_index = AutocompleteIndex()
+
+
+def database_suggestions(query: str) -> List[Dict]:
+    """Suggerimenti con icontains sul database, usati con indice freddo"""
+    products = Product.objects.filter(
+        Q(name__icontains=query) | Q(sku__icontains=query),
+        is_active=True
+    ).select_related('brand')[:PRODUCT_LIMIT]
+    brands = Brand.objects.filter(name__icontains=query, is_active=True)[:BRAND_LIMIT]
+
+    return [product_document(product)[1] for product in products] + \
+        [brand_document(brand)[1] for brand in brands]
+
+
+def schedule_autocomplete_rebuild():
+    """Accoda una ricostruzione dell'indice, al massimo una ogni 10 minuti"""
+    cache = caches['default']
+    if not cache.add(REBUILD_LOCK_KEY, 1, 600):
+        return
+    from .tasks import rebuild_autocomplete_index_task
+    try:
+        rebuild_autocomplete_index_task.delay()
+    except Exception as e:
+        logger.warning(f"Impossibile accodare la ricostruzione autocomplete: {e}")
@@ -0,0 +1,170 @@
+from collections import Counter, defaultdict
+from typing import Any, Dict, List
+from django.conf import settings
+from django.db import connection
+from django.db.models import F, QuerySet
+from .models import Product, ProductVariant
+
+
+def _attributes_by_source() -> Dict[str, List[str]]:
+    """Attributi con faccette, dalla stessa whitelist dei filtri"""
+    sources = defaultdict(list)
+    for name, source in getattr(settings, 'PRODUCT_FILTERABLE_ATTRIBUTES', {}).items():
+        sources[source].append(name)
+    return sources
+
+
+def _sql_literal(value: str) -> str:
+    # '%' raddoppiato: il testo passa per la formattazione dei parametri del driver
+    return "'" + value.replace("'", "''").replace('%', '%%') + "'"
+
+
+def product_facets(queryset: QuerySet) -> Dict[str, Any]:
+    """
+    Conteggi per brand, categoria, tipo prodotto e valori degli attributi
+    filtrabili, sui prodotti del queryset già filtrato.
+
+    Su PostgreSQL sono due query: una GROUPING SETS sui prodotti e una
+    jsonb_each_text sulle varianti. Altrove i conteggi si fanno in Python.
+    """
+    attributes = _attributes_by_source()
+    base = queryset.order_by().prefetch_related(None).annotate(
+        f_brand_slug=F('brand__slug'),
+        f_brand_name=F('brand__name'),
+        f_category_slug=F('category__slug'),
+        f_category_name=F('category__name'),
+    )
+
+    if connection.vendor == 'postgresql':
+        counts = _grouped_counts(base, attributes['specifications'])
+        variant_counts = _variant_counts(base, attributes['variant'])
+    else:
+        counts = _python_counts(base, attributes['specifications'])
+        variant_counts = _python_variant_counts(base, attributes['variant'])
+
+    type_labels = dict(Product.PRODUCT_TYPES)
+    facets = {
+        'brands': [
+            {'slug': slug, 'name': name, 'count': count}
+            for (slug, name), count in counts['brand'].most_common()
+        ],
+        'categories': [
+            {'slug': slug, 'name': name, 'count': count}
+            for (slug, name), count in counts['category'].most_common()
+        ],
+        'product_types': [
+            {'value': value, 'label': type_labels.get(value, value), 'count': count}
+            for value, count in counts['product_type'].most_common()
+        ],
+        'attributes': {},
+    }
+    for name in attributes['specifications']:
+        facets['attributes'][name] = [
+            {'value': value, 'count': count} for value, count in counts[name].most_common()
+        ]
+    for name in attributes['variant']:
+        facets['attributes'][name] = [
+            {'value': value, 'count': count} for value, count in variant_counts[name].most_common()
+        ]
+    return facets
+
+
+def _grouped_counts(base: QuerySet, spec_attributes: List[str]) -> Dict[str, Counter]:
+    inner_sql, params = base.values(
+        'f_brand_slug', 'f_brand_name', 'f_category_slug', 'f_category_name',
+        'product_type', 'specifications',
+    ).query.sql_with_params()
+
+    # I nomi degli attributi vengono dalla whitelist in settings: letterali
+    # nel testo, così SELECT e GROUPING SETS contengono la stessa espressione
+    spec_columns = [f"(p.specifications ->> {_sql_literal(name)})" for name in spec_attributes]
+    select = ', '.join([
+        'p.f_brand_slug', 'p.f_brand_name', 'p.f_category_slug', 'p.f_category_name', 'p.product_type',
+        *spec_columns, 'COUNT(*)',
+    ])
+    grouping_sets = ', '.join([
+        '(p.f_brand_slug, p.f_brand_name)',
+        '(p.f_category_slug, p.f_category_name)',
+        '(p.product_type)',
+        *[f'({column})' for column in spec_columns],
+    ])
+    sql = f'SELECT {select} FROM ({inner_sql}) p GROUP BY GROUPING SETS ({grouping_sets})'
+
+    counts = defaultdict(Counter)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        for row in cursor.fetchall():
+            brand_slug, brand_name, category_slug, category_name, product_type = row[:5]
+            count = row[-1]
+            # In ogni riga è valorizzato solo l'insieme di raggruppamento corrente;
+            # le righe con valore NULL (attributo assente) non sono faccette
+            if brand_slug is not None:
+                counts['brand'][(brand_slug, brand_name)] += count
+            elif category_slug is not None:
+                counts['category'][(category_slug, category_name)] += count
+            elif product_type is not None:
+                counts['product_type'][product_type] += count
+            else:
+                for name, value in zip(spec_attributes, row[5:-1]):
+                    if value is not None:
+                        counts[name][value] += count
+    return counts
+
+
+def _variant_counts(base: QuerySet, variant_attributes: List[str]) -> Dict[str, Counter]:
+    counts = defaultdict(Counter)
+    if not variant_attributes:
+        return counts
+
+    product_sql, params = base.values('pk').query.sql_with_params()
+    keys = ', '.join(_sql_literal(name) for name in variant_attributes)
+    sql = (
+        f'SELECT kv.key, kv.value, COUNT(DISTINCT v.product_id) '
+        f'FROM {ProductVariant._meta.db_table} v '
+        f'CROSS JOIN LATERAL jsonb_each_text(v.attributes) kv '
+        f'WHERE v.is_active AND v.product_id IN ({product_sql}) AND kv.key IN ({keys}) '
+        f'GROUP BY kv.key, kv.value'
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        for key, value, count in cursor.fetchall():
+            if value is not None:
+                counts[key][value] = count
+    return counts
+
+
+def _python_counts(base: QuerySet, spec_attributes: List[str]) -> Dict[str, Counter]:
+    counts = defaultdict(Counter)
+    rows = base.values_list(
+        'f_brand_slug', 'f_brand_name', 'f_category_slug', 'f_category_name',
+        'product_type', 'specifications',
+    )
+    for brand_slug, brand_name, category_slug, category_name, product_type, specifications in rows.iterator():
+        counts['brand'][(brand_slug, brand_name)] += 1
+        counts['category'][(category_slug, category_name)] += 1
+        counts['product_type'][product_type] += 1
+        for name in spec_attributes:
+            value = (specifications or {}).get(name)
+            if value is not None:
+                counts[name][str(value)] += 1
+    return counts
+
+
+def _python_variant_counts(base: QuerySet, variant_attributes: List[str]) -> Dict[str, Counter]:
+    counts = defaultdict(Counter)
+    if not variant_attributes:
+        return counts
+
+    products_by_value = defaultdict(set)
+    variants = ProductVariant.objects.filter(
+        is_active=True, product__in=base.values('pk')
+    ).values_list('product_id', 'attributes')
+    for product_id, values in variants.iterator():
+        for name in variant_attributes:
+            value = (values or {}).get(name)
+            if value is not None:
+                products_by_value[(name, str(value))].add(product_id)
+
+    for (name, value), products in products_by_value.items():
+        counts[name][value] = len(products)
+    return counts
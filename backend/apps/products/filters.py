@@ -0,0 +1,89 @@
+from functools import reduce
+from operator import or_
+from typing import Dict, List
+from django.conf import settings
+from django.db.models import Exists, OuterRef, Q
+from rest_framework import filters
+from .models import ProductVariant
+from .search import search_enabled, search_products
+
+ATTRIBUTE_PARAM_PREFIX = 'optical_'
+
+
+class ProductSearchFilter(filters.SearchFilter):
+    """
+    ?search= con full-text PostgreSQL ordinato per rilevanza (apps.products.search).
+
+    Va dopo OrderingFilter: senza ?ordering esplicito i risultati restano
+    ordinati per rank. Su database diversi da PostgreSQL usa il SearchFilter
+    standard (ILIKE su search_fields).
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '').strip()
+        if not query:
+            return queryset
+        if not search_enabled():
+            return super().filter_queryset(request, queryset, view)
+
+        ordering = queryset.query.order_by
+        results = search_products(queryset, query)
+        if request.query_params.get(filters.OrderingFilter.ordering_param):
+            results = results.order_by(*ordering)
+        return results
+
+
+def requested_attributes(query_params) -> Dict[str, Dict[str, List[str]]]:
+    """
+    ?optical_<attributo>=v1,v2 raggruppati per sorgente ('specifications' o
+    'variant'). Gli attributi fuori da settings.PRODUCT_FILTERABLE_ATTRIBUTES
+    vengono ignorati.
+    """
+    whitelist = getattr(settings, 'PRODUCT_FILTERABLE_ATTRIBUTES', {})
+    requested = {}
+    for key in query_params:
+        if not key.startswith(ATTRIBUTE_PARAM_PREFIX):
+            continue
+        name = key[len(ATTRIBUTE_PARAM_PREFIX):]
+        source = whitelist.get(name)
+        values = [value.strip() for raw in query_params.getlist(key) for value in raw.split(',') if value.strip()]
+        if source and values:
+            requested.setdefault(source, {})[name] = sorted(set(values))
+    return requested
+
+
+def containment_condition(field: str, attributes: Dict[str, List[str]]) -> Q:
+    """
+    Condizione @> sul campo JSON: i valori singoli in un unico contenimento,
+    gli attributi multi-valore come OR di contenimenti. Tutto usa l'indice
+    GIN jsonb_path_ops.
+    """
+    single = {name: values[0] for name, values in attributes.items() if len(values) == 1}
+    condition = Q(**{f'{field}__contains': single}) if single else Q()
+    for name, values in attributes.items():
+        if len(values) > 1:
+            condition &= reduce(or_, (Q(**{f'{field}__contains': {name: value}}) for value in values))
+    return condition
+
+
+class AttributeFilter(filters.BaseFilterBackend):
+    """
+    Filtri su Product.specifications e ProductVariant.attributes compilati in
+    una sola query: contenimento JSON sul prodotto e un EXISTS sulle varianti
+    attive (la stessa variante deve soddisfare tutti gli attributi di variante).
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        requested = requested_attributes(request.query_params)
+
+        if requested.get('specifications'):
+            queryset = queryset.filter(containment_condition('specifications', requested['specifications']))
+
+        if requested.get('variant'):
+            variants = ProductVariant.objects.filter(
+                product=OuterRef('pk'),
+                is_active=True,
+            ).filter(containment_condition('attributes', requested['variant']))
+            queryset = queryset.filter(Exists(variants))
+
+        return queryset
@@ -0,0 +1,124 @@
+import time
+import random
+import statistics
+from decimal import Decimal
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Q
+from apps.products.models import Category, Brand, Product
+from apps.products.search import refresh_search_vectors, search_enabled, search_products
+
+BRANDS = ['Ray-Ban', 'Oakley', 'Persol', 'Prada', 'Gucci', 'Vogue', 'Carrera', 'Police', 'Armani', 'Tom Ford']
+MODELS = ['Aviator', 'Wayfarer', 'Clubmaster', 'Round', 'Cat Eye', 'Pilot', 'Rettangolare', 'Ovale', 'Sportivo', 'Classico']
+MATERIALS = ['acetato', 'metallo', 'titanio', 'nylon', 'legno', 'carbonio']
+COLORS = ['nero', 'tartaruga', 'oro', 'argento', 'blu', 'rosso', 'trasparente', 'verde']
+LENSES = ['polarizzate', 'fotocromatiche', 'progressive', 'antiriflesso', 'specchiate', 'filtro luce blu']
+
+QUERIES = ['aviator', 'occhiali polarizzati', 'ray-ban nero', 'titanio progressive', 'montatura tartaruga']
+TYPO_QUERIES = ['aviatr', 'wayfarrer', 'okley']
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Benchmark ricerca prodotti: ILIKE (SearchFilter) contro full-text + trigram su catalogo generato'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--products',
+            type=int,
+            default=100000,
+            help='Prodotti generati (default 100000)',
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=20,
+            help='Esecuzioni per query (default 20)',
+        )
+        parser.add_argument(
+            '--keep',
+            action='store_true',
+            help='Mantiene il catalogo generato invece di annullare la transazione',
+        )
+
+    def handle(self, *args, **options):
+        if not search_enabled():
+            raise CommandError('Il benchmark richiede PostgreSQL con pg_trgm (manage.py setup_search)')
+
+        try:
+            with transaction.atomic():
+                self.generate(options['products'])
+                self.run(options['repeat'])
+                if not options['keep']:
+                    raise _Rollback
+        except _Rollback:
+            self.stdout.write('Catalogo generato rimosso (rollback)')
+
+    def generate(self, count):
+        self.stdout.write(f'Generazione di {count} prodotti...')
+        started = time.perf_counter()
+        rng = random.Random(42)
+
+        category, _ = Category.objects.get_or_create(slug='benchmark', defaults={'name': 'Benchmark'})
+        brands = [
+            Brand.objects.get_or_create(slug=f'benchmark-{name.lower()}', defaults={'name': name})[0]
+            for name in BRANDS
+        ]
+
+        batch = []
+        for i in range(count):
+            brand = rng.choice(brands)
+            name = f'{rng.choice(MODELS)} {rng.choice(COLORS)} {i}'
+            batch.append(Product(
+                sku=f'BENCH{i:07d}',
+                name=name,
+                slug=f'benchmark-{i}',
+                description=(
+                    f'Occhiali {brand.name} modello {name}, montatura in {rng.choice(MATERIALS)} '
+                    f'con lenti {rng.choice(LENSES)}.'
+                ),
+                category=category,
+                brand=brand,
+                product_type=rng.choice(['glasses', 'sunglasses']),
+                price=Decimal(rng.randint(5000, 40000)) / 100,
+            ))
+            if len(batch) == 5000:
+                Product.objects.bulk_create(batch)
+                batch = []
+        Product.objects.bulk_create(batch)
+
+        refresh_search_vectors(Product.objects.filter(category=category))
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE products')
+        self.stdout.write(f'Catalogo pronto in {time.perf_counter() - started:.1f}s')
+
+    def run(self, repeat):
+        queryset = Product.objects.filter(is_active=True)
+
+        for query in QUERIES + TYPO_QUERIES:
+            # Equivalente del SearchFilter DRF: ogni termine in ILIKE su tutti i campi
+            filtered = queryset
+            for term in query.split():
+                filtered = filtered.filter(
+                    Q(name__icontains=term) | Q(description__icontains=term)
+                    | Q(sku__icontains=term) | Q(brand__name__icontains=term)
+                )
+            baseline = self.measure(lambda: list(filtered.order_by('-created_at')[:20]), repeat)
+            fulltext = self.measure(lambda: list(search_products(queryset, query)[:20]), repeat)
+            hits = len(list(search_products(queryset, query)[:20]))
+
+            self.stdout.write(
+                f'{query!r:>26}: ILIKE {baseline:8.2f} ms | full-text {fulltext:8.2f} ms (mediane) '
+                f'({hits} risultati in prima pagina)'
+            )
+
+    def measure(self, fn, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            fn()
+            timings.append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings)
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from apps.products.models import Product
+from apps.products.search import refresh_search_vectors, search_enabled
+
+class Command(BaseCommand):
+    help = 'Installa pg_trgm e ricalcola i documenti full-text dei prodotti'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='Prodotti aggiornati per UPDATE (default 5000)',
+        )
+        parser.add_argument(
+            '--extension-only',
+            action='store_true',
+            help='Crea solo l\'estensione (da eseguire prima di migrate)',
+        )
+
+    def handle(self, *args, **options):
+        if not search_enabled():
+            raise CommandError('La ricerca full-text richiede PostgreSQL')
+
+        with connection.cursor() as cursor:
+            cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        self.stdout.write('Estensione pg_trgm disponibile')
+
+        if options['extension_only']:
+            return
+
+        batch_size = options['batch_size']
+        ids = list(Product.objects.order_by('pk').values_list('pk', flat=True))
+        updated = 0
+        for start in range(0, len(ids), batch_size):
+            batch = ids[start:start + batch_size]
+            updated += refresh_search_vectors(Product.objects.filter(pk__in=batch))
+
+        self.stdout.write(self.style.SUCCESS(f'Documenti full-text aggiornati: {updated}'))
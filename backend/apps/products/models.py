@@ -1,5 +1,7 @@
 # backend/apps/products/models.py
 from django.db import models
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from apps.common.models import TimeStampedModel
 
 
@@ -83,6 +85,12 @@ class Product(TimeStampedModel):
     # Weight per spedizioni
     weight = models.DecimalField(max_digits=6, decimal_places=2, null=True, blank=True)
 
+    # Hash del payload del gestionale, per saltare le righe invariate in sync
+    source_hash = models.CharField(max_length=64, blank=True, editable=False)
+
+    # Documento full-text (nome > brand > descrizione), mantenuto da apps.products.search
+    search_vector = SearchVectorField(null=True, editable=False)
+
     class Meta:
         db_table = 'products'
         ordering = ['-created_at']
@@ -90,6 +98,12 @@ class Product(TimeStampedModel):
             models.Index(fields=['sku']),
             models.Index(fields=['category', 'brand']),
             models.Index(fields=['is_active']),
+            models.Index(fields=['created_at', 'id'], name='products_keyset_idx'),
+            GinIndex(fields=['search_vector'], name='products_search_vector_gin'),
+            # Filtri per attributi (specifications @> {...}): apps.products.filters
+            GinIndex(fields=['specifications'], name='products_specs_gin', opclasses=['jsonb_path_ops']),
+            # Richiede l'estensione pg_trgm (manage.py setup_search)
+            GinIndex(fields=['name'], name='products_name_trgm', opclasses=['gin_trgm_ops']),
         ]
 
     def __str__(self):
@@ -134,6 +148,9 @@ class ProductVariant(TimeStampedModel):
 
     class Meta:
         db_table = 'product_variants'
+        indexes = [
+            GinIndex(fields=['attributes'], name='variants_attributes_gin', opclasses=['jsonb_path_ops']),
+        ]
 
     def __str__(self):
         return f"{self.product.name} - {self.name}"
\ No newline at end of file
@@ -0,0 +1,59 @@
+from typing import Optional
+from django.db import connection
+from django.db.models import F, OuterRef, Q, Subquery, QuerySet
+from django.db.models.functions import Greatest
+from django.contrib.postgres.search import (
+    SearchQuery, SearchRank, SearchVector, TrigramSimilarity,
+)
+from .models import Brand, Product
+
+SEARCH_CONFIG = 'italian'
+
+
+def search_enabled() -> bool:
+    """Full-text e trigram sono disponibili solo su PostgreSQL"""
+    return connection.vendor == 'postgresql'
+
+
+def search_vector_expression() -> SearchVector:
+    """Documento pesato: nome (A) > brand (B) > descrizioni (C), config italiana"""
+    brand_name = Subquery(Brand.objects.filter(pk=OuterRef('brand_id')).order_by().values('name')[:1])
+    return (
+        SearchVector('name', 'sku', weight='A', config=SEARCH_CONFIG)
+        + SearchVector(brand_name, weight='B', config=SEARCH_CONFIG)
+        + SearchVector('short_description', 'description', weight='C', config=SEARCH_CONFIG)
+    )
+
+
+def refresh_search_vectors(queryset: Optional[QuerySet] = None) -> int:
+    """Ricalcola search_vector con un solo UPDATE (nessun segnale inviato)"""
+    if not search_enabled():
+        return 0
+    queryset = Product.objects.all() if queryset is None else queryset
+    return queryset.order_by().update(search_vector=search_vector_expression())
+
+
+def search_products(queryset: QuerySet, query: str, fallback: bool = True) -> QuerySet:
+    """
+    Prodotti che corrispondono a `query`, ordinati per rilevanza.
+
+    Prima la ricerca full-text sull'indice GIN (sintassi websearch: frasi tra
+    virgolette, -esclusioni); se non trova nulla, similarità trigram su nome e
+    brand per tollerare errori di battitura. Il fallback usa l'operatore %
+    (soglia pg_trgm.similarity_threshold) così l'indice trigram sul nome resta
+    utilizzabile.
+    """
+    search_query = SearchQuery(query, config=SEARCH_CONFIG, search_type='websearch')
+    results = queryset.filter(search_vector=search_query).annotate(
+        rank=SearchRank(F('search_vector'), search_query)
+    ).order_by('-rank', '-created_at')
+
+    if not fallback or results.exists():
+        return results
+
+    similar_brands = Brand.objects.filter(name__trigram_similar=query).values('pk')
+    return queryset.filter(
+        Q(name__trigram_similar=query) | Q(brand_id__in=similar_brands)
+    ).annotate(
+        rank=Greatest(TrigramSimilarity('name', query), TrigramSimilarity('brand__name', query))
+    ).order_by('-rank', '-created_at')
@@ -1,6 +1,9 @@
+from typing import Dict, Optional
+from django.db.models.manager import BaseManager
 from rest_framework import serializers
 from .models import Category, Brand, Product, ProductImage, ProductVariant
-from apps.inventory.models import StoreInventory
+from apps.inventory.availability import availability_for_products
+from apps.inventory.pricing import effective_prices, list_price, resolve_price
 
 class CategorySerializer(serializers.ModelSerializer):
     class Meta:
@@ -22,66 +25,107 @@ class ProductVariantSerializer(serializers.ModelSerializer):
         model = ProductVariant
         fields = ['id', 'sku', 'name', 'attributes', 'price_adjustment', 'image', 'is_active']
 
-class ProductListSerializer(serializers.ModelSerializer):
+def requested_store_id(context) -> Optional[int]:
+    """Store richiesto con ?store_id=, None se assente o non valido"""
+    request = context.get('request')
+    store_id = request.query_params.get('store_id') if request else None
+    try:
+        return int(store_id) if store_id else None
+    except ValueError:
+        return None
+
+class ProductBatchListSerializer(serializers.ListSerializer):
+    """
+    Calcola per tutta la pagina, con una query ciascuno, i dati per prodotto
+    richiesti dai figli (prezzi effettivi, disponibilità) e li passa nel context.
+    """
+
+    def to_representation(self, data):
+        items = list(data.all() if isinstance(data, BaseManager) else data)
+        product_ids = [item.pk for item in items]
+        store_id = requested_store_id(self.context)
+        fields = self.child.fields
+        
+        if 'effective_price' in fields or 'availability' in fields:
+            prices = dict.fromkeys(product_ids)
+            prices.update(effective_prices(product_ids, store_id))
+            self.context.setdefault('prices', {}).update(prices)
+        if 'availability' in fields or 'in_stock' in fields:
+            self.context.setdefault('availability', {}).update(availability_for_products(product_ids, store_id))
+        return super().to_representation(items)
+
+class ProductBatchMixin:
+    """Prezzi e disponibilità dal context; un prodotto serializzato da solo li calcola al volo"""
+
+    def product_price(self, obj) -> Dict:
+        prices = self.context.setdefault('prices', {})
+        if obj.pk not in prices:
+            prices.update(effective_prices([obj.pk], requested_store_id(self.context)))
+        # Prodotto non ancora nella tabella precalcolata (None: già cercato)
+        return prices.get(obj.pk) or {'price': resolve_price(obj), 'list_price': list_price(obj)}
+
+    def product_availability(self, obj) -> Dict:
+        store_id = requested_store_id(self.context)
+        availability = self.context.setdefault('availability', {})
+        if obj.pk not in availability:
+            availability.update(availability_for_products([obj.pk], store_id))
+        
+        data = dict(availability[obj.pk])
+        if store_id and data['available']:
+            data['store_price'] = self.product_price(obj)['price']
+        return data
+
+    def get_effective_price(self, obj):
+        return self.product_price(obj)
+
+class ProductListSerializer(ProductBatchMixin, serializers.ModelSerializer):
     """Serializer per lista prodotti (ottimizzato)"""
     category = CategorySerializer(read_only=True)
     brand = BrandSerializer(read_only=True)
     main_image = serializers.ImageField(read_only=True)
+    effective_price = serializers.SerializerMethodField()
     
     class Meta:
         model = Product
         fields = [
             'id', 'sku', 'name', 'slug', 'short_description', 
-            'category', 'brand', 'base_price', 'main_image', 'is_active'
+            'category', 'brand', 'price', 'effective_price', 'main_image', 'is_active'
         ]
+        list_serializer_class = ProductBatchListSerializer
 
-class ProductDetailSerializer(serializers.ModelSerializer):
+class ProductListAvailabilitySerializer(ProductListSerializer):
+    """Lista prodotti con badge di disponibilità (una query per pagina)"""
+    in_stock = serializers.SerializerMethodField()
+    availability = serializers.SerializerMethodField()
+    
+    class Meta(ProductListSerializer.Meta):
+        fields = ProductListSerializer.Meta.fields + ['in_stock', 'availability']
+    
+    def get_in_stock(self, obj):
+        return self.product_availability(obj)['available']
+    
+    def get_availability(self, obj):
+        return self.product_availability(obj)
+
+class ProductDetailSerializer(ProductBatchMixin, serializers.ModelSerializer):
     """Serializer per dettaglio prodotto completo"""
     category = CategorySerializer(read_only=True)
     brand = BrandSerializer(read_only=True)
     images = ProductImageSerializer(many=True, read_only=True)
     variants = ProductVariantSerializer(many=True, read_only=True)
+    effective_price = serializers.SerializerMethodField()
     availability = serializers.SerializerMethodField()
     
     class Meta:
         model = Product
         fields = [
             'id', 'sku', 'name', 'slug', 'description', 'short_description',
-            'category', 'brand', 'base_price', 'optical_attributes',
+            'category', 'brand', 'product_type', 'price', 'sale_price', 'effective_price', 'specifications',
             'main_image', 'images', 'variants', 'meta_title', 'meta_description',
-            'is_active', 'is_prescription_required', 'requires_measurement',
-            'weight', 'dimensions', 'availability', 'created_at'
+            'is_active', 'weight', 'availability', 'created_at'
         ]
+        list_serializer_class = ProductBatchListSerializer
     
     def get_availability(self, obj):
-        """Ritorna disponibilità per store"""
-        request = self.context.get('request')
-        store_id = request.query_params.get('store_id') if request else None
-        
-        if store_id:
-            try:
-                inventory = StoreInventory.objects.get(
-                    store_id=store_id, 
-                    product=obj, 
-                    is_online_available=True
-                )
-                return {
-                    'available': inventory.available_quantity > 0,
-                    'quantity': inventory.available_quantity,
-                    'store_price': inventory.store_price or obj.base_price
-                }
-            except StoreInventory.DoesNotExist:
-                return {'available': False, 'quantity': 0}
-        
-        # Ritorna disponibilità totale se nessun store specificato
-        total_quantity = StoreInventory.objects.filter(
-            product=obj, 
-            is_online_available=True
-        ).aggregate(
-            total=models.Sum('quantity')
-        )['total'] or 0
-        
-        return {
-            'available': total_quantity > 0,
-            'total_quantity': total_quantity
-        }
\ No newline at end of file
+        """Ritorna disponibilità per store (o totale se nessuno store specificato)"""
+        return self.product_availability(obj)
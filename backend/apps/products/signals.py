@@ -0,0 +1,90 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from apps.common.cache import bump_model_versions
+from apps.inventory.models import StoreInventory
+from apps.inventory.pricing import refresh_effective_prices, refresh_inventory_price
+from .models import Category, Brand, Product, ProductImage, ProductVariant
+from .search import refresh_search_vectors
+from .autocomplete import autocomplete_index, brand_document, product_document
+
+# Modelli da cui dipendono le risposte in cache degli endpoint prodotti
+CACHED_MODELS = (Category, Brand, Product, ProductImage, ProductVariant, StoreInventory)
+
+
+def bump_cache_version(sender, **kwargs):
+    """Invalida le risposte in cache dopo il commit della modifica"""
+    label = sender._meta.label_lower
+    transaction.on_commit(lambda: bump_model_versions(label))
+
+
+for model in CACHED_MODELS:
+    post_save.connect(bump_cache_version, sender=model, dispatch_uid=f'cache-version-save-{model.__name__}')
+    post_delete.connect(bump_cache_version, sender=model, dispatch_uid=f'cache-version-delete-{model.__name__}')
+
+
+def refresh_product_search_vector(sender, instance, **kwargs):
+    """Aggiorna il documento full-text del prodotto salvato"""
+    refresh_search_vectors(Product.objects.filter(pk=instance.pk))
+
+
+def refresh_brand_search_vectors(sender, instance, **kwargs):
+    """Il nome del brand fa parte del documento di tutti i suoi prodotti"""
+    refresh_search_vectors(Product.objects.filter(brand_id=instance.pk))
+
+
+post_save.connect(refresh_product_search_vector, sender=Product, dispatch_uid='search-vector-product')
+post_save.connect(refresh_brand_search_vectors, sender=Brand, dispatch_uid='search-vector-brand')
+
+
+def index_product_suggestions(sender, instance, **kwargs):
+    def update():
+        if instance.is_active:
+            autocomplete_index.index_documents([product_document(instance)])
+        else:
+            autocomplete_index.remove([f'product:{instance.pk}'])
+    transaction.on_commit(update)
+
+
+def index_brand_suggestions(sender, instance, **kwargs):
+    """Il brand compare anche come sottotitolo dei suoi prodotti"""
+    def update():
+        if not instance.is_active:
+            autocomplete_index.remove([f'brand:{instance.pk}'])
+            return
+        products = Product.objects.filter(brand=instance, is_active=True).select_related('brand')
+        autocomplete_index.index_documents(
+            [brand_document(instance)] + [product_document(product) for product in products]
+        )
+    transaction.on_commit(update)
+
+
+def remove_suggestions(sender, instance, **kwargs):
+    doc_id = f'{sender._meta.model_name}:{instance.pk}'
+    transaction.on_commit(lambda: autocomplete_index.remove([doc_id]))
+
+
+post_save.connect(index_product_suggestions, sender=Product, dispatch_uid='autocomplete-product')
+post_save.connect(index_brand_suggestions, sender=Brand, dispatch_uid='autocomplete-brand')
+post_delete.connect(remove_suggestions, sender=Product, dispatch_uid='autocomplete-product-delete')
+post_delete.connect(remove_suggestions, sender=Brand, dispatch_uid='autocomplete-brand-delete')
+
+
+def refresh_effective_prices_for(sender, instance, **kwargs):
+    """
+    Prezzi, saldi, maggiorazioni variante e prezzi store alimentano i prezzi
+    effettivi: ricalcolati nella stessa transazione della modifica, prima che
+    la versione in cache venga incrementata. Il salvataggio di una riga di
+    inventario ricalcola solo la sua riga. Nessun ricalcolo sulle
+    eliminazioni: le righe di prezzo di varianti e inventario eliminati
+    spariscono in cascata, e durante l'eliminazione di un prodotto verrebbero
+    reinserite per un prodotto che sta per non esistere più.
+    """
+    if sender is StoreInventory:
+        refresh_inventory_price(instance)
+        return
+    product_id = instance.pk if sender is Product else instance.product_id
+    refresh_effective_prices([product_id])
+
+
+for model in (Product, ProductVariant, StoreInventory):
+    post_save.connect(refresh_effective_prices_for, sender=model, dispatch_uid=f'effective-price-save-{model.__name__}')
@@ -0,0 +1,12 @@
+from celery import shared_task
+from celery.utils.log import get_task_logger
+from .autocomplete import autocomplete_index
+
+logger = get_task_logger(__name__)
+
+@shared_task
+def rebuild_autocomplete_index_task():
+    """Ricostruisce l'indice dei suggerimenti di ricerca"""
+    count = autocomplete_index.rebuild()
+    logger.info(f"Indice autocomplete: {count} documenti")
+    return count
@@ -1,33 +1,61 @@
+import time
 from rest_framework import viewsets, filters, permissions, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
-from django.db.models import Q, Prefetch
+from django.db.models import Prefetch
+from apps.common.cache import app_cache, model_versions
+from apps.common.mixins import ConditionalGetMixin, VersionedCacheMixin
+from apps.common.pagination import KeysetPagination
+from apps.common.utils import payload_hash
 from .models import Category, Brand, Product
-from .serializers import CategorySerializer, BrandSerializer, ProductListSerializer, ProductDetailSerializer
+from .filters import AttributeFilter, ProductSearchFilter
+from .facets import product_facets
+from .autocomplete import (
+    autocomplete_index, database_suggestions, normalize, schedule_autocomplete_rebuild,
+    SUGGESTIONS_CACHE_TIMEOUT,
+)
+from .serializers import (
+    CategorySerializer, BrandSerializer, ProductListSerializer, ProductListAvailabilitySerializer,
+    ProductDetailSerializer,
+)
+from apps.inventory.availability import AVAILABILITY_CACHE_TIMEOUT
 
-class CategoryViewSet(viewsets.ReadOnlyModelViewSet):
+class CategoryViewSet(ConditionalGetMixin, VersionedCacheMixin, viewsets.ReadOnlyModelViewSet):
     """ViewSet per categorie prodotti"""
+    cache_models = ['products.category']
     queryset = Category.objects.filter(is_active=True).order_by('sort_order', 'name')
     serializer_class = CategorySerializer
     permission_classes = [permissions.AllowAny]
     lookup_field = 'slug'
 
-class BrandViewSet(viewsets.ReadOnlyModelViewSet):
+class BrandViewSet(ConditionalGetMixin, VersionedCacheMixin, viewsets.ReadOnlyModelViewSet):
     """ViewSet per brands"""
+    cache_models = ['products.brand']
     queryset = Brand.objects.filter(is_active=True).order_by('name')
     serializer_class = BrandSerializer
     permission_classes = [permissions.AllowAny]
     lookup_field = 'slug'
 
-class ProductViewSet(viewsets.ReadOnlyModelViewSet):
+class ProductPagination(KeysetPagination):
+    """Pagine numerate di default; keyset con ?pagination=cursor (scroll infinito)"""
+    opt_in = True
+
+class ProductViewSet(ConditionalGetMixin, VersionedCacheMixin, viewsets.ReadOnlyModelViewSet):
     """ViewSet per prodotti con ricerca avanzata"""
+    cache_models = [
+        'products.product', 'products.category', 'products.brand',
+        'products.productvariant', 'products.productimage',
+    ]
+    cache_actions = ['list', 'retrieve', 'featured', 'facets']
+    conditional_actions = ['list', 'retrieve', 'featured', 'facets']
     permission_classes = [permissions.AllowAny]
     lookup_field = 'slug'
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
-    filterset_fields = ['category__slug', 'brand__slug', 'is_prescription_required']
+    pagination_class = ProductPagination
+    filter_backends = [DjangoFilterBackend, AttributeFilter, filters.OrderingFilter, ProductSearchFilter]
+    filterset_fields = ['category__slug', 'brand__slug', 'product_type']
     search_fields = ['name', 'description', 'sku', 'brand__name']
-    ordering_fields = ['name', 'base_price', 'created_at']
+    ordering_fields = ['name', 'price', 'created_at']
     ordering = ['-created_at']
 
     def get_queryset(self):
@@ -37,65 +65,79 @@ class ProductViewSet(viewsets.ReadOnlyModelViewSet):
             'images', 'variants'
         )
         
-        # Filtro per attributi ottici
-        optical_filters = self.request.query_params.dict()
-        for key, value in optical_filters.items():
-            if key.startswith('optical_'):
-                attr_name = key.replace('optical_', '')
-                queryset = queryset.filter(
-                    optical_attributes__contains={attr_name: value}
-                )
-        
         return queryset
 
+    def includes_availability(self) -> bool:
+        """Il dettaglio riporta sempre la disponibilità; la lista con ?store_id= o ?availability=1"""
+        if self.action == 'retrieve':
+            return True
+        params = self.request.query_params
+        return self.action == 'list' and bool(params.get('store_id') or params.get('availability'))
+
+    def get_cache_models(self):
+        # La disponibilità dipende anche dall'inventario
+        if self.includes_availability():
+            return [*self.cache_models, 'inventory.storeinventory']
+        return self.cache_models
+
+    def get_cache_timeout(self):
+        # La disponibilità ha una cache propria a scadenza breve: la risposta non la trattiene oltre
+        if self.includes_availability():
+            return AVAILABILITY_CACHE_TIMEOUT
+        return self.cache_timeout
+
+    def get_validators(self, request):
+        # Le prenotazioni non incrementano la versione dell'inventario: con la
+        # disponibilità l'ETag si rinnova a ogni finestra della sua cache
+        etag, last_modified = super().get_validators(request)
+        if self.includes_availability():
+            etag = payload_hash({'etag': etag, 'window': int(time.time()) // AVAILABILITY_CACHE_TIMEOUT})
+        return etag, last_modified
+
     def get_serializer_class(self):
         if self.action == 'retrieve':
             return ProductDetailSerializer
+        if self.includes_availability():
+            return ProductListAvailabilitySerializer
         return ProductListSerializer
 
     @action(detail=False, methods=['get'])
     def featured(self, request):
         """Prodotti in evidenza"""
-        featured_products = self.get_queryset()[:8]
-        serializer = ProductListSerializer(featured_products, many=True, context={'request': request})
-        return Response(serializer.data)
+        def build_response():
+            featured_products = self.get_queryset()[:8]
+            serializer = ProductListSerializer(featured_products, many=True, context={'request': request})
+            return Response(serializer.data)
+        
+        return self.conditional_get(request, lambda: self.cached_response(request, build_response))
+
+    @action(detail=False, methods=['get'])
+    def facets(self, request):
+        """Conteggi per brand, categoria, tipo e attributi sui filtri correnti"""
+        def build_response():
+            queryset = self.filter_queryset(self.get_queryset())
+            return Response(product_facets(queryset))
+        
+        return self.conditional_get(request, lambda: self.cached_response(request, build_response))
 
     @action(detail=False, methods=['get'])
     def search_suggestions(self, request):
-        """Suggerimenti per ricerca"""
+        """Suggerimenti per ricerca (indice di prefissi, database con indice freddo)"""
         query = request.query_params.get('q', '').strip()
         if len(query) < 2:
             return Response([])
         
-        suggestions = []
-        
-        # Prodotti
-        products = Product.objects.filter(
-            Q(name__icontains=query) | Q(sku__icontains=query),
-            is_active=True
-        ).select_related('brand')[:5]
-        
-        for product in products:
-            suggestions.append({
-                'type': 'product',
-                'title': product.name,
-                'subtitle': product.brand.name,
-                'url': f'/prodotti/{product.slug}',
-                'image': product.main_image.url if product.main_image else None
-            })
-        
-        # Brands
-        brands = Brand.objects.filter(
-            name__icontains=query,
-            is_active=True
-        )[:3]
+        # Query recenti: la chiave cambia con le versioni di prodotti e brand
+        versions = model_versions('products.product', 'products.brand')
+        cache_key = f"suggest:{payload_hash([normalize(query), versions])}"
+        suggestions = app_cache('products').get(cache_key)
+        if suggestions is not None:
+            return Response(suggestions)
         
-        for brand in brands:
-            suggestions.append({
-                'type': 'brand',
-                'title': brand.name,
-                'url': f'/prodotti?brand={brand.slug}',
-                'image': brand.logo.url if brand.logo else None
-            })
+        suggestions = autocomplete_index.suggest(query)
+        if suggestions is None:
+            suggestions = database_suggestions(query)
+            schedule_autocomplete_rebuild()
         
-        return Response(suggestions)
\ No newline at end of file
+        app_cache('products').set(cache_key, suggestions, SUGGESTIONS_CACHE_TIMEOUT)
+        return Response(suggestions)
@@ -6,6 +6,7 @@ router = DefaultRouter()
 router.register('', views.StoreViewSet, basename='stores')
 
 urlpatterns = [
-    path('', include(router.urls)),
+    # Prima del router: altrimenti 'map-data' viene letto come pk del dettaglio
     path('map-data/', views.stores_map_data, name='stores-map-data'),
+    path('', include(router.urls)),
 ]
\ No newline at end of file
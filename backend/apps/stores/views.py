@@ -1,11 +1,12 @@
 from rest_framework import viewsets
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
+from apps.common.mixins import ConditionalGetMixin, conditional_response, queryset_validators
 from .models import Store
 from .serializers import StoreSerializer
 
 
-class StoreViewSet(viewsets.ReadOnlyModelViewSet):
+class StoreViewSet(ConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Store.objects.filter(is_active=True)
     serializer_class = StoreSerializer
 
@@ -17,12 +18,17 @@ def stores_map_data(request):
         latitude__isnull=False,
         longitude__isnull=False
     )
-    serializer = StoreSerializer(stores, many=True)
 
-    return Response({
-        'stores': serializer.data,
-        'map_config': {
-            'center': {'lat': 38.1157, 'lng': 13.3613},
-            'zoom': 12
-        }
-    })
\ No newline at end of file
+    def build_response():
+        serializer = StoreSerializer(stores, many=True)
+
+        return Response({
+            'stores': serializer.data,
+            'map_config': {
+                'center': {'lat': 38.1157, 'lng': 13.3613},
+                'zoom': 12
+            }
+        })
+
+    etag, last_modified = queryset_validators(stores, view='stores-map-data')
+    return conditional_response(request, etag, last_modified, build_response)
\ No newline at end of file
@@ -20,6 +20,24 @@ CELERY_BEAT_SCHEDULE = {
         'schedule': crontab(hour=3, minute=0),
     },
     
+    # Rilascio prenotazioni di stock scadute ogni 5 minuti
+    'release-expired-reservations': {
+        'task': 'apps.inventory.tasks.release_expired_reservations_task',
+        'schedule': crontab(minute='*/5'),
+    },
+    
+    # Partizioni del registro movimenti ogni giorno alle 2:30
+    'maintain-movement-ledger': {
+        'task': 'apps.inventory.tasks.maintain_movement_ledger_task',
+        'schedule': crontab(hour=2, minute=30),
+    },
+    
+    # Checkpoint giornaliero dello stock a mezzanotte
+    'daily-stock-snapshots': {
+        'task': 'apps.inventory.tasks.take_stock_snapshots_task',
+        'schedule': crontab(hour=0, minute=0),
+    },
+    
     # Calcolo metriche giornaliere alle 1:00
     'daily-calculate-metrics': {
         'task': 'apps.analytics.tasks.calculate_daily_metrics',
@@ -25,6 +25,7 @@ DJANGO_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
 ]
 
 JAZZMIN_SETTINGS = {
@@ -149,12 +150,15 @@ LOCAL_APPS = [
 INSTALLED_APPS = DJANGO_APPS + THIRD_PARTY_APPS + LOCAL_APPS
 
 MIDDLEWARE = [
+    'apps.common.middleware.InstrumentationMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'apps.common.middleware.RateLimitMiddleware',
+    'apps.common.middleware.QueryPatternMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -207,14 +211,30 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
-# Cache configuration (usando database cache invece di Redis per ora)
+# Cache configuration: LRU in-process davanti a Redis, fallback locmem se Redis è giù
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
-        'LOCATION': 'cache_table',
+        'BACKEND': 'apps.common.cache.TieredRedisCache',
+        'LOCATION': os.environ.get('REDIS_CACHE_URL', 'redis://redis:6379/1'),
+        'TIMEOUT': 300,
+        'OPTIONS': {
+            'max_connections': int(os.environ.get('REDIS_CACHE_MAX_CONNECTIONS', 50)),
+            'socket_connect_timeout': 0.5,
+            'socket_timeout': 0.5,
+            'LOCAL_MAX_ENTRIES': 1000,
+            'LOCAL_TIMEOUT': 5,
+            'FALLBACK_RETRY_SECONDS': 30,
+        },
     }
 }
 
+# Versione chiavi cache per app (apps.common.cache.app_cache): incrementare per invalidare
+CACHE_APP_VERSIONS = {
+    'products': 1,
+    'stores': 1,
+    'inventory': 1,
+}
+
 # Celery Configuration
 CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL', 'redis://redis:6379/0')
 CELERY_RESULT_BACKEND = os.environ.get('REDIS_URL', 'redis://redis:6379/0')
@@ -239,6 +259,73 @@ REST_FRAMEWORK = {
     ],
 }
 
+# Rate limiting API (apps.common.ratelimit): per IP, per utente e per route
+RATE_LIMITS = {
+    'default': {'limit': 100, 'window': 60},
+    'authenticated': {'limit': 300, 'window': 60},
+    'routes': [
+        {'prefix': '/api/v1/auth/login/', 'limit': 10, 'window': 60, 'per_user': False},
+        {'prefix': '/api/v1/auth/register/', 'limit': 5, 'window': 60, 'per_user': False},
+    ],
+    'whitelist': [
+        ip.strip() for ip in os.environ.get('RATE_LIMIT_WHITELIST', '').split(',') if ip.strip()
+    ],
+    # Reverse proxy da cui accettare X-Forwarded-For (es. la rete di nginx):
+    # senza, il client è sempre REMOTE_ADDR
+    'trusted_proxies': [
+        ip.strip() for ip in os.environ.get('RATE_LIMIT_TRUSTED_PROXIES', '').split(',') if ip.strip()
+    ],
+}
+
+# Attributi filtrabili nel catalogo (?optical_<nome>=valore[,valore]):
+# 'specifications' -> Product.specifications, 'variant' -> ProductVariant.attributes
+PRODUCT_FILTERABLE_ATTRIBUTES = {
+    'frame_material': 'specifications',
+    'lens_type': 'specifications',
+    'protection': 'specifications',
+    'frame_shape': 'specifications',
+    'gender': 'specifications',
+    'color': 'variant',
+    'size': 'variant',
+}
+
+# Strumentazione richieste (apps.common.middleware.InstrumentationMiddleware)
+INSTRUMENTATION = {
+    'enabled': True,
+    'server_timing': True,
+    'histogram_size': 1000,  # campioni per vista nell'istogramma in memoria
+    'slow_request_ms': 500,  # oltre questa soglia il log è WARNING
+}
+
+# Durata delle prenotazioni di stock dei checkout (apps.inventory.reservations):
+# scadute, lo sweeper periodico le rilascia
+STOCK_RESERVATION_TTL_MINUTES = 15
+# Prenotazioni degli ordini piazzati: consumate alla conferma, rilasciate
+# all'annullamento; il TTL è solo un limite di sicurezza (scadenza loggata)
+ORDER_RESERVATION_TTL_HOURS = 72
+
+# Registro movimenti inventario partizionato per mese (apps.inventory.ledger):
+# partizioni create in anticipo, staccate oltre la retention e spostate
+# nello schema di archivio (None per eliminarle)
+INVENTORY_LEDGER = {
+    'premake_months': 3,
+    'retention_months': 24,
+    'archive_schema': 'archive',
+}
+
+# Checkpoint dello stock (apps.inventory.snapshots): giornalieri per
+# daily_days, poi solo il primo del mese fino a monthly_months
+STOCK_SNAPSHOTS = {
+    'daily_days': 90,
+    'monthly_months': 24,
+}
+
+# Rilevamento N+1 in sviluppo (QueryPatternMiddleware, attivo solo con DEBUG)
+QUERY_REPEAT_THRESHOLD = 3
+
+# Report delle query peggiori a fine test (apps.common.querybudget)
+TEST_RUNNER = 'apps.common.test_runner.QueryReportTestRunner'
+
 # JWT Settings
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60),
@@ -286,5 +373,9 @@ LOGGING = {
             'handlers': ['console'],
             'level': 'INFO',
         },
+        'apps.common.middleware': {
+            'handlers': ['console'],
+            'level': 'INFO',
+        },
     },
 }
@@ -3,6 +3,7 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 from django.http import JsonResponse
+from apps.common.views import performance_stats
 
 
 def api_test(request):
@@ -30,6 +31,7 @@ urlpatterns = [
     # Test endpoints
     path('api/test/', api_test, name='api_test'),
     path('health/', health_check, name='health_check'),
+    path('api/admin/performance/', performance_stats, name='performance_stats'),
 ]
 
 # Serve static and media files in development